@@ -0,0 +1,10 @@
+from androbot.config import settings
+from androbot.main import dp, main
+
+if __name__ == "__main__":
+    if settings.workers > 1:
+        from androbot.workers import run_supervisor
+
+        run_supervisor(dp.bot)
+    else:
+        main(dp)
@@ -1,12 +1,14 @@
-import csv
 import random
-from typing import List, Optional, Tuple
+import time
+from typing import Any, Callable, List, NamedTuple, Optional, Set, Tuple, TypeVar, Union
 
 from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 from . import crud, schemas
-from .crud import get_question, is_tg_user_already_exist
-from .database import SessionLocal
+from .crud import is_tg_user_already_exist
+from .database import AsyncReplicaSessionLocal, AsyncSessionLocal, SessionLocal
 from .errors import NoNewQuestionsException, UserExistsException, UserNotExistsException, WrongBotScoreFormat
 from .models import (
     AdditionalInfo,
@@ -18,7 +20,52 @@ from .models import (
     QuestionScore,
     TelegramUser,
 )
+from .query_stats import actions_method
+from .question_bank import question_bank
+from .question_loader import LoadReport, SyncReport, batched, diff_questions, get_specialty_name, read_questions
+from .replica import recent_writes
+from .schemas import QuestionRecord
+from .tracing import span
 from .types_ import AnswerTypes, Specialty
+from .user_lock import user_lock
+
+T = TypeVar("T")
+
+LOAD_QUESTIONS_BATCH_SIZE = 1000
+
+# Оценка верного ответа (UserScore.RIGHT), частично верный ответ - 1, неверный - 0
+MAX_QUESTION_SCORE = 2
+
+
+class NextQuestion(NamedTuple):
+    """
+    Следующий вопрос пользователя: вопрос, его номер, количество вопросов в колоде и id сессии,
+    в которую пойдут ответы (его обработчики хранят в данных FSM, чтобы не искать сессию в базе)
+    """
+
+    question: QuestionRecord
+    current_question_number: int
+    questions_count: int
+    session_id: int
+
+
+class SessionScore(NamedTuple):
+    """
+    Итоги сессии: количество оценок вопросов, сумма оценок и сколько раз пользователь запросил доп.материалы
+    """
+
+    scored_questions: int
+    score_sum: int
+    train_materials: int
+
+    @property
+    def percent(self) -> int:
+        """
+        Оценка пользователя в процентах от максимальной (все ответы верные). Если оценок нет - 0
+        """
+        if not self.scored_questions:
+            return 0
+        return int(self.score_sum / self.scored_questions / MAX_QUESTION_SCORE * 100)
 
 
 def get_main_menu() -> List[str]:
@@ -36,8 +83,8 @@ def start_new_test() -> List[str]:
 
 
 class Actions:
-    def __init__(self) -> None:
-        self.db = SessionLocal()
+    def __init__(self, db: Optional[Session] = None) -> None:
+        self.db = db if db is not None else SessionLocal()
 
     def __enter__(self):
         return self
@@ -52,11 +99,10 @@ class Actions:
         """
         Добавляем пользователя в базу данных
         """
-        if is_tg_user_already_exist(self.db, tg_user.tg_user_id):
+        db_user = crud.create_tg_user(self.db, tg_user)
+        if db_user is None:
             raise UserExistsException("You try to add already exists user")
-        else:
-            db_user = crud.create_tg_user(self.db, tg_user)
-            logger.info("Add new telegram user {}", tg_user)
+        logger.info("Add new telegram user {}", tg_user)
         return db_user
 
     def remove_user(self, tg_user: schemas.TelegramUser) -> None:
@@ -64,10 +110,11 @@ class Actions:
         Удаляем информацию о пользователе из баз по tg_user_id [CurrentSession, EventsLog, Answer, TelegramUser]
         """
         if is_tg_user_already_exist(self.db, tg_user.tg_user_id):
-            crud.remove_events(self.db, tg_user.tg_user_id)
-            crud.remove_sessions(self.db, tg_user.tg_user_id)
-            crud.remove_answers(self.db, tg_user.tg_user_id)
-            crud.remove_tg_user(self.db, tg_user.tg_user_id)
+            with user_lock(self.db, tg_user.tg_user_id):
+                crud.remove_events(self.db, tg_user.tg_user_id)
+                crud.remove_sessions(self.db, tg_user.tg_user_id)
+                crud.remove_answers(self.db, tg_user.tg_user_id)
+                crud.remove_tg_user(self.db, tg_user.tg_user_id)
             logger.info(
                 "Remove telegram user tg_user_id={}, name={}, username={}, specialty={} and answer",
                 tg_user.tg_user_id,
@@ -90,45 +137,77 @@ class Actions:
         Добавляем в базу данных вопрос
         """
         db_question = crud.add_question(self.db, question)
+        question_bank.invalidate()
         logger.info("Add question {}", question)
         return db_question
 
-    def add_answer(self, answer: schemas.Answer) -> Optional[Answer]:
+    def add_answer(self, answer: schemas.Answer, session_id: Optional[int] = None) -> Optional[Answer]:
         """
-        Добавляем в базу данных ответ пользователя на вопрос
+        Добавляем в базу данных ответ пользователя на вопрос в текущую сессию (если известна - в сессию session_id)
         """
         has_text_answer = answer.text_answer is not None and answer.text_answer.strip()
         has_voice_answer = answer.link_to_audio_answer is not None and answer.link_to_audio_answer.strip()
         if has_text_answer or has_voice_answer:
-            db_answer = crud.add_answer(self.db, answer)
+            with user_lock(self.db, answer.tg_user_id):
+                db_answer = crud.add_answer(self.db, answer, session_id)
             logger.info("Add new user's answer {}", db_answer)
             return db_answer
         return None
 
-    def get_next_test(self, tg_user_id: int) -> Tuple[Question, int, int]:
+    def get_next_test(self, tg_user_id: int) -> Tuple[QuestionRecord, int, int]:
         """
         Получить из базы данных следующий тест для пользователя tg_user_id
         А также номер текущего вопроса и количество вопросов всего
         """
-        tg_user = crud.get_tg_user(self.db, tg_user_id)
+        question, current_question_number, questions_count, _ = self.get_next_question(tg_user_id)
+        return question, current_question_number, questions_count
+
+    def get_next_question(self, tg_user_id: int) -> NextQuestion:
+        """
+        То же, что get_next_test, но вместе с id текущей сессии
+        """
+        with user_lock(self.db, tg_user_id):
+            next_question = crud.advance_question_deck(self.db, tg_user_id)
+            if next_question is None:
+                next_question = self._deal_question_deck(tg_user_id)
+
+            next_quest_id, current_question_number, questions_count, is_answered, session_id = next_question
+            while True:
+                if next_quest_id is None:
+                    crud.remove_sessions(self.db, tg_user_id)
+                    raise NoNewQuestionsException("All questions were answered")
+
+                next_quest = None if is_answered else question_bank.get(self.db, next_quest_id)
+                if next_quest is not None:
+                    break
+
+                # На вопрос из колоды уже ответили в обход курсора или его удалили из базы
+                # после раздачи колоды (в колоде только id вопросов) - пропускаем его
+                next_question = crud.advance_question_deck(self.db, tg_user_id, skip=not is_answered)
+                assert next_question is not None
+                next_quest_id, current_question_number, questions_count, is_answered, session_id = next_question
+
+        return NextQuestion(next_quest, current_question_number, questions_count, session_id)
+
+    def _deal_question_deck(self, tg_user_id: int) -> Tuple[Optional[int], int, int, bool, int]:
+        """
+        Перемешать вопросы по специальности пользователя и сохранить их порядок в текущую сессию.
+        Если сессия уже начата без колоды, отвеченные вопросы остаются в начале колоды
+        """
+        user = crud.get_tg_user(self.db, tg_user_id)
         passed_questions = crud.get_passed_questions(self.db, tg_user_id)
-        logger.info(f"{passed_questions=}")
-        all_question = crud.get_all_questions(self.db, tg_user.specialty)
-        logger.info(f"{all_question=}")
-        new_questions = list(set(all_question) - set(passed_questions))
-        logger.info(f"{new_questions=}")
+        new_questions = list(set(question_bank.get_ids(self.db, user.specialty)) - set(passed_questions))
         if not new_questions:
-            crud.remove_sessions(self.db, tg_user.tg_user_id)
+            if crud.get_current_session(self.db, tg_user_id) is not None:
+                crud.remove_sessions(self.db, tg_user_id)
             raise NoNewQuestionsException("All questions were answered")
 
-        next_quest_id = random.choice(new_questions)
-        crud.set_current_question(self.db, tg_user_id, next_quest_id)
-        next_quest = get_question(self.db, next_quest_id)
-
-        current_question_number = len(passed_questions) + 1
-        questions_count = len(all_question)
-
-        return next_quest, current_question_number, questions_count
+        random.shuffle(new_questions)
+        question_deck = passed_questions + new_questions
+        deck_position = len(passed_questions) + 1
+        db_session = crud.deal_question_deck(self.db, tg_user_id, question_deck, deck_position)
+        logger.info("Deal question deck for tg_user_id={}: {}", tg_user_id, question_deck)
+        return question_deck[deck_position - 1], deck_position, len(question_deck), False, db_session.id
 
     def get_current_session(self, tg_user_id: int) -> Optional[CurrentSession]:
         """
@@ -142,65 +221,112 @@ class Actions:
         """
         return crud.get_current_question(self.db, tg_user_id) is not None
 
-    def add_train_material(self, question_id: int, tg_user_id: int) -> None:
+    def add_train_material(self, question_id: int, tg_user_id: int, session_id: Optional[int] = None) -> None:
         """
         Добавить в базу данных признак того,
         что пользователь c tg_user_id запросил дополнительный материал по вопросу question_id
         """
-        return crud.add_train_material(self.db, question_id, tg_user_id)
+        return crud.add_train_material(self.db, question_id, tg_user_id, session_id)
 
-    def get_train_material(self, tg_user_id: int) -> List[AdditionalInfo]:
+    def get_train_material(self, tg_user_id: int, session_id: Optional[int] = None) -> List[AdditionalInfo]:
         """
         Получить из базы данных список вопросов по которым пользователь tg_user_id запросил дополнительный материал
         """
-        return crud.get_train_material(self.db, tg_user_id)
+        return crud.get_train_material(self.db, tg_user_id, session_id)
 
-    def get_current_question(self, tg_user_id: int) -> Optional[Question]:
+    def get_current_question(self, tg_user_id: int) -> Optional[QuestionRecord]:
         """
-        Получить из базы данных текущий вопрос для пользователя (случайный вопрос из тех, на которые нет ответа)
+        Получить текущий вопрос для пользователя (случайный вопрос из тех, на которые нет ответа)
         """
         quest_id = crud.get_current_question(self.db, tg_user_id)
         if quest_id is not None:
-            quest = get_question(self.db, quest_id)
+            quest = question_bank.get(self.db, quest_id)
             return quest
         else:
             return None
 
-    def edit_specialty(self, tg_user_id: int, new_specialty: Specialty) -> None:
-        """
-        Изменить в базе данных специальность пользователя
-        """
-        if is_tg_user_already_exist(self.db, tg_user_id):
-            crud.edit_specialty(self.db, tg_user_id, new_specialty)
-        else:
-            raise UserNotExistsException("You try to add specialty for not exist user")
-
-    def load_questions(self, specialty: Specialty, file: str) -> None:
-        """
-        Загрузить вопросы в базу данных из csv файла `file`
-        """
-        with open(file, encoding="utf-8") as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=";")
-            line_count = 0
-            for row in csv_reader:
-                if line_count == 0:
-                    line_count += 1
-                    continue
-                self.add_question(
-                    Question(
-                        question_type=specialty.value,
-                        question_category=row[0],
-                        text_question=row[1],
-                        text_answer=row[2],
-                        additional_info=row[3],
-                    )
-                )
+    def get_question(self, quest_id: int) -> Optional[QuestionRecord]:
+        """
+        Получить вопрос по id (из банка вопросов в памяти, без запроса к базе данных)
+        """
+        return question_bank.get(self.db, quest_id)
+
+    def edit_specialty(self, tg_user_id: int, new_specialty: Specialty) -> bool:
+        """
+        Изменить в базе данных специальность пользователя.
+        Если пользователя еще нет в базе (например, база очищена, а диалог продолжается), он будет создан.
+        Возвращаем True, если пользователь создан
+        """
+        created = crud.edit_specialty(self.db, tg_user_id, new_specialty)
+        if created:
+            logger.info("Add new telegram user tg_user_id={} with specialty {}", tg_user_id, new_specialty.value)
+        return created
+
+    def load_questions(
+        self,
+        specialty: Union[Specialty, str],
+        file: str,
+        batch_size: int = LOAD_QUESTIONS_BATCH_SIZE,
+        drop_questions: bool = False,
+    ) -> LoadReport:
+        """
+        Загрузить вопросы в базу данных из csv файла `file`.
+        Файл читается потоком, вопросы вставляются пачками по batch_size в одной транзакции:
+        если в файле есть ошибка, в базу не попадет ни один вопрос.
+        С drop_questions старые вопросы специальности удаляются в той же транзакции:
+        если в файле есть ошибка, они останутся на месте
+        """
+        started_at = time.perf_counter()
+        questions_count = 0
+        try:
+            if drop_questions:
+                crud.delete_questions(self.db, get_specialty_name(specialty))
+            for batch in batched(read_questions(specialty, file), batch_size):
+                crud.add_questions(self.db, batch)
+                questions_count += len(batch)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        question_bank.invalidate()
+
+        report = LoadReport(questions_count, time.perf_counter() - started_at)
+        logger.info("Load {} questions from {}: {}", get_specialty_name(specialty), file, report)
+        return report
+
+    def sync_questions(self, specialty: Union[Specialty, str], file: str, dry_run: bool = False) -> SyncReport:
+        """
+        Синхронизировать вопросы специальности с csv файлом `file`, сохраняя id вопросов:
+        добавить новые, обновить измененные и вывести из оборота удаленные из файла вопросы.
+        При dry_run только посчитать разницу, ничего не меняя в базе
+        """
+        specialty_name = get_specialty_name(specialty)
+        current = [schemas.Question.from_orm(question) for question in crud.get_all_questions(self.db, specialty_name)]
+        report = diff_questions(current, read_questions(specialty, file))
+        if dry_run or not report.has_changes:
+            return report
+
+        try:
+            for batch in batched(report.inserted, LOAD_QUESTIONS_BATCH_SIZE):
+                crud.add_questions(self.db, batch)
+            for batch in batched(report.updated, LOAD_QUESTIONS_BATCH_SIZE):
+                crud.update_questions(self.db, batch)
+            crud.retire_questions(self.db, [question.id for question in report.retired if question.id is not None])
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        question_bank.invalidate()
+
+        logger.info("Sync {} questions with {}: {}", specialty_name, file, report)
+        return report
 
     def reset_session(self, user: schemas.TelegramUser) -> None:
         """
         Сбросить сессию (удалить все ответы пользователя, удалить сессию из базы данных)
         """
-        crud.remove_sessions(self.db, user.tg_user_id)
+        with user_lock(self.db, user.tg_user_id):
+            crud.remove_sessions(self.db, user.tg_user_id)
 
     def add_bot_score(self, user: schemas.TelegramUser, bot_score: int) -> BotReview:
         """
@@ -236,29 +362,41 @@ class Actions:
         """
         return crud.get_problem_question_review(self.db, tg_user_id)
 
-    def add_question_score(self, question_id: int, tg_user_id: int, score: int) -> QuestionScore:
+    def add_question_score(
+        self, question_id: int, tg_user_id: int, score: int, session_id: Optional[int] = None
+    ) -> QuestionScore:
         """
         Добавить в базу данных оценку вопроса question_id от пользователя с tg_user_id
         """
-        return crud.add_question_score(self.db, question_id, tg_user_id, score)
+        return crud.add_question_score(self.db, question_id, tg_user_id, score, session_id)
 
-    def get_question_score(self, question_id: int, tg_user_id: int) -> Optional[QuestionScore]:
+    def get_question_score(
+        self, question_id: int, tg_user_id: int, session_id: Optional[int] = None
+    ) -> Optional[QuestionScore]:
         """
         Получить из базы данных оценку вопроса question_id от пользователя с tg_user_id
         """
-        return crud.get_question_score(self.db, question_id, tg_user_id)
+        return crud.get_question_score(self.db, question_id, tg_user_id, session_id)
 
-    def get_all_questions_scores(self, tg_user_id: int) -> List[QuestionScore]:
+    def get_all_questions_scores(self, tg_user_id: int, session_id: Optional[int] = None) -> List[QuestionScore]:
         """
         Получить из базы данных оценки всех вопросов от пользователя с tg_user_id
         """
-        return crud.get_questions_scores(self.db, tg_user_id)
+        return crud.get_questions_scores(self.db, tg_user_id, session_id)
+
+    def get_session_score(self, tg_user_id: int, session_id: Optional[int] = None) -> SessionScore:
+        """
+        Посчитать в базе данных итоги последней сессии пользователя tg_user_id (или сессии session_id),
+        не загружая сами оценки и запросы доп.материалов
+        """
+        return SessionScore(*crud.get_session_score(self.db, tg_user_id, session_id))
 
     def remove_questions(self, specialty: str) -> None:
         """
         Удаляем из базы данных вопросы по заданной специальности [speciality]
         """
         crud.remove_questions(self.db, specialty)
+        question_bank.invalidate()
 
     def remove_problem_question_review(self, tg_user_id: int, question_id: int) -> None:
         """
@@ -277,3 +415,154 @@ class Actions:
         Удаляем из базы данных тренировочные материалы для пользователя tg_user_id по вопросу question_id
         """
         crud.remove_train_material(self.db, tg_user_id, question_id)
+
+
+def _call_in_sync_session(db: Session, method: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    with actions_method(method.__qualname__), span(method.__qualname__):
+        return method(Actions(db), *args, **kwargs)
+
+
+class AsyncActions:
+    """
+    Асинхронный вариант Actions для обработчиков бота.
+    Методы Actions выполняются через AsyncSession.run_sync, поэтому запросы к базе данных
+    идут через asyncpg и не блокируют event loop. Так же можно вызвать любую функцию из crud:
+    await act.db.run_sync(crud.get_question, quest_id)
+
+    Отчеты (оценки, отзывы, дополнительные материалы) читаются с реплики replica_db, если она настроена.
+    Данные пользователя, который недавно что-то записал, читаются с основной базы
+    """
+
+    def __init__(self, db: Optional[AsyncSession] = None, replica_db: Optional[AsyncSession] = None) -> None:
+        self.db = db if db is not None else AsyncSessionLocal()
+        self._replica_db = replica_db
+        # Пользователи, данные которых менялись через эти AsyncActions
+        self.written_users: Set[int] = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self) -> None:
+        await self.db.close()
+        if self._replica_db is not None:
+            await self._replica_db.close()
+
+    def read_db(self, tg_user_id: int) -> AsyncSession:
+        """
+        Сессия для чтения данных пользователя: реплика, если она есть и успела получить его последние записи
+        """
+        if tg_user_id in self.written_users or recent_writes.is_recent(tg_user_id):
+            return self.db
+        if self._replica_db is None:
+            if AsyncReplicaSessionLocal is None:
+                return self.db
+            self._replica_db = AsyncReplicaSessionLocal()
+        return self._replica_db
+
+    async def _run(self, method: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await self.db.run_sync(_call_in_sync_session, method, *args, **kwargs)
+
+    async def _read(self, tg_user_id: int, method: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await self.read_db(tg_user_id).run_sync(_call_in_sync_session, method, *args, **kwargs)
+
+    async def _write(self, tg_user_id: int, method: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        try:
+            return await self._run(method, *args, **kwargs)
+        finally:
+            self.written_users.add(tg_user_id)
+            recent_writes.mark(tg_user_id)
+
+    async def add_user(self, tg_user: schemas.TelegramUser) -> TelegramUser:
+        return await self._write(tg_user.tg_user_id, Actions.add_user, tg_user)
+
+    async def remove_user(self, tg_user: schemas.TelegramUser) -> None:
+        return await self._write(tg_user.tg_user_id, Actions.remove_user, tg_user)
+
+    async def add_event(self, event: schemas.EventsLog) -> None:
+        return await self._run(Actions.add_event, event)
+
+    async def add_question(self, question: schemas.Question) -> Question:
+        return await self._run(Actions.add_question, question)
+
+    async def add_answer(self, answer: schemas.Answer, session_id: Optional[int] = None) -> Optional[Answer]:
+        return await self._write(answer.tg_user_id, Actions.add_answer, answer, session_id)
+
+    async def get_next_test(self, tg_user_id: int) -> Tuple[QuestionRecord, int, int]:
+        return await self._write(tg_user_id, Actions.get_next_test, tg_user_id)
+
+    async def get_next_question(self, tg_user_id: int) -> NextQuestion:
+        return await self._write(tg_user_id, Actions.get_next_question, tg_user_id)
+
+    async def get_current_session(self, tg_user_id: int) -> Optional[CurrentSession]:
+        return await self._run(Actions.get_current_session, tg_user_id)
+
+    async def has_started_test(self, tg_user_id: int) -> bool:
+        return await self._run(Actions.has_started_test, tg_user_id)
+
+    async def add_train_material(self, question_id: int, tg_user_id: int, session_id: Optional[int] = None) -> None:
+        return await self._write(tg_user_id, Actions.add_train_material, question_id, tg_user_id, session_id)
+
+    async def get_train_material(self, tg_user_id: int, session_id: Optional[int] = None) -> List[AdditionalInfo]:
+        return await self._read(tg_user_id, Actions.get_train_material, tg_user_id, session_id)
+
+    async def get_current_question(self, tg_user_id: int) -> Optional[QuestionRecord]:
+        return await self._run(Actions.get_current_question, tg_user_id)
+
+    async def get_question(self, quest_id: int) -> Optional[QuestionRecord]:
+        return await self._run(Actions.get_question, quest_id)
+
+    async def edit_specialty(self, tg_user_id: int, new_specialty: Specialty) -> bool:
+        return await self._write(tg_user_id, Actions.edit_specialty, tg_user_id, new_specialty)
+
+    async def reset_session(self, user: schemas.TelegramUser) -> None:
+        return await self._write(user.tg_user_id, Actions.reset_session, user)
+
+    async def add_bot_score(self, user: schemas.TelegramUser, bot_score: int) -> BotReview:
+        return await self._write(user.tg_user_id, Actions.add_bot_score, user, bot_score)
+
+    async def add_bot_review(self, user: schemas.TelegramUser, review: str, review_type: AnswerTypes) -> BotReview:
+        return await self._write(user.tg_user_id, Actions.add_bot_review, user, review, review_type)
+
+    async def get_bot_review(self, user: schemas.TelegramUser) -> List[BotReview]:
+        return await self._read(user.tg_user_id, Actions.get_bot_review, user)
+
+    async def add_problem_question_review(
+        self, question_id: int, tg_user_id: int, review: str, review_type: AnswerTypes
+    ) -> ProblemQuestionReview:
+        return await self._write(
+            tg_user_id, Actions.add_problem_question_review, question_id, tg_user_id, review, review_type
+        )
+
+    async def get_problem_question_review(self, tg_user_id: int) -> List[ProblemQuestionReview]:
+        return await self._read(tg_user_id, Actions.get_problem_question_review, tg_user_id)
+
+    async def add_question_score(
+        self, question_id: int, tg_user_id: int, score: int, session_id: Optional[int] = None
+    ) -> QuestionScore:
+        return await self._write(tg_user_id, Actions.add_question_score, question_id, tg_user_id, score, session_id)
+
+    async def get_question_score(
+        self, question_id: int, tg_user_id: int, session_id: Optional[int] = None
+    ) -> Optional[QuestionScore]:
+        return await self._read(tg_user_id, Actions.get_question_score, question_id, tg_user_id, session_id)
+
+    async def get_all_questions_scores(self, tg_user_id: int, session_id: Optional[int] = None) -> List[QuestionScore]:
+        return await self._read(tg_user_id, Actions.get_all_questions_scores, tg_user_id, session_id)
+
+    async def get_session_score(self, tg_user_id: int, session_id: Optional[int] = None) -> SessionScore:
+        return await self._read(tg_user_id, Actions.get_session_score, tg_user_id, session_id)
+
+    async def remove_questions(self, specialty: str) -> None:
+        return await self._run(Actions.remove_questions, specialty)
+
+    async def remove_problem_question_review(self, tg_user_id: int, question_id: int) -> None:
+        return await self._write(tg_user_id, Actions.remove_problem_question_review, tg_user_id, question_id)
+
+    async def remove_question_score(self, question_id: int) -> None:
+        return await self._run(Actions.remove_question_score, question_id)
+
+    async def remove_train_material(self, tg_user_id: int, question_id: int) -> None:
+        return await self._write(tg_user_id, Actions.remove_train_material, tg_user_id, question_id)
@@ -12,8 +12,56 @@ class Settings(BaseSettings):
     db_host: str = Field(..., env="DB_HOST")
     db_port: int = Field(5432, env="DB_PORT")
     db_name: str = Field(..., env="DB_NAME")
+    db_pool_size: int = Field(5, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(10, env="DB_MAX_OVERFLOW")
+    db_pool_timeout: float = Field(30, env="DB_POOL_TIMEOUT")
+    db_pool_recycle: int = Field(1800, env="DB_POOL_RECYCLE")
+    db_pool_pre_ping: bool = Field(True, env="DB_POOL_PRE_PING")
+    db_pool_stats_interval: float = Field(60, env="DB_POOL_STATS_INTERVAL")
+    db_statement_timeout: float = Field(0, env="DB_STATEMENT_TIMEOUT")
+    db_application_name: str = Field("androbot", env="DB_APPLICATION_NAME")
+    db_replica_host: Optional[str] = Field(None, env="DB_REPLICA_HOST")
+    db_replica_port: Optional[int] = Field(None, env="DB_REPLICA_PORT")
+    db_replica_max_lag: float = Field(5, env="DB_REPLICA_MAX_LAG")
+    db_slow_query_threshold: float = Field(0.5, env="DB_SLOW_QUERY_THRESHOLD")
+    db_n_plus_one_threshold: int = Field(5, env="DB_N_PLUS_ONE_THRESHOLD")
 
     static_folder: Path = Field("templates", env="STATIC_FOLDER")
+    templates_reload_interval: float = Field(2.0, env="TEMPLATES_RELOAD_INTERVAL")
+
+    user_lock_timeout: float = Field(5.0, env="USER_LOCK_TIMEOUT")
+
+    question_bank_ttl: float = Field(300, env="QUESTION_BANK_TTL")
+
+    event_sink_batch_size: int = Field(100, env="EVENT_SINK_BATCH_SIZE")
+    event_sink_flush_interval: float = Field(1.0, env="EVENT_SINK_FLUSH_INTERVAL")
+    event_sink_queue_size: int = Field(10000, env="EVENT_SINK_QUEUE_SIZE")
+
+    outbox_rate: float = Field(30, env="OUTBOX_RATE")
+    outbox_burst: int = Field(30, env="OUTBOX_BURST")
+    outbox_chat_rate: float = Field(1, env="OUTBOX_CHAT_RATE")
+    outbox_chat_burst: int = Field(3, env="OUTBOX_CHAT_BURST")
+    outbox_max_retries: int = Field(5, env="OUTBOX_MAX_RETRIES")
+
+    workers: int = Field(1, env="WORKERS")
+    updates_concurrency: int = Field(100, env="UPDATES_CONCURRENCY")
+
+    webhook_host: Optional[str] = Field(None, env="WEBHOOK_HOST")
+    webhook_path: str = Field("/webhook", env="WEBHOOK_PATH")
+    webhook_reply: bool = Field(True, env="WEBHOOK_REPLY")
+    webhook_max_connections: int = Field(40, env="WEBHOOK_MAX_CONNECTIONS")
+    webapp_host: str = Field("0.0.0.0", env="WEBAPP_HOST")
+    webapp_port: int = Field(8080, env="WEBAPP_PORT")
+
+    telegram_api_server: Optional[str] = Field(None, env="TELEGRAM_API_SERVER")
+
+    metrics_host: str = Field("127.0.0.1", env="METRICS_HOST")
+    metrics_port: int = Field(0, env="METRICS_PORT")
+
+    tracing_file: Optional[Path] = Field(None, env="TRACING_FILE")
+    tracing_otlp_endpoint: Optional[str] = Field(None, env="TRACING_OTLP_ENDPOINT")
+    tracing_batch_size: int = Field(1000, env="TRACING_BATCH_SIZE")
+    tracing_flush_interval: float = Field(1.0, env="TRACING_FLUSH_INTERVAL")
 
     fsm_redis_host: Optional[str] = Field(None, env="REDIS_HOST")
     fsm_redis_port: int = Field(6379, env="REDIS_PORT")
@@ -1,6 +1,9 @@
-from typing import List, Optional
+from typing import Any, List, Optional, Tuple, Type, TypeVar
 
+from sqlalchemy import bindparam, case, exists, false, func, insert, literal, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement
 
 from androbot.database import Base
 
@@ -17,8 +20,87 @@ from .models import (
     QuestionScore,
     TelegramUser,
 )
+from .schemas import QUESTION_CONTENT_FIELDS
 from .types_ import Specialty
 
+ModelT = TypeVar("ModelT")
+
+
+def insert_returning(db: Session, model: Type[ModelT], **values: Any) -> ModelT:
+    """
+    Вставляем строку одним запросом INSERT ... RETURNING и сразу получаем объект модели в сессии db,
+    без SELECT после commit. Транзакцию не фиксируем
+    """
+    statement = insert(model).values(**values).returning(*model.__table__.columns)  # type: ignore
+    return db.execute(select(model).from_statement(statement)).scalar_one()
+
+
+def update_returning(db: Session, model: Type[ModelT], where: ColumnElement, **values: Any) -> Optional[ModelT]:
+    """
+    Обновляем строку одним запросом UPDATE ... RETURNING. Возвращаем обновленный объект модели
+    (None, если под условие where ничего не попало). Транзакцию не фиксируем
+    """
+    statement = update(model).where(where).values(**values).returning(*model.__table__.columns)  # type: ignore
+    result = db.execute(select(model).from_statement(statement).execution_options(populate_existing=True))
+    return result.scalars().first()
+
+
+def insert_into_current_session(
+    db: Session, model: Type[ModelT], tg_user_id: int, session_id: Optional[int] = None, **values: Any
+) -> ModelT:
+    """
+    Вставляем строку, привязанную к текущей сессии пользователя tg_user_id, одним запросом
+    INSERT ... SELECT ... RETURNING: id сессии берется в том же запросе.
+    Если id сессии уже известен (session_id из данных FSM), сессию не ищем. Транзакцию не фиксируем
+    """
+    values["tg_user_id"] = tg_user_id
+    if session_id is not None:
+        return insert_returning(db, model, session_id=session_id, **values)
+    columns = model.__table__.columns  # type: ignore
+    current_session = (
+        select(*(literal(value, columns[name].type) for name, value in values.items()), CurrentSession.id)
+        .where(_is_current_session(tg_user_id))
+        .limit(1)
+    )
+    statement = insert(model).from_select([*values, "session_id"], current_session).returning(*columns)
+    db_row = db.execute(select(model).from_statement(statement)).scalars().first()
+    if db_row is None:
+        raise NoCurrentSessionException("Нет активной сессии")
+    return db_row
+
+
+def _is_current_session(tg_user_id: int) -> ColumnElement:
+    return (CurrentSession.tg_user_id == tg_user_id) & (CurrentSession.is_finished == False)  # noqa E712
+
+
+def _get_last_session_id(db: Session, tg_user_id: int, session_id: Optional[int]) -> int:
+    """
+    Id последней сессии пользователя tg_user_id: session_id, если он уже известен, иначе ищем сессию в базе
+    """
+    if session_id is not None:
+        return session_id
+    last_session = get_last_session(db, tg_user_id)
+    if not last_session:
+        raise NoCurrentSessionException("Нет активной сессии")
+    return last_session.id
+
+
+def _expire_loaded(db: Session, model: type, tg_user_id: int) -> None:
+    """
+    Запросы INSERT/UPDATE мимо ORM не трогают объекты, уже загруженные в сессию:
+    объекты model пользователя tg_user_id перечитаем из базы при следующем обращении
+    """
+    for db_object in list(db.identity_map.values()):
+        if isinstance(db_object, model) and db_object.__dict__.get("tg_user_id") == tg_user_id:
+            db.expire(db_object)
+
+
+def _was_inserted() -> ColumnElement:
+    """
+    Для RETURNING в INSERT ... ON CONFLICT DO UPDATE: True, если строка вставлена, False - если обновлена
+    """
+    return literal_column("xmax") == 0
+
 
 def get_tg_users(db: Session, skip: int = 0) -> List[TelegramUser]:
     """
@@ -41,16 +123,19 @@ def is_tg_user_already_exist(db: Session, tg_user_id: int) -> bool:
     return db.query(TelegramUser).filter(TelegramUser.tg_user_id == tg_user_id).count() > 0
 
 
-def create_tg_user(db: Session, user: schemas.TelegramUser) -> TelegramUser:
+def create_tg_user(db: Session, user: schemas.TelegramUser) -> Optional[TelegramUser]:
     """
-    Создаем пользователя в базе
+    Создаем пользователя в базе одним запросом INSERT ... ON CONFLICT DO NOTHING.
+    Возвращаем None, если пользователь с таким tg_user_id уже есть
     """
-    db_user = models.TelegramUser(
-        tg_user_id=user.tg_user_id, name=user.name, username=user.username, specialty=user.specialty
+    statement = (
+        pg_insert(TelegramUser)
+        .values(tg_user_id=user.tg_user_id, name=user.name, username=user.username, specialty=user.specialty)
+        .on_conflict_do_nothing(index_elements=[TelegramUser.tg_user_id])
+        .returning(*TelegramUser.__table__.columns)
     )
-    db.add(db_user)
+    db_user = db.execute(select(TelegramUser).from_statement(statement)).scalars().first()
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 
@@ -58,7 +143,9 @@ def add_event(db: Session, event: schemas.EventsLog) -> EventsLog:
     """
     Сохранение события
     """
-    db_event = models.EventsLog(
+    db_event = insert_returning(
+        db,
+        models.EventsLog,
         tg_user_id=event.tg_user_id,
         event_type=event.event_type.value,
         datetime=event.datetime,
@@ -68,33 +155,25 @@ def add_event(db: Session, event: schemas.EventsLog) -> EventsLog:
         param4=event.param4,
         param5=event.param5,
     )
-    db.add(db_event)
     db.commit()
-    db.refresh(db_event)
     return db_event
 
 
-def add_answer(db: Session, answer: schemas.Answer) -> Answer:
+def add_answer(db: Session, answer: schemas.Answer, session_id: Optional[int] = None) -> Answer:
     """
-    Добавление ответа пользователя на вопрос в базу
+    Добавление ответа пользователя на вопрос в текущую сессию
     """
-
-    current_session = get_current_session(db, answer.tg_user_id)
-
-    if not current_session:
-        raise NoCurrentSessionException("Нет активной сессии")
-
-    db_answer = models.Answer(
+    db_answer = insert_into_current_session(
+        db,
+        models.Answer,
+        answer.tg_user_id,
+        session_id,
         quest_id=answer.quest_id,
-        tg_user_id=answer.tg_user_id,
         answer_type=answer.answer_type,
         text_answer=answer.text_answer,
         link_to_audio_answer=answer.link_to_audio_answer,
-        session_id=current_session.id,
     )
-    db.add(db_answer)
     db.commit()
-    db.refresh(db_answer)
     return db_answer
 
 
@@ -102,20 +181,60 @@ def add_question(db: Session, question: schemas.Question) -> Question:
     """
     Добавление вопроса в базу
     """
-    db_question = models.Question(
+    db_question = insert_returning(
+        db,
+        models.Question,
         question_type=question.question_type,
         question_category=question.question_category,
         text_answer=question.text_answer,
         text_question=question.text_question,
         additional_info=question.additional_info,
     )
-    db.add(db_question)
     db.commit()
-    db.refresh(db_question)
     question.id = db_question.id
     return db_question
 
 
+def add_questions(db: Session, questions: List[schemas.Question]) -> None:
+    """
+    Добавление пачки вопросов в базу одним запросом (INSERT ... VALUES (...), (...), ...).
+    Транзакцию не фиксируем: commit делает вызывающий код после загрузки всех пачек
+    """
+    if not questions:
+        return
+    db.execute(insert(Question).values([question.dict(exclude={"id"}) for question in questions]))
+
+
+def update_questions(db: Session, questions: List[schemas.Question]) -> None:
+    """
+    Обновление пачки вопросов по id одним executemany запросом. Транзакцию не фиксируем
+    """
+    if not questions:
+        return
+    db.execute(
+        update(Question.__table__)
+        .where(Question.id == bindparam("question_id"))
+        .values(is_retired=false(), **{field: bindparam(f"new_{field}") for field in QUESTION_CONTENT_FIELDS}),
+        [
+            {
+                "question_id": question.id,
+                **{f"new_{field}": getattr(question, field) for field in QUESTION_CONTENT_FIELDS},
+            }
+            for question in questions
+        ],
+    )
+
+
+def retire_questions(db: Session, question_ids: List[int]) -> None:
+    """
+    Выводим вопросы из оборота: они остаются в базе для истории, но не попадают в новые сессии.
+    Транзакцию не фиксируем
+    """
+    if not question_ids:
+        return
+    db.execute(update(Question.__table__).where(Question.id.in_(question_ids)).values(is_retired=True))
+
+
 def get_passed_questions(db: Session, tg_user_id: int) -> List[int]:
     """
     Получить список id вопросов, на которые ответил пользователь tg_user_id
@@ -124,57 +243,106 @@ def get_passed_questions(db: Session, tg_user_id: int) -> List[int]:
     current_session = get_current_session(db, tg_user_id)
     session_id = current_session.id if current_session else None
 
-    return (
+    passed_questions = (
         db.query(models.Answer.quest_id)
         .filter((models.Answer.tg_user_id == tg_user_id) & (models.Answer.session_id == session_id))
-        .all()
+        .order_by(models.Answer.id)
     )
+    return list(dict.fromkeys(quest_id for quest_id, in passed_questions))
 
 
-def set_current_question(db: Session, tg_user_id: int, quest_id: int) -> Session:
+def advance_question_deck(
+    db: Session, tg_user_id: int, skip: bool = False
+) -> Optional[Tuple[Optional[int], int, int, bool, int]]:
     """
-    Назначить вопрос quest_id пользователю tg_user_id
+    Сдвигаем курсор колоды вопросов текущей сессии пользователя tg_user_id одним запросом (UPDATE ... RETURNING).
+    Курсор сдвигается, только если на текущий вопрос уже есть ответ, иначе текущий вопрос выдается повторно.
+    С skip курсор сдвигается в любом случае (текущий вопрос удален из базы после раздачи колоды).
+    Возвращаем id вопроса из колоды (None, если колода закончилась; вопроса с этим id может уже не быть в базе),
+    номер вопроса, размер колоды, признак того, что на новый вопрос уже есть ответ, и id сессии,
+    или None, если у пользователя нет текущей сессии с колодой
     """
-    query = db.query(models.CurrentSession).filter(
-        (models.CurrentSession.tg_user_id == tg_user_id) & (models.CurrentSession.is_finished == False)  # noqa E712
+    is_answered = exists().where(
+        (Answer.session_id == CurrentSession.id) & (Answer.quest_id == CurrentSession.quest_id)
     )
-    if query is not None and query.count() == 1:
-        db_session = query.first()
-        db_session.quest_id = quest_id
-    else:
-        db_session = models.CurrentSession(
-            quest_id=quest_id,
-            tg_user_id=tg_user_id,
-            is_finished=False,
+    deck_position = CurrentSession.deck_position + (1 if skip else case((is_answered, 1), else_=0))
+    # В колоде только id вопросов: вопрос могли удалить после раздачи колоды, тогда quest_id сессии пустой
+    existing_quest_id = select(Question.id).where(Question.id == CurrentSession.question_deck[deck_position])
+    next_question = db.execute(
+        update(CurrentSession)
+        .where(
+            (CurrentSession.tg_user_id == tg_user_id)
+            & (CurrentSession.is_finished == False)  # noqa E712
+            & (CurrentSession.question_deck != None)  # noqa E711
+        )
+        .values(deck_position=deck_position, quest_id=existing_quest_id.scalar_subquery())
+        .returning(
+            CurrentSession.question_deck[CurrentSession.deck_position],
+            CurrentSession.deck_position,
+            func.coalesce(func.cardinality(CurrentSession.question_deck), 0),
+            is_answered,
+            CurrentSession.id,
         )
+        .execution_options(synchronize_session=False)
+    ).first()
+    db.commit()
+    _expire_loaded(db, CurrentSession, tg_user_id)
+
+    if next_question is None:
+        return None
+    quest_id, position, deck_size, is_answered, session_id = next_question
+    return quest_id, position, deck_size, is_answered, session_id
+
+
+def deal_question_deck(db: Session, tg_user_id: int, question_deck: List[int], deck_position: int) -> CurrentSession:
+    """
+    Сохраняем колоду вопросов question_deck в текущую сессию пользователя tg_user_id (создаем сессию, если ее нет)
+    и ставим курсор на вопрос с номером deck_position (нумерация с 1)
+    """
+    db_session = get_current_session(db, tg_user_id)
+    if db_session is None:
+        db_session = CurrentSession(tg_user_id=tg_user_id, is_finished=False)
         db.add(db_session)
+
+    db_session.question_deck = question_deck
+    db_session.deck_position = deck_position
+    db_session.quest_id = question_deck[deck_position - 1]
     db.commit()
-    db.refresh(db_session)
     return db_session
 
 
-def edit_specialty(db: Session, tg_user_id: int, specialty: Specialty) -> None:
+def set_current_question(db: Session, tg_user_id: int, quest_id: int) -> CurrentSession:
     """
-    Редактируем специальность у пользователя
+    Назначить вопрос quest_id пользователю tg_user_id
     """
-    query = db.query(models.TelegramUser).filter(models.TelegramUser.tg_user_id == tg_user_id)
-    if query is not None and query.count() == 1:
-        db_session = query.first()
-        db_session.specialty = specialty.value
-        db.commit()
-        db.refresh(db_session)
-    db.close()
+    db_session = update_returning(db, CurrentSession, _is_current_session(tg_user_id), quest_id=quest_id)
+    if db_session is None:
+        db_session = insert_returning(db, CurrentSession, quest_id=quest_id, tg_user_id=tg_user_id, is_finished=False)
+    db.commit()
+    return db_session
+
+
+def edit_specialty(db: Session, tg_user_id: int, specialty: Specialty) -> bool:
+    """
+    Редактируем специальность у пользователя одним запросом INSERT ... ON CONFLICT DO UPDATE:
+    если пользователя еще нет в базе, создаем его. Возвращаем True, если пользователь создан
+    """
+    statement = pg_insert(TelegramUser).values(tg_user_id=tg_user_id, specialty=specialty.value)
+    created = db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[TelegramUser.tg_user_id], set_={"specialty": statement.excluded.specialty}
+        ).returning(_was_inserted())
+    ).scalar_one()
+    db.commit()
+    _expire_loaded(db, TelegramUser, tg_user_id)
+    return created
 
 
 def get_current_session(db: Session, tg_user_id: int) -> Optional[CurrentSession]:
     """
     Получаем текущую сессию пользователя tg_user_id
     """
-    return (
-        db.query(CurrentSession)
-        .filter((CurrentSession.tg_user_id == tg_user_id) & (CurrentSession.is_finished == False))  # noqa E712
-        .first()
-    )
+    return db.query(CurrentSession).filter(_is_current_session(tg_user_id)).first()
 
 
 def get_last_session(db: Session, tg_user_id: int) -> Optional[CurrentSession]:
@@ -200,24 +368,27 @@ def get_current_question(db: Session, tg_user_id: int) -> Optional[int]:
         return None
 
 
-def add_train_material(db: Session, question_id: int, tg_user_id: int) -> None:
+def add_train_material(db: Session, question_id: int, tg_user_id: int, session_id: Optional[int] = None) -> None:
     """
     Добавляем в базу данных, признак что пользователь запросил доп.материалы
     по вопросу question_id для пользователя tg_user_id
     """
-    current_session = get_current_session(db, tg_user_id)
-    if not current_session:
-        raise NoCurrentSessionException("Нет активной сессии")
-
-    additional_info = AdditionalInfo(tg_user_id=tg_user_id, question_id=question_id, session_id=current_session.id)
-    commit_into_db(db, additional_info)
+    insert_into_current_session(db, AdditionalInfo, tg_user_id, session_id, question_id=question_id)
+    db.commit()
 
 
 def get_all_questions(db: Session, specialty: str) -> List[Question]:
     """
-    Получаем список всех вопросов для специальности specialty
+    Получаем список всех вопросов для специальности specialty (в том числе выведенных из оборота)
+    """
+    return db.query(Question).filter(Question.question_type == specialty).order_by(Question.id).all()
+
+
+def get_questions(db: Session) -> List[Question]:
     """
-    return db.query(models.Question.id).filter(models.Question.question_type == specialty).all()
+    Получаем все вопросы
+    """
+    return db.query(Question).order_by(Question.id).all()
 
 
 def get_question(db: Session, quest_id: int) -> Question:
@@ -227,16 +398,13 @@ def get_question(db: Session, quest_id: int) -> Question:
     return db.query(Question).filter(models.Question.id == quest_id).first()
 
 
-def get_train_material(db: Session, tg_user_id: int) -> List[AdditionalInfo]:
+def get_train_material(db: Session, tg_user_id: int, session_id: Optional[int] = None) -> List[AdditionalInfo]:
     """
-    Получаем сколько раз пользователь запросил доп.материалы
+    Получаем сколько раз пользователь запросил доп.материалы в последней сессии (или в сессии session_id)
     """
-    last_session = get_last_session(db, tg_user_id)
-    if not last_session:
-        raise NoCurrentSessionException("Нет активной сессии")
-
+    session_id = _get_last_session_id(db, tg_user_id, session_id)
     train_materials = db.query(AdditionalInfo).filter(
-        (AdditionalInfo.tg_user_id == tg_user_id) & (AdditionalInfo.session_id == last_session.id)
+        (AdditionalInfo.tg_user_id == tg_user_id) & (AdditionalInfo.session_id == session_id)
     )
 
     return list(train_materials)
@@ -246,78 +414,86 @@ def add_bot_score(db: Session, tg_user_id: int, bot_score: int) -> BotReview:
     """
     Добавить оценку бота от пользователя tg_user_id
     """
-    db_review = db.query(BotReview).filter(models.BotReview.tg_user_id == tg_user_id).first()
-    if db_review is not None:
-        db_review.bot_score = bot_score
-        commit_into_db(db, db_review)
-        return db_review
-    else:
-        bot_review = models.BotReview(tg_user_id=tg_user_id, bot_score=bot_score, bot_review=None, bot_review_type=None)
-        commit_into_db(db, bot_review)
-        return bot_review
+    db_review = update_returning(db, BotReview, BotReview.tg_user_id == tg_user_id, bot_score=bot_score)
+    if db_review is None:
+        db_review = insert_returning(db, BotReview, tg_user_id=tg_user_id, bot_score=bot_score)
+    db.commit()
+    return db_review
 
 
 def add_bot_review(db: Session, tg_user_id: int, review: str, review_type: str) -> BotReview:
     """
     Добавить ревью на бота от пользователя tg_user_id
     """
-    db_review = db.query(BotReview).filter(models.BotReview.tg_user_id == tg_user_id).first()
-    if db_review is not None:
-        db_review.bot_review = review
-        db_review.bot_review_type = review_type
-        commit_into_db(db, db_review)
-        return db_review
-    else:
-        bot_review = models.BotReview(
-            tg_user_id=tg_user_id, bot_score=None, bot_review=review, bot_review_type=review_type
+    db_review = update_returning(
+        db, BotReview, BotReview.tg_user_id == tg_user_id, bot_review=review, bot_review_type=review_type
+    )
+    if db_review is None:
+        db_review = insert_returning(
+            db, BotReview, tg_user_id=tg_user_id, bot_review=review, bot_review_type=review_type
         )
-        commit_into_db(db, bot_review)
-        return bot_review
+    db.commit()
+    return db_review
 
 
-def add_question_score(db: Session, question_id: int, tg_user_id: int, score: int) -> QuestionScore:
+def add_question_score(
+    db: Session, question_id: int, tg_user_id: int, score: int, session_id: Optional[int] = None
+) -> QuestionScore:
     """
     Добавить оценку вопроса
     """
-    current_session = get_current_session(db, tg_user_id)
-    if not current_session:
-        raise NoCurrentSessionException("Нет активной сессии")
-
-    db_question_score = QuestionScore(
-        question_id=question_id, session_id=current_session.id, tg_user_id=tg_user_id, score=score
+    db_question_score = insert_into_current_session(
+        db, QuestionScore, tg_user_id, session_id, question_id=question_id, score=score
     )
-
-    commit_into_db(db, db_question_score)
+    db.commit()
     return db_question_score
 
 
-def get_questions_scores(db: Session, tg_user_id: int) -> List[QuestionScore]:
+def get_questions_scores(db: Session, tg_user_id: int, session_id: Optional[int] = None) -> List[QuestionScore]:
     """
-    Получаем все оценки вопросов от пользователя tg_user_id
+    Получаем все оценки вопросов от пользователя tg_user_id в последней сессии (или в сессии session_id)
     """
-    last_session = get_last_session(db, tg_user_id)
-    if not last_session:
-        raise NoCurrentSessionException("Нет активной сессии")
-
+    session_id = _get_last_session_id(db, tg_user_id, session_id)
     db_question_score = db.query(QuestionScore).filter(
-        (QuestionScore.tg_user_id == tg_user_id) & (QuestionScore.session_id == last_session.id)
+        (QuestionScore.tg_user_id == tg_user_id) & (QuestionScore.session_id == session_id)
     )
 
     return list(db_question_score)
 
 
-def get_question_score(db: Session, question_id: int, tg_user_id: int) -> Optional[QuestionScore]:
+def get_session_score(db: Session, tg_user_id: int, session_id: Optional[int] = None) -> Tuple[int, int, int]:
     """
-    Получаем оценку вопроса question_id от пользователя tg_user_id
+    Итоги последней сессии пользователя tg_user_id (или сессии session_id) одним запросом:
+    количество оценок вопросов, сумма оценок и сколько раз пользователь запросил доп.материалы
     """
-    last_session = get_last_session(db, tg_user_id)
-    if not last_session:
-        raise NoCurrentSessionException("Нет активной сессии")
+    if session_id is None:
+        session = select(func.max(CurrentSession.id)).where(CurrentSession.tg_user_id == tg_user_id).scalar_subquery()
+    else:
+        session = literal(session_id)
+    train_materials = (
+        select(func.count(AdditionalInfo.id))
+        .where((AdditionalInfo.tg_user_id == tg_user_id) & (AdditionalInfo.session_id == session))
+        .scalar_subquery()
+    )
+    scored_questions, score_sum, train_materials_count = db.execute(
+        select(func.count(QuestionScore.id), func.coalesce(func.sum(QuestionScore.score), 0), train_materials).where(
+            (QuestionScore.tg_user_id == tg_user_id) & (QuestionScore.session_id == session)
+        )
+    ).one()
+    return scored_questions, score_sum, train_materials_count
 
+
+def get_question_score(
+    db: Session, question_id: int, tg_user_id: int, session_id: Optional[int] = None
+) -> Optional[QuestionScore]:
+    """
+    Получаем оценку вопроса question_id от пользователя tg_user_id в последней сессии (или в сессии session_id)
+    """
+    session_id = _get_last_session_id(db, tg_user_id, session_id)
     db_question_score = db.query(QuestionScore).filter(
         (QuestionScore.tg_user_id == tg_user_id)
         & (QuestionScore.question_id == question_id)
-        & (QuestionScore.session_id == last_session.id)
+        & (QuestionScore.session_id == session_id)
     )
     return db_question_score.first()
 
@@ -327,7 +503,7 @@ def get_bot_review(db: Session, tg_user_id: int) -> List[BotReview]:
     Получаем ревью на бот пользователя tg_user_id
     """
     db_review = db.query(BotReview).filter(models.BotReview.tg_user_id == tg_user_id)
-    return db_review
+    return db_review.all()
 
 
 def get_problem_question_review(db: Session, tg_user_id: int) -> List[ProblemQuestionReview]:
@@ -335,7 +511,7 @@ def get_problem_question_review(db: Session, tg_user_id: int) -> List[ProblemQue
     Получаем список оставленных ревью на вопросы от пользователя tg_user_id
     """
     db_problems = db.query(ProblemQuestionReview).filter(models.ProblemQuestionReview.tg_user_id == tg_user_id)
-    return db_problems
+    return db_problems.all()
 
 
 def add_problem_question_review(
@@ -344,21 +520,24 @@ def add_problem_question_review(
     """
     Добавляем в базу данных ревью от пользователя tg_user_id по вопросу question_id
     """
-    db_problem = models.ProblemQuestionReview(
-        question_id=question_id, tg_user_id=tg_user_id, review=review, review_type=review_type
+    db_problem = insert_returning(
+        db,
+        ProblemQuestionReview,
+        question_id=question_id,
+        tg_user_id=tg_user_id,
+        review=review,
+        review_type=review_type,
     )
-    commit_into_db(db, db_problem)
+    db.commit()
     return db_problem
 
 
 def commit_into_db(db: Session, data: Base):
     """
-    Коммит записи в базу и закрытие сессии
+    Коммит записи в базу. Сессию не закрываем: ее дальше использует вызывающий код
     """
     db.add(data)
     db.commit()
-    db.refresh(data)
-    db.close()
 
 
 def remove_tg_user(db: Session, tg_user_id: int) -> None:
@@ -402,10 +581,17 @@ def remove_questions(db: Session, specialty: str) -> None:
     """
     Удаляем вопросы по категории (specialty)
     """
-    db.query(Question).filter(models.Question.question_type == specialty).delete()
+    delete_questions(db, specialty)
     db.commit()
 
 
+def delete_questions(db: Session, specialty: str) -> None:
+    """
+    Удаляем вопросы по категории (specialty). Транзакцию не фиксируем: commit делает вызывающий код
+    """
+    db.query(Question).filter(models.Question.question_type == specialty).delete()
+
+
 def remove_problem_question_review(db: Session, tg_user_id: int, question_id: int) -> None:
     """
     Удаляем замечания пользователя c tg_user_id по вопросy question_id
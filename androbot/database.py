@@ -1,17 +1,113 @@
+from typing import Dict, Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from .config import settings
+from .pool_metrics import MeasuredAsyncQueuePool, MeasuredQueuePool, PoolStatsReporter
+from .query_stats import instrument_engine
+
+SQLALCHEMY_DATABASE_URL = URL.create(
+    "postgresql",
+    username=settings.db_username,
+    password=settings.db_password,
+    host=settings.db_host,
+    port=settings.db_port,
+    database=settings.db_name,
+)
+
+SQLALCHEMY_ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.set(drivername="postgresql+asyncpg")
+
+# Реплика только для чтения с теми же пользователем и базой, если задан DB_REPLICA_HOST
+SQLALCHEMY_ASYNC_REPLICA_URL: Optional[URL] = (
+    SQLALCHEMY_ASYNC_DATABASE_URL.set(host=settings.db_replica_host, port=settings.db_replica_port or settings.db_port)
+    if settings.db_replica_host
+    else None
+)
+
+# Параметры сессии Postgres для всех соединений: имя приложения видно в pg_stat_activity,
+# statement_timeout (в миллисекундах, 0 - без ограничения) не дает зависшему запросу держать соединение пула
+SERVER_SETTINGS = {
+    "application_name": settings.db_application_name,
+    "statement_timeout": str(int(settings.db_statement_timeout * 1000)),
+}
+
+
+def get_libpq_options(server_settings: Dict[str, str]) -> str:
+    """
+    Параметры сессии для psycopg2 в формате libpq: -c name=value, пробелы в значениях экранируем
+    """
+    options = []
+    for name, value in server_settings.items():
+        escaped_value = value.replace("\\", "\\\\").replace(" ", "\\ ")
+        options.append(f"-c {name}={escaped_value}")
+    return " ".join(options)
+
+
+POOL_OPTIONS = dict(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=MeasuredQueuePool,
+    connect_args={"options": get_libpq_options(SERVER_SETTINGS)},
+    **POOL_OPTIONS,
+)
 
-SQLALCHEMY_DATABASE_URL = (
-    f"postgresql://{settings.db_username}:{settings.db_password}@{settings.db_host}"
-    f":{settings.db_port}/{settings.db_name}"
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    poolclass=MeasuredAsyncQueuePool,
+    connect_args={"server_settings": SERVER_SETTINGS},
+    **POOL_OPTIONS,
 )
 
+async_replica_engine = (
+    create_async_engine(
+        SQLALCHEMY_ASYNC_REPLICA_URL,
+        poolclass=MeasuredAsyncQueuePool,
+        connect_args={"server_settings": SERVER_SETTINGS},
+        **POOL_OPTIONS,
+    )
+    if SQLALCHEMY_ASYNC_REPLICA_URL is not None
+    else None
+)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+if async_replica_engine is not None:
+    instrument_engine(async_replica_engine.sync_engine, "replica")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit=False: объекты, полученные из базы, можно читать после await без повторного запроса
+AsyncSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine, class_=AsyncSession
+)
+
+# Без реплики все запросы идут в основную базу
+AsyncReplicaSessionLocal = (
+    sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=async_replica_engine, class_=AsyncSession
+    )
+    if async_replica_engine is not None
+    else None
+)
+
+pool_stats_reporter = PoolStatsReporter(
+    {"async": async_engine.sync_engine, "sync": engine}, interval=settings.db_pool_stats_interval
+)
+if async_replica_engine is not None:
+    pool_stats_reporter.engines["replica"] = async_replica_engine.sync_engine
+
+# Признак в Session.info: сессия работает внутри транзакции update (unit_of_work), commit в crud ее не завершает
+IN_UNIT_OF_WORK = "in_unit_of_work"
+
 Base = declarative_base()
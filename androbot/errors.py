@@ -23,6 +23,10 @@ class TemplateNotFound(BaseAppError):
     pass
 
 
+class WrongTemplateFormat(BaseAppError):
+    pass
+
+
 class TooManyParamsForLoggingActions(BaseAppError):
     pass
 
@@ -33,3 +37,11 @@ class WrongBotScoreFormat(BaseAppError):
 
 class NoCurrentSessionException(BaseAppError):
     pass
+
+
+class WrongQuestionsFileFormat(BaseAppError):
+    pass
+
+
+class UserLockTimeout(BaseAppError):
+    pass
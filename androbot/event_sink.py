@@ -0,0 +1,143 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import insert
+
+from .config import settings
+from .database import async_engine
+from .models import EventsLog
+
+EventRow = Dict[str, Any]
+
+# Маркер остановки: после него буфер сбрасывается и фоновая задача завершается
+_STOP = None
+
+
+async def insert_events(rows: List[EventRow]) -> None:
+    """
+    Сохраняем пачку событий одним multi-row INSERT в одной транзакции
+    """
+    async with async_engine.begin() as conn:
+        await conn.execute(insert(EventsLog).values(rows))
+
+
+class EventSink:
+    """
+    Буфер для записи событий в базу данных.
+    События складываются в очередь и сохраняются пачками: когда набралось batch_size событий
+    или прошло flush_interval секунд с первого события в пачке.
+    Если очередь заполнена, put ждет, пока фоновая задача не освободит место,
+    а put_nowait отбрасывает событие и считает его в dropped.
+    """
+
+    def __init__(
+        self,
+        writer: Callable[[List[EventRow]], Awaitable[None]] = insert_events,
+        batch_size: int = settings.event_sink_batch_size,
+        flush_interval: float = settings.event_sink_flush_interval,
+        max_queue_size: int = settings.event_sink_queue_size,
+    ) -> None:
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """
+        Запускаем фоновую задачу, которая сохраняет события в базу
+        """
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Сохраняем все накопленные события и останавливаем фоновую задачу
+        """
+        if self._queue is None or self._task is None:
+            return
+        queue = self._queue
+        await queue.put(_STOP)
+        await self._task
+        self._queue = None
+        self._task = None
+
+        # События, которые успели добавить в очередь во время остановки
+        rest = [queue.get_nowait() for _ in range(queue.qsize())]
+        rest = [row for row in rest if row is not _STOP]
+        if rest:
+            await self._write(rest)
+
+    async def put(self, row: EventRow) -> None:
+        """
+        Добавляем событие в очередь. Если буфер не запущен (тесты, консольные скрипты) - сохраняем сразу
+        """
+        if self._queue is None:
+            await self._write([row])
+            return
+        await self._queue.put(row)
+
+    def put_nowait(self, row: EventRow) -> None:
+        """
+        Добавляем событие в очередь, не дожидаясь места в ней: для тех, кому нельзя ждать.
+        Если очередь заполнена или буфер не запущен - событие отбрасываем
+        """
+        if self._queue is None:
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        stopped = False
+        while not stopped:
+            row = await self._queue.get()
+            if row is _STOP:
+                break
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopped = True
+                    break
+                batch.append(row)
+            await self._write(batch)
+
+    async def _write(self, batch: List[EventRow]) -> None:
+        try:
+            await self.writer(batch)
+            logger.debug("Saved {} events", len(batch))
+        except Exception as exc:
+            if len(batch) == 1:
+                logger.error("Can't save event {}: {}", batch[0], repr(exc))
+                return
+            # Одно некорректное событие не должно отменять сохранение всей пачки
+            logger.warning("Can't save {} events in one batch, save them one by one: {}", len(batch), repr(exc))
+            for row in batch:
+                await self._write([row])
+
+
+event_sink = EventSink()
@@ -0,0 +1,74 @@
+import itertools
+import time
+from typing import Any, Dict, List, Tuple
+
+from aiogram.bot.api import TelegramAPIServer
+from aiohttp import web
+
+
+class FakeTelegramServer:
+    """
+    Локальный сервер, который отвечает на запросы к Bot API вместо Telegram.
+    Запоминает вызванные методы с параметрами, на sendMessage возвращает отправленное сообщение,
+    на остальные методы - true. Нужен для тестов webhook режима без доступа к Telegram:
+
+        async with FakeTelegramServer() as telegram:
+            bot.server = telegram.api_server
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.requests: List[Tuple[str, Dict[str, Any]]] = []
+        self._message_ids = itertools.count(1)
+        self._runner: web.AppRunner
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def api_server(self) -> TelegramAPIServer:
+        return TelegramAPIServer.from_base(self.base_url)
+
+    def sent_messages(self) -> List[Dict[str, Any]]:
+        """
+        Параметры всех вызовов sendMessage по порядку
+        """
+        return [params for method, params in self.requests if method.lower() == "sendmessage"]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.requests.append((method, params))
+
+        result: Any = True
+        if method.lower() == "sendmessage":
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(str(params["chat_id"])), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Если порт не задан, его выбирает система
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+    async def __aenter__(self) -> "FakeTelegramServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
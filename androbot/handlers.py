@@ -2,10 +2,11 @@ from aiogram import types as aiotypes
 from aiogram.dispatcher import FSMContext
 
 from . import schemas, views
-from .actions import Actions, start_new_test
+from .actions import start_new_test
 from .errors import UserExistsException
-from .main import bot, dp
+from .main import dp, send_text, send_view
 from .types_ import AnswerTypes, DialogueStates, Events, Specialty, UserScore
+from .unit_of_work import unit_of_work
 from .utils import log_event
 
 
@@ -20,31 +21,21 @@ async def send_start_screen(message: aiotypes.Message):
     )
 
     try:
-        with Actions() as act:
-            act.add_user(tg_user)
+        async with unit_of_work() as act:
+            await act.add_user(tg_user)
         view = views.get_hello_message(full_user_name)
-        await bot.send_message(
-            text=view.text,
-            chat_id=message.chat.id,
-            parse_mode=aiotypes.ParseMode.MARKDOWN,
-            reply_markup=view.markup,
-        )
+        await send_view(message.chat.id, view)
 
-        log_event(message.from_user.id, Events.Registration, message.text.replace("/start ", ""))
+        await log_event(message.from_user.id, Events.Registration, message.text.replace("/start ", ""))
 
     except UserExistsException:
         pass
 
     view = views.get_main_menu_view()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
-    log_event(message.from_user.id, Events.Start)
+    await log_event(message.from_user.id, Events.Start)
 
     await DialogueStates.MAIN_MENU.set()
 
@@ -60,26 +51,22 @@ async def after_select_speciality(message: aiotypes.Message, state: FSMContext):
 
     await state.update_data(speciality=new_speciality.value)
 
-    log_event(message.from_user.id, Events.Speciality, new_speciality.value)
+    await log_event(message.from_user.id, Events.Speciality, new_speciality.value)
 
-    with Actions() as act:
-        act.edit_specialty(message.from_user.id, new_speciality)
+    async with unit_of_work() as act:
+        await act.edit_specialty(message.from_user.id, new_speciality)
+        has_started_test = await act.has_started_test(message.from_user.id)
 
-        if act.has_started_test(message.from_user.id):
-            view = views.get_do_you_want_to_reset_test_view()
+    if has_started_test:
+        view = views.get_do_you_want_to_reset_test_view()
 
-            await bot.send_message(
-                text=view.text,
-                chat_id=message.chat.id,
-                parse_mode=aiotypes.ParseMode.MARKDOWN,
-                reply_markup=view.markup,
-            )
+        await send_view(message.chat.id, view)
 
-            log_event(message.from_user.id, Events.AlreadyTried, new_speciality.value)
+        await log_event(message.from_user.id, Events.AlreadyTried, new_speciality.value)
 
-            await DialogueStates.next()
-        else:
-            await select_answer_type(message)
+        await DialogueStates.next()
+    else:
+        await select_answer_type(message)
 
 
 @dp.message_handler(regexp="Начать с начала", state=DialogueStates.HAS_STARTED_TEST)
@@ -88,24 +75,21 @@ async def reset_test_progress(message: aiotypes.Message, state: FSMContext):
     Сбрасываем отвеченные вопросы, и начинаем отвечать заново
     """
     state_data = await state.get_data()
-    log_event(message.from_user.id, Events.ResetProgress, state_data["speciality"])
+    await log_event(message.from_user.id, Events.ResetProgress, state_data["speciality"])
 
-    with Actions() as act:
+    async with unit_of_work() as act:
         tg_user = schemas.TelegramUser(
             tg_user_id=message.from_user.id,
             name=message.from_user.username,
             username=message.from_user.username,
         )
-        act.reset_session(tg_user)
+        await act.reset_session(tg_user)
+    # Сессия завершена: id новой сессии сохраним, когда будет выдан первый вопрос
+    await state.update_data(session_id=None, question_id=None)
 
     view = views.get_resetting_test_view()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await select_answer_type(message)
 
@@ -116,7 +100,7 @@ async def continue_test(message: aiotypes.Message, state: FSMContext):
     Продолжаем отвечать на вопросы теста
     """
     state_data = await state.get_data()
-    log_event(message.from_user.id, Events.ContinueTask, state_data["speciality"])
+    await log_event(message.from_user.id, Events.ContinueTask, state_data["speciality"])
 
     await select_answer_type(message)
 
@@ -128,12 +112,7 @@ async def select_answer_type(message: aiotypes.Message):
 
     view = views.get_select_answer_type_view()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.SELECT_ANSWER_TYPE.set()
 
@@ -147,20 +126,15 @@ async def after_select_answer_type(message: aiotypes.Message, state: FSMContext)
 
     answer_type = message.text.title()
     if answer_type not in start_new_test():
-        await message.reply("Ты выбрал некорректный вариант. Попробуй еще раз.", reply=False)
+        await send_text(message.chat.id, "Ты выбрал некорректный вариант. Попробуй еще раз.")
         return
 
     view = views.get_are_you_ready_for_test_view(answer_type)
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     state_data = await state.get_data()
-    log_event(message.from_user.id, Events.AnswerType, state_data["speciality"], answer_type)
+    await log_event(message.from_user.id, Events.AnswerType, state_data["speciality"], answer_type)
 
     await state.update_data(answer_type=answer_type)
 
@@ -184,14 +158,9 @@ async def back_to_main_menu(message: aiotypes.Message):
     """
     view = views.get_main_menu_view()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
-    log_event(message.from_user.id, Events.Start)
+    await log_event(message.from_user.id, Events.Start)
 
     await DialogueStates.MAIN_MENU.set()
 
@@ -211,22 +180,17 @@ async def get_another_question(message: aiotypes.Message, state: FSMContext):
     """
     state_data = await state.get_data()
 
-    view = views.get_next_question(message.from_user.id, state_data["answer_type"])
+    view = await views.get_next_question(message.from_user.id, state_data["answer_type"])
 
     if not view.question_id:
         await show_user_score(message, state)
         return
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
-    log_event(message.from_user.id, Events.TaskStart, state_data["speciality"], view.question_id)
+    await log_event(message.from_user.id, Events.TaskStart, state_data["speciality"], view.question_id)
 
-    await state.update_data(question_id=view.question_id)
+    await state.update_data(question_id=view.question_id, session_id=view.session_id)
 
     await DialogueStates.ASK_QUESTION.set()
 
@@ -245,18 +209,15 @@ async def not_understand_question(message: aiotypes.Message, state: FSMContext):
         text_answer=message.text,
     )
 
-    with Actions() as act:
-        act.add_question_score(state_data["question_id"], message.from_user.id, score=0)
-        act.add_answer(answer)
+    async with unit_of_work() as act:
+        await act.add_question_score(
+            state_data["question_id"], message.from_user.id, score=0, session_id=state_data.get("session_id")
+        )
+        await act.add_answer(answer, state_data.get("session_id"))
 
     view = views.get_why_do_not_understand()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.DO_NOT_UNDERSTAND.set()
 
@@ -268,7 +229,7 @@ async def get_why_not_understand_question(message: aiotypes.Message, state: FSMC
     """
     state_data = await state.get_data()
 
-    log_event(
+    await log_event(
         message.from_user.id,
         Events.Unclear,
         state_data["speciality"],
@@ -276,19 +237,14 @@ async def get_why_not_understand_question(message: aiotypes.Message, state: FSMC
         message.text,
     )
 
-    with Actions() as act:
-        act.add_problem_question_review(
+    async with unit_of_work() as act:
+        await act.add_problem_question_review(
             state_data["question_id"], message.from_user.id, message.text, AnswerTypes(state_data["answer_type"])
         )
 
     view = views.get_do_you_want_to_get_correct_answer()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.DO_YOU_WANT_GET_ANSWER.set()
 
@@ -309,11 +265,13 @@ async def do_not_know_question(message: aiotypes.Message, state: FSMContext):
         text_answer=message.text,
     )
 
-    with Actions() as act:
-        act.add_question_score(state_data["question_id"], message.from_user.id, score=0)
-        act.add_answer(answer)
+    async with unit_of_work() as act:
+        await act.add_question_score(
+            state_data["question_id"], message.from_user.id, score=0, session_id=state_data.get("session_id")
+        )
+        await act.add_answer(answer, state_data.get("session_id"))
 
-    log_event(
+    await log_event(
         message.from_user.id,
         Events.DontKnow,
         state_data["speciality"],
@@ -322,12 +280,7 @@ async def do_not_know_question(message: aiotypes.Message, state: FSMContext):
 
     view = views.get_do_you_want_to_get_correct_answer()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.DO_YOU_WANT_GET_ANSWER.set()
 
@@ -347,10 +300,10 @@ async def get_answer_from_user(message: aiotypes.Message, state: FSMContext):
     is_text_answer = answer_type == AnswerTypes.TEXT.value
 
     if is_voice_answer and message.content_type != aiotypes.ContentType.VOICE:
-        await message.reply("Ты выбрал вариант - отвечать голосом. Продиктуй ответ.")
+        await send_text(message.chat.id, "Ты выбрал вариант - отвечать голосом. Продиктуй ответ.", message.message_id)
         return
     elif is_text_answer and message.content_type != aiotypes.ContentType.TEXT:
-        await message.reply("Ты выбрал вариант - отвечать текстом. Напиши ответ.")
+        await send_text(message.chat.id, "Ты выбрал вариант - отвечать текстом. Напиши ответ.", message.message_id)
         return
 
     voice_id = None
@@ -365,10 +318,10 @@ async def get_answer_from_user(message: aiotypes.Message, state: FSMContext):
         link_to_audio_answer=voice_id,
     )
 
-    with Actions() as act:
-        act.add_answer(answer)
+    async with unit_of_work() as act:
+        await act.add_answer(answer, state_data.get("session_id"))
 
-    log_event(
+    await log_event(
         message.from_user.id,
         Events.SendSolution,
         state_data["speciality"],
@@ -377,34 +330,27 @@ async def get_answer_from_user(message: aiotypes.Message, state: FSMContext):
         state_data["answer_type"],
     )
 
-    view = views.get_correct_answer(message.from_user.id)
+    view = await views.get_correct_answer(message.from_user.id, state_data["question_id"], state_data.get("session_id"))
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     if view.state:
         await view.state.set()
 
 
 @dp.message_handler(regexp="Эталонный ответ", state=DialogueStates.DO_YOU_WANT_GET_ANSWER)
-async def send_correct_answer_to_user(message: aiotypes.Message):
+async def send_correct_answer_to_user(message: aiotypes.Message, state: FSMContext):
     """
     Отправляет эталонный ответ пользователю
     """
+    state_data = await state.get_data()
 
-    view = views.get_correct_answer(message.from_user.id)
-
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
+    view = await views.get_correct_answer(
+        message.from_user.id, state_data.get("question_id"), state_data.get("session_id")
     )
 
+    await send_view(message.chat.id, view)
+
     if view.state:
         await view.state.set()
 
@@ -418,17 +364,14 @@ async def get_self_score_by_user(message: aiotypes.Message, state: FSMContext):
 
     answer_score = UserScore.by_description(message.text)
 
-    with Actions() as act:
-        act.add_question_score(state_data["question_id"], message.from_user.id, answer_score.value)
+    async with unit_of_work() as act:
+        await act.add_question_score(
+            state_data["question_id"], message.from_user.id, answer_score.value, state_data.get("session_id")
+        )
 
     view = views.get_do_you_want_additional_materials_view()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.ANSWER_SCORED_BY_USER.set()
 
@@ -439,19 +382,14 @@ async def send_additional_materials_to_user(message: aiotypes.Message, state: FS
     Отправляет дополнительные материалы по вопросу
     """
 
-    view = views.get_additional_materials_view(message.from_user.id)
-
     state_data = await state.get_data()
 
-    with Actions() as act:
-        act.add_train_material(state_data["question_id"], message.from_user.id)
+    view = await views.get_additional_materials_view(message.from_user.id, state_data.get("question_id"))
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    async with unit_of_work() as act:
+        await act.add_train_material(state_data["question_id"], message.from_user.id, state_data.get("session_id"))
+
+    await send_view(message.chat.id, view)
 
 
 async def show_user_score(message: aiotypes.Message, state: FSMContext):
@@ -461,19 +399,16 @@ async def show_user_score(message: aiotypes.Message, state: FSMContext):
 
     state_data = await state.get_data()
 
-    with Actions() as act:
-        count_got_additional_materials = len(act.get_train_material(message.from_user.id))
+    async with unit_of_work() as act:
+        session_score = await act.get_session_score(message.from_user.id, state_data.get("session_id"))
 
-    log_event(message.from_user.id, Events.FinishSpeciality, state_data["speciality"], count_got_additional_materials)
+    await log_event(
+        message.from_user.id, Events.FinishSpeciality, state_data["speciality"], session_score.train_materials
+    )
 
-    view = views.get_user_score_view(message.from_user.id)
+    view = views.get_user_score_view(session_score)
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.USER_SCORE.set()
 
@@ -486,12 +421,7 @@ async def show_bot_score_view(message: aiotypes.Message):
 
     view = views.get_bot_score_view()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.next()
 
@@ -503,29 +433,24 @@ async def show_bot_review_view(message: aiotypes.Message, state: FSMContext):
     """
 
     if not message.text.isdigit():
-        await message.reply("Введите оценку от 1 до 10")
+        await send_text(message.chat.id, "Введите оценку от 1 до 10", message.message_id)
         await show_bot_score_view(message)
 
-    with Actions() as act:
+    async with unit_of_work() as act:
         tg_user = schemas.TelegramUser(
             tg_user_id=message.from_user.id,
             name=message.from_user.username,
             username=message.from_user.username,
         )
-        act.add_bot_score(tg_user, int(message.text))
+        await act.add_bot_score(tg_user, int(message.text))
 
     state_data = await state.get_data()
 
-    log_event(message.from_user.id, Events.BotGrade, state_data["speciality"], message.text)
+    await log_event(message.from_user.id, Events.BotGrade, state_data["speciality"], message.text)
 
     view = views.get_bot_review_view()
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.next()
 
@@ -548,27 +473,22 @@ async def save_review_and_finish_view(message: aiotypes.Message, state: FSMConte
         await show_bot_review_view(message)
         return
 
-    with Actions() as act:
+    async with unit_of_work() as act:
         tg_user = schemas.TelegramUser(
             tg_user_id=message.from_user.id,
             name=message.from_user.username,
             username=message.from_user.username,
         )
-        act.add_bot_review(tg_user, review, review_type)
+        await act.add_bot_review(tg_user, review, review_type)
 
     state_data = await state.get_data()
 
-    log_event(message.from_user.id, Events.BotReview, state_data["speciality"], message.text)
+    await log_event(message.from_user.id, Events.BotReview, state_data["speciality"], message.text)
 
     view = views.get_finish_view()
 
-    log_event(message.from_user.id, Events.Thanks)
+    await log_event(message.from_user.id, Events.Thanks)
 
-    await bot.send_message(
-        text=view.text,
-        chat_id=message.chat.id,
-        parse_mode=aiotypes.ParseMode.MARKDOWN,
-        reply_markup=view.markup,
-    )
+    await send_view(message.chat.id, view)
 
     await DialogueStates.next()
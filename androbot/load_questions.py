@@ -1,9 +1,9 @@
 import argparse
 import os
 
-from androbot import models
 from androbot.actions import Actions
-from androbot.database import engine
+from androbot.errors import WrongQuestionsFileFormat
+from androbot.migrate import upgrade_database
 from androbot.types_ import Specialty
 
 
@@ -12,17 +12,32 @@ def load_questions(speciality: Specialty, filename: str, drop_questions: bool) -
     Загружаем в базу данных вопросы из указанного csv файла.
     Указываем специальность для которой нужно загрузить вопросы
     Если указан параметр drop_questions - то удаляем старые
-    вопросы перед загрузкой (если нет еще ответов - сработает)
+    вопросы в той же транзакции, что и загрузку (если нет еще ответов - сработает)
     """
 
-    models.Base.metadata.create_all(bind=engine)
+    upgrade_database()
 
     with Actions() as act:
+        report = act.load_questions(specialty=speciality, file=filename, drop_questions=drop_questions)
 
-        if drop_questions:
-            act.remove_questions(speciality.value)
+    print(f"Loaded {report}")
 
-        act.load_questions(specialty=speciality, file=filename)
+
+def sync_questions(speciality: Specialty, filename: str, dry_run: bool) -> None:
+    """
+    Синхронизируем вопросы в базе данных с указанным csv файлом, сохраняя id вопросов.
+    Печатаем разницу: + новый вопрос, ~ измененный, - выведенный из оборота.
+    Если указан параметр dry_run - только показываем разницу, ничего не меняя
+    """
+
+    upgrade_database()
+
+    with Actions() as act:
+        report = act.sync_questions(specialty=speciality, file=filename, dry_run=dry_run)
+
+    for line in report.diff():
+        print(line)
+    print(f"{'Would sync' if dry_run else 'Synced'}: {report}")
 
 
 def main():
@@ -35,6 +50,10 @@ def main():
         default=Specialty.ANDROID,
     )
     parser.add_argument("-d", "--drop_questions", help="drop questions before load", action="store_true")
+    parser.add_argument(
+        "--sync", help="update questions in place: add new, update changed, retire removed", action="store_true"
+    )
+    parser.add_argument("--dry-run", help="show what --sync would change without changing it", action="store_true")
     args = parser.parse_args()
 
     if not os.path.exists(args.filename):
@@ -43,7 +62,13 @@ def main():
 
     speciality = Specialty(args.speciality)
 
-    load_questions(speciality, args.filename, args.drop_questions)
+    try:
+        if args.sync or args.dry_run:
+            sync_questions(speciality, args.filename, args.dry_run)
+        else:
+            load_questions(speciality, args.filename, args.drop_questions)
+    except WrongQuestionsFileFormat as e:
+        print(f"Questions were not loaded: {e}")
 
 
 if __name__ == "__main__":
@@ -1,15 +1,41 @@
 import logging
+from functools import partial
+from typing import Optional
 
-from aiogram import Bot, Dispatcher, executor
+from aiogram import Dispatcher, executor
+from aiogram import types as aiotypes
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.contrib.fsm_storage.redis import RedisStorage2
+from aiogram.dispatcher.webhook import SendMessage
 from loguru import logger
 
-from . import models
 from .config import settings
-from .database import engine
-
-models.Base.metadata.create_all(bind=engine)
+from .database import AsyncSessionLocal, async_engine, pool_stats_reporter
+from .event_sink import EventSink, event_sink
+from .metrics import (
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_OVERFLOW,
+    QUEUE_DROPPED,
+    QUEUE_SIZE,
+    UPDATES_RUNNING,
+    MeasuredBot,
+    MeasuredStorage,
+    MetricsMiddleware,
+    default_registry,
+    metrics_server,
+)
+from .migrate import upgrade_database
+from .outbox import outbox
+from .query_stats import QueryStatsMiddleware
+from .question_bank import question_bank
+from .templates import template_registry
+from .tracing import TraceExporter, TracingMiddleware, span
+from .types_ import View
+from .unit_of_work import UnitOfWorkMiddleware, get_unit_of_work
+from .update_scheduler import update_scheduler
+from .views import build_static_views
+from .webhook import reply_in_webhook, send_via_api, webhook_reply
 
 
 class InterceptHandler(logging.Handler):
@@ -32,7 +58,10 @@ class InterceptHandler(logging.Handler):
 logging.basicConfig(handlers=[InterceptHandler()], level=0)
 
 # Initialize bot and dispatcher
-bot = Bot(token=settings.tg_api_token)
+if settings.telegram_api_server:
+    bot = MeasuredBot(token=settings.tg_api_token, server=TelegramAPIServer.from_base(settings.telegram_api_server))
+else:
+    bot = MeasuredBot(token=settings.tg_api_token)
 
 if settings.fsm_redis_host:
     storage = RedisStorage2(
@@ -45,8 +74,125 @@ if settings.fsm_redis_host:
 else:
     storage = MemoryStorage()
 
-dp = Dispatcher(bot, storage=storage)
+dp = Dispatcher(bot, storage=MeasuredStorage(storage))
+
+trace_exporter = TraceExporter(settings.tracing_file, settings.tracing_otlp_endpoint)
+# Законченные span копятся в буфере и выгружаются пачками в фоне, как события в event_sink.
+# Если буфер переполнен, span отбрасываются (androbot_queue_dropped_total{queue="traces"})
+trace_sink = EventSink(
+    writer=trace_exporter.export,
+    batch_size=settings.tracing_batch_size,
+    flush_interval=settings.tracing_flush_interval,
+)
+
+# Транзакция update фиксируется раньше, чем update_scheduler пустит следующий update того же чата
+dp.middleware.setup(UnitOfWorkMiddleware())
+dp.middleware.setup(TracingMiddleware(trace_sink.put_nowait, enabled=trace_exporter.enabled))
+dp.middleware.setup(update_scheduler)
+# Подключается последним: итог по запросам update пишется после commit транзакции
+dp.middleware.setup(QueryStatsMiddleware())
+dp.middleware.setup(MetricsMiddleware())
+
+
+def collect_queue_metrics() -> None:
+    """
+    Длины очередей и состояние пулов соединений на момент запроса метрик
+    """
+    scheduler_stats = update_scheduler.stats()
+    UPDATES_RUNNING.set(scheduler_stats.running)
+    QUEUE_SIZE.set(scheduler_stats.waiting, queue="updates")
+    QUEUE_SIZE.set(outbox.qsize(), queue="outbox")
+    QUEUE_SIZE.set(event_sink.qsize(), queue="event_sink")
+    QUEUE_SIZE.set(trace_sink.qsize(), queue="traces")
+    QUEUE_DROPPED.inc(trace_sink.dropped - QUEUE_DROPPED.get(queue="traces"), queue="traces")
+    for name, pool_stats in pool_stats_reporter.stats().items():
+        DB_POOL_CHECKED_OUT.set(pool_stats.checked_out, engine=name)
+        DB_POOL_OVERFLOW.set(pool_stats.overflow, engine=name)
+
+
+default_registry.add_collector(collect_queue_metrics)
+
+
+async def send_view(chat_id: int, view: View) -> None:
+    """
+    Отправляет View пользователю через очередь исходящих сообщений.
+    В webhook режиме последнее сообщение обработчика уходит в ответе на webhook, а не отдельным запросом к Bot API
+    """
+    await _send(SendMessage(chat_id, view.text, parse_mode=aiotypes.ParseMode.MARKDOWN, reply_markup=view.markup))
+
+
+async def send_text(chat_id: int, text: str, reply_to_message_id: Optional[int] = None) -> None:
+    """
+    Отправляет текст пользователю так же, как send_view, но не меняя клавиатуру пользователя
+    """
+    await _send(SendMessage(chat_id, text, reply_to_message_id=reply_to_message_id))
+
+
+async def _send(message: SendMessage) -> None:
+    unit = get_unit_of_work()
+    if unit is not None and not unit.failed:
+        # Ответ обработчика уходит после commit транзакции update (при ошибке обработчика - не уходит вовсе).
+        # Сообщение из обработчика ошибок (unit.failed) отправляется сразу
+        unit.sends.append(partial(_deliver, message))
+        return
+    await _deliver(message)
+
+
+async def _deliver(message: SendMessage) -> None:
+    reply = webhook_reply.get()
+    with span("send_message", chat_id=message.chat_id, webhook_reply=reply is not None):
+        if reply is not None:
+            await reply.send(bot, message)
+        else:
+            await send_via_api(bot, message)
+
+
+async def on_startup(dispatcher: Dispatcher):
+    template_registry.load()
+    build_static_views()
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(question_bank.reload)
+    await event_sink.start()
+    await outbox.start()
+    await pool_stats_reporter.start()
+    await metrics_server.start()
+    if trace_exporter.enabled:
+        await trace_sink.start()
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    await trace_sink.stop()
+    await trace_exporter.close()
+    await metrics_server.stop()
+    await pool_stats_reporter.stop()
+    await outbox.stop()
+    await event_sink.stop()
+    await async_engine.dispose()
+
+
+async def on_startup_webhook(dispatcher: Dispatcher):
+    await on_startup(dispatcher)
+    await dispatcher.bot.set_webhook(
+        f"{settings.webhook_host}{settings.webhook_path}", max_connections=settings.webhook_max_connections
+    )
 
 
 def main(dispatcher: Dispatcher):
-    executor.start_polling(dispatcher, skip_updates=True)
+    # Миграции применяем при запуске бота, а не при импорте модуля: воркеры и тесты импортируют его без миграций
+    upgrade_database()
+
+    if not settings.webhook_host:
+        executor.start_polling(dispatcher, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
+        return
+
+    # Webhook не удаляем при остановке: за балансировщиком могут продолжать работать другие реплики бота
+    if settings.webhook_reply:
+        reply_in_webhook(dispatcher)
+    executor.start_webhook(
+        dispatcher,
+        webhook_path=settings.webhook_path,
+        on_startup=on_startup_webhook,
+        on_shutdown=on_shutdown,
+        host=settings.webapp_host,
+        port=settings.webapp_port,
+    )
@@ -0,0 +1,383 @@
+import bisect
+import math
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import Bot, types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.dispatcher.storage import BaseStorage
+from aiohttp import web
+
+from .config import settings
+from .tracing import span
+
+LabelValues = Tuple[str, ...]
+
+# Границы корзин гистограмм по умолчанию (в секундах): от 5 мс до 10 с
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Значение метки для состояния FSM, которое не известно (обработчик для любого состояния) или не задано
+_ANY_STATE = "*"
+_NO_STATE = "none"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Метрика в формате Prometheus: имя, описание и значения по наборам меток
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        (registry if registry is not None else default_registry).register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Счетчик, который только растет
+    """
+
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    """
+    Текущее значение, например длина очереди
+    """
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self, size: int) -> None:
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    """
+    Распределение значений (обычно длительностей) по корзинам: по нему считаются перцентили, например p99
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, _HistogramValue] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        histogram = self._values.get(key)
+        if histogram is None:
+            histogram = self._values[key] = _HistogramValue(len(self.buckets))
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            histogram.buckets[index] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+    def get_count(self, **labels: str) -> int:
+        histogram = self._values.get(self._key(labels))
+        return histogram.count if histogram is not None else 0
+
+    def _render_samples(self) -> List[str]:
+        lines = []
+        bucket_labelnames = self.labelnames + ("le",)
+        for key, histogram in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.buckets):
+                cumulative += count
+                labels = _format_labels(bucket_labelnames, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(bucket_labelnames, key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {histogram.count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(histogram.sum)}")
+            lines.append(f"{self.name}_count{labels} {histogram.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса. Перед выдачей вызываются collectors: они обновляют метрики,
+    которые дешевле прочитать в момент запроса, чем обновлять на каждое событие (длины очередей и т.п.)
+    """
+
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> None:
+        self.metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+default_registry = MetricsRegistry()
+
+
+class MetricsServer:
+    """
+    HTTP сервер, который отдает метрики в текстовом формате Prometheus по GET /metrics
+    """
+
+    def __init__(self, host: str, port: int, registry: MetricsRegistry = default_registry) -> None:
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        if self._runner is not None or not self.port:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner is None:
+            return
+        await self._runner.cleanup()
+        self._runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+
+metrics_server = MetricsServer(settings.metrics_host, settings.metrics_port)
+
+HANDLER_DURATION = Histogram(
+    "androbot_handler_duration_seconds", "Время обработки update обработчиком бота", ["handler", "status"]
+)
+HANDLER_ERRORS = Counter("androbot_handler_errors_total", "Ошибки в обработчиках бота", ["handler", "error"])
+TRANSITION_DURATION = Histogram(
+    "androbot_transition_duration_seconds",
+    "Время обработки update по переходам между состояниями диалога",
+    ["from_state", "to_state"],
+)
+DB_QUERY_DURATION = Histogram("androbot_db_query_duration_seconds", "Время выполнения запроса к базе", ["engine"])
+FSM_DURATION = Histogram("androbot_fsm_duration_seconds", "Время обращения к хранилищу состояний FSM", ["operation"])
+BOT_API_DURATION = Histogram("androbot_bot_api_duration_seconds", "Время запроса к Bot API", ["method"])
+BOT_API_ERRORS = Counter("androbot_bot_api_errors_total", "Ошибки запросов к Bot API", ["method", "error"])
+QUEUE_SIZE = Gauge("androbot_queue_size", "Длина очередей бота", ["queue"])
+QUEUE_DROPPED = Counter("androbot_queue_dropped_total", "Отброшено из-за переполненной очереди", ["queue"])
+UPDATES_RUNNING = Gauge("androbot_updates_running", "Сколько update обрабатывается сейчас")
+DB_POOL_CHECKED_OUT = Gauge("androbot_db_pool_checked_out", "Сколько соединений пула сейчас выдано", ["engine"])
+DB_POOL_OVERFLOW = Gauge("androbot_db_pool_overflow", "Сколько соединений открыто сверх размера пула", ["engine"])
+
+
+class _UpdateTiming:
+    __slots__ = ("handler", "started_at", "from_state", "to_state", "error")
+
+    def __init__(self) -> None:
+        self.handler: Optional[str] = None
+        self.started_at = 0.0
+        self.from_state = _ANY_STATE
+        self.to_state: Optional[str] = None
+        self.error: Optional[str] = None
+
+
+_current_timing: ContextVar[Optional[_UpdateTiming]] = ContextVar("metrics_update_timing", default=None)
+
+# Ключ в data middleware, под которым хранится замер update
+_TIMING_KEY = "metrics_timing"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Замеряет время обработки update: по обработчикам и по переходам между состояниями диалога.
+    Отсчет идет от вызова обработчика до конца обработки update, поэтому в него входит commit транзакции
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict) -> None:
+        timing = _UpdateTiming()
+        data[_TIMING_KEY] = timing, _current_timing.set(timing)
+
+    async def on_process_message(self, message: types.Message, data: dict) -> None:
+        self._start_handler(data)
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict) -> None:
+        self._start_handler(data)
+
+    def _start_handler(self, data: dict) -> None:
+        timing = _current_timing.get()
+        handler = current_handler.get(None)
+        if timing is None or handler is None:
+            return
+        timing.handler = handler.__name__
+        timing.started_at = time.perf_counter()
+        if "raw_state" in data:
+            timing.from_state = data["raw_state"] or _NO_STATE
+
+    async def on_pre_process_error(self, update: types.Update, exception: BaseException, data: dict) -> None:
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.error = type(exception).__name__
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict) -> None:
+        if _TIMING_KEY not in data:
+            return
+        timing, token = data.pop(_TIMING_KEY)
+        _current_timing.reset(token)
+        if timing.handler is None:
+            return
+        duration = time.perf_counter() - timing.started_at
+        HANDLER_DURATION.observe(duration, handler=timing.handler, status="error" if timing.error else "ok")
+        if timing.error is not None:
+            HANDLER_ERRORS.inc(handler=timing.handler, error=timing.error)
+        to_state = timing.to_state if timing.to_state is not None else timing.from_state
+        TRANSITION_DURATION.observe(duration, from_state=timing.from_state, to_state=to_state)
+
+
+class MeasuredStorage(BaseStorage):
+    """
+    Хранилище состояний FSM, которое замеряет время обращений к storage и запоминает новое состояние диалога
+    """
+
+    def __init__(self, storage: BaseStorage) -> None:
+        self.storage = storage
+
+    async def _measure(self, operation: str, call):
+        started_at = time.perf_counter()
+        try:
+            with span(f"fsm {operation}"):
+                return await call
+        finally:
+            FSM_DURATION.observe(time.perf_counter() - started_at, operation=operation)
+
+    @staticmethod
+    def _set_to_state(state) -> None:
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.to_state = BaseStorage.resolve_state(state) or _NO_STATE
+
+    async def close(self):
+        await self.storage.close()
+
+    async def wait_closed(self):
+        await self.storage.wait_closed()
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        return await self._measure("get_state", self.storage.get_state(chat=chat, user=user, default=default))
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        return await self._measure("get_data", self.storage.get_data(chat=chat, user=user, default=default))
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        self._set_to_state(state)
+        return await self._measure("set_state", self.storage.set_state(chat=chat, user=user, state=state))
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        return await self._measure("set_data", self.storage.set_data(chat=chat, user=user, data=data))
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        return await self._measure("update_data", self.storage.update_data(chat=chat, user=user, data=data, **kwargs))
+
+    async def reset_data(self, *, chat=None, user=None):
+        return await self._measure("reset_data", self.storage.reset_data(chat=chat, user=user))
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        self._set_to_state(None)
+        return await self._measure("reset_state", self.storage.reset_state(chat=chat, user=user, with_data=with_data))
+
+    async def finish(self, *, chat=None, user=None):
+        self._set_to_state(None)
+        return await self._measure("finish", self.storage.finish(chat=chat, user=user))
+
+    def has_bucket(self):
+        return self.storage.has_bucket()
+
+    async def get_bucket(self, *, chat=None, user=None, default=None):
+        return await self.storage.get_bucket(chat=chat, user=user, default=default)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        return await self.storage.set_bucket(chat=chat, user=user, bucket=bucket)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        return await self.storage.update_bucket(chat=chat, user=user, bucket=bucket, **kwargs)
+
+    async def reset_bucket(self, *, chat=None, user=None):
+        return await self.storage.reset_bucket(chat=chat, user=user)
+
+
+class MeasuredBot(Bot):
+    """
+    Bot, который замеряет время запросов к Bot API и считает ошибки по методам API
+    """
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception as e:
+            BOT_API_ERRORS.inc(method=method, error=type(e).__name__)
+            raise
+        finally:
+            BOT_API_DURATION.observe(time.perf_counter() - started_at, method=method)
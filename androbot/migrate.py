@@ -0,0 +1,74 @@
+import argparse
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from loguru import logger
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+
+from androbot.database import engine
+
+MIGRATIONS_FOLDER = Path(__file__).parent / "migrations"
+
+# Ревизия, соответствующая схеме, которую создавал Base.metadata.create_all до появления миграций
+LEGACY_REVISION = "0001"
+
+
+def get_config() -> Config:
+    """
+    Конфигурация alembic без alembic.ini: миграции лежат внутри пакета androbot
+    """
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_FOLDER))
+    return config
+
+
+def _disable_statement_timeout(connection: Connection) -> None:
+    """
+    DB_STATEMENT_TIMEOUT рассчитан на запросы бота, миграция (например, построение индекса) может идти дольше
+    """
+    connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+
+
+def upgrade_database(db_engine: Engine = engine, revision: str = "head") -> None:
+    """
+    Применяем к базе данных миграции до ревизии revision.
+    База, созданная через create_all без миграций, сначала помечается ревизией LEGACY_REVISION
+    """
+    config = get_config()
+    with db_engine.begin() as connection:
+        _disable_statement_timeout(connection)
+        config.attributes["connection"] = connection
+        tables = inspect(connection).get_table_names()
+        if "alembic_version" not in tables and "tg_users" in tables:
+            logger.info("Database was created without migrations, stamp it with revision {}", LEGACY_REVISION)
+            command.stamp(config, LEGACY_REVISION)
+        command.upgrade(config, revision)
+
+
+def downgrade_database(db_engine: Engine = engine, revision: str = "-1") -> None:
+    """
+    Откатываем миграции базы данных до ревизии revision
+    """
+    config = get_config()
+    with db_engine.begin() as connection:
+        _disable_statement_timeout(connection)
+        config.attributes["connection"] = connection
+        command.downgrade(config, revision)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["upgrade", "downgrade"], help="apply or revert migrations")
+    parser.add_argument("revision", nargs="?", help="target revision (head for upgrade, -1 for downgrade by default)")
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        upgrade_database(revision=args.revision or "head")
+    else:
+        downgrade_database(revision=args.revision or "-1")
+
+
+if __name__ == "__main__":
+    main()
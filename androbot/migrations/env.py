@@ -0,0 +1,42 @@
+from alembic import context
+from sqlalchemy import create_engine
+
+from androbot import models
+from androbot.database import SQLALCHEMY_DATABASE_URL
+
+target_metadata = models.Base.metadata
+
+
+def run_migrations_offline():
+    """
+    Генерируем SQL скрипт миграций без подключения к базе данных (alembic upgrade --sql)
+    """
+    context.configure(url=SQLALCHEMY_DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """
+    Применяем миграции к базе данных.
+    Если соединение передано из androbot.migrate - используем его
+    """
+    connection = context.config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
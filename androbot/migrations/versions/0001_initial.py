@@ -0,0 +1,164 @@
+"""initial schema
+
+Схема базы данных в том виде, в котором ее создавал Base.metadata.create_all до появления миграций
+
+Revision ID: 0001
+Revises:
+Create Date: 2021-08-02 12:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "tg_users",
+        sa.Column("tg_user_id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("specialty", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("tg_user_id"),
+    )
+    op.create_index("ix_tg_users_name", "tg_users", ["name"])
+    op.create_index("ix_tg_users_specialty", "tg_users", ["specialty"])
+    op.create_index("ix_tg_users_tg_user_id", "tg_users", ["tg_user_id"])
+    op.create_index("ix_tg_users_username", "tg_users", ["username"], unique=True)
+
+    op.create_table(
+        "question",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("question_type", sa.String(), nullable=True),
+        sa.Column("question_category", sa.String(), nullable=True),
+        sa.Column("text_question", sa.String(), nullable=True),
+        sa.Column("text_answer", sa.String(), nullable=True),
+        sa.Column("additional_info", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_question_id", "question", ["id"])
+    op.create_index("ix_question_question_type", "question", ["question_type"])
+
+    op.create_table(
+        "events",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("tg_user_id", sa.Integer(), nullable=True),
+        sa.Column("event_type", sa.String(), nullable=True),
+        sa.Column("datetime", sa.DateTime(), nullable=True),
+        sa.Column("param1", sa.String(), nullable=True),
+        sa.Column("param2", sa.String(), nullable=True),
+        sa.Column("param3", sa.String(), nullable=True),
+        sa.Column("param4", sa.String(), nullable=True),
+        sa.Column("param5", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["tg_user_id"], ["tg_users.tg_user_id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_events_event_type", "events", ["event_type"])
+    op.create_index("ix_events_id", "events", ["id"])
+    for param in ("param1", "param2", "param3", "param4", "param5"):
+        op.create_index(f"ix_events_{param}", "events", [param])
+
+    op.create_table(
+        "session",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("tg_user_id", sa.Integer(), nullable=True),
+        sa.Column("quest_id", sa.Integer(), nullable=True),
+        sa.Column("is_finished", sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(["quest_id"], ["question.id"]),
+        sa.ForeignKeyConstraint(["tg_user_id"], ["tg_users.tg_user_id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_session_id", "session", ["id"])
+
+    op.create_table(
+        "bot_review",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("tg_user_id", sa.Integer(), nullable=True),
+        sa.Column("bot_score", sa.Integer(), nullable=True),
+        sa.Column("bot_review", sa.String(), nullable=True),
+        sa.Column("bot_review_type", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["tg_user_id"], ["tg_users.tg_user_id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_bot_review_bot_review", "bot_review", ["bot_review"])
+    op.create_index("ix_bot_review_bot_review_type", "bot_review", ["bot_review_type"])
+    op.create_index("ix_bot_review_bot_score", "bot_review", ["bot_score"])
+    op.create_index("ix_bot_review_id", "bot_review", ["id"])
+
+    op.create_table(
+        "problem_question_review",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("question_id", sa.Integer(), nullable=True),
+        sa.Column("tg_user_id", sa.Integer(), nullable=True),
+        sa.Column("review", sa.String(), nullable=True),
+        sa.Column("review_type", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["question_id"], ["question.id"]),
+        sa.ForeignKeyConstraint(["tg_user_id"], ["tg_users.tg_user_id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_problem_question_review_id", "problem_question_review", ["id"])
+    op.create_index("ix_problem_question_review_review", "problem_question_review", ["review"])
+    op.create_index("ix_problem_question_review_review_type", "problem_question_review", ["review_type"])
+
+    op.create_table(
+        "answer",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("quest_id", sa.Integer(), nullable=True),
+        sa.Column("session_id", sa.Integer(), nullable=True),
+        sa.Column("tg_user_id", sa.Integer(), nullable=True),
+        sa.Column("answer_type", sa.String(), nullable=True),
+        sa.Column("text_answer", sa.String(), nullable=True),
+        sa.Column("link_to_audio_answer", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["quest_id"], ["question.id"]),
+        sa.ForeignKeyConstraint(["session_id"], ["session.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_answer_answer_type", "answer", ["answer_type"])
+    op.create_index("ix_answer_id", "answer", ["id"])
+    op.create_index("ix_answer_tg_user_id", "answer", ["tg_user_id"])
+
+    op.create_table(
+        "question_score",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("tg_user_id", sa.Integer(), nullable=True),
+        sa.Column("question_id", sa.Integer(), nullable=True),
+        sa.Column("session_id", sa.Integer(), nullable=True),
+        sa.Column("score", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["question_id"], ["question.id"]),
+        sa.ForeignKeyConstraint(["session_id"], ["session.id"]),
+        sa.ForeignKeyConstraint(["tg_user_id"], ["tg_users.tg_user_id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_question_score_id", "question_score", ["id"])
+    op.create_index("ix_question_score_score", "question_score", ["score"])
+
+    op.create_table(
+        "additional_info",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("question_id", sa.Integer(), nullable=True),
+        sa.Column("session_id", sa.Integer(), nullable=True),
+        sa.Column("tg_user_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["question_id"], ["question.id"]),
+        sa.ForeignKeyConstraint(["session_id"], ["session.id"]),
+        sa.ForeignKeyConstraint(["tg_user_id"], ["tg_users.tg_user_id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_additional_info_id", "additional_info", ["id"])
+
+
+def downgrade():
+    op.drop_table("additional_info")
+    op.drop_table("question_score")
+    op.drop_table("answer")
+    op.drop_table("problem_question_review")
+    op.drop_table("bot_review")
+    op.drop_table("session")
+    op.drop_table("events")
+    op.drop_table("question")
+    op.drop_table("tg_users")
@@ -0,0 +1,29 @@
+"""session question deck
+
+Перемешанная колода вопросов сессии и курсор в ней
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2021-08-09 12:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("session", sa.Column("question_deck", postgresql.ARRAY(sa.Integer()), nullable=True))
+    op.add_column("session", sa.Column("deck_position", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("session", "deck_position")
+    op.drop_column("session", "question_deck")
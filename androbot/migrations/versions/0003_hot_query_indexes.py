@@ -0,0 +1,58 @@
+"""hot query indexes
+
+Составные индексы под запросы из crud.py вместо одиночных индексов,
+которые не используются в запросах и только замедляют вставку
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2021-08-16 12:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+EVENT_PARAMS = ("param1", "param2", "param3", "param4", "param5")
+
+
+def upgrade():
+    for param in EVENT_PARAMS:
+        op.drop_index(f"ix_events_{param}", table_name="events")
+    op.drop_index("ix_bot_review_bot_review", table_name="bot_review")
+    op.drop_index("ix_problem_question_review_review", table_name="problem_question_review")
+    op.drop_index("ix_answer_tg_user_id", table_name="answer")
+
+    op.create_index(
+        "ix_session_unfinished",
+        "session",
+        ["tg_user_id"],
+        postgresql_where=sa.text("NOT is_finished"),
+    )
+    op.create_index("ix_answer_tg_user_id_session_id", "answer", ["tg_user_id", "session_id"])
+    op.create_index("ix_answer_session_id_quest_id", "answer", ["session_id", "quest_id"])
+    op.create_index(
+        "ix_question_score_tg_user_id_session_id_question_id",
+        "question_score",
+        ["tg_user_id", "session_id", "question_id"],
+    )
+    op.create_index("ix_additional_info_tg_user_id_session_id", "additional_info", ["tg_user_id", "session_id"])
+
+
+def downgrade():
+    op.drop_index("ix_additional_info_tg_user_id_session_id", table_name="additional_info")
+    op.drop_index("ix_question_score_tg_user_id_session_id_question_id", table_name="question_score")
+    op.drop_index("ix_answer_session_id_quest_id", table_name="answer")
+    op.drop_index("ix_answer_tg_user_id_session_id", table_name="answer")
+    op.drop_index("ix_session_unfinished", table_name="session")
+
+    op.create_index("ix_answer_tg_user_id", "answer", ["tg_user_id"])
+    op.create_index("ix_problem_question_review_review", "problem_question_review", ["review"])
+    op.create_index("ix_bot_review_bot_review", "bot_review", ["bot_review"])
+    for param in EVENT_PARAMS:
+        op.create_index(f"ix_events_{param}", "events", [param])
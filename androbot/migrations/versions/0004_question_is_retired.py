@@ -0,0 +1,26 @@
+"""question is_retired
+
+Признак вопроса, удаленного из csv файла при синхронизации банка вопросов
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2021-08-23 12:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("question", sa.Column("is_retired", sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    op.drop_column("question", "is_retired")
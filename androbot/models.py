@@ -1,6 +1,7 @@
 import datetime as datetime
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String, false, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -19,11 +20,15 @@ class TelegramUser(Base):
 
 class Answer(Base):
     __tablename__ = "answer"
+    __table_args__ = (
+        Index("ix_answer_tg_user_id_session_id", "tg_user_id", "session_id"),
+        Index("ix_answer_session_id_quest_id", "session_id", "quest_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True, nullable=False)
     quest_id = Column(Integer, ForeignKey("question.id"))
     session_id = Column(Integer, ForeignKey("session.id"))
-    tg_user_id = Column(Integer, primary_key=False, unique=False, index=True)
+    tg_user_id = Column(Integer, primary_key=False, unique=False, index=False)
     answer_type = Column(String, unique=False, index=True)
     text_answer = Column(String, unique=False, index=False)
     link_to_audio_answer = Column(String, unique=False, index=False)
@@ -38,16 +43,21 @@ class Question(Base):
     text_question = Column(String, unique=False, index=False)
     text_answer = Column(String, unique=False, index=False)
     additional_info = Column(String, unique=False, index=False)
+    # Вопрос удален из csv файла: новым сессиям не выдается, но остается в базе для истории ответов
+    is_retired = Column(Boolean, unique=False, index=False, nullable=False, default=False, server_default=false())
     question = relationship("Answer")
 
 
 class CurrentSession(Base):
     __tablename__ = "session"
+    __table_args__ = (Index("ix_session_unfinished", "tg_user_id", postgresql_where=text("NOT is_finished")),)
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True, nullable=False)
     tg_user_id = Column(Integer, ForeignKey("tg_users.tg_user_id"))
     quest_id = Column(Integer, ForeignKey("question.id"))
     is_finished = Column(Boolean, unique=False, index=False, default=False)
+    question_deck = Column(ARRAY(Integer), unique=False, index=False, nullable=True)
+    deck_position = Column(Integer, unique=False, index=False, default=0)
 
 
 class EventsLog(Base):
@@ -57,11 +67,11 @@ class EventsLog(Base):
     tg_user_id = Column(Integer, ForeignKey("tg_users.tg_user_id"))
     event_type = Column(String, unique=False, index=True)
     datetime = Column(DateTime, default=datetime.datetime.utcnow)
-    param1 = Column(String, unique=False, index=True)
-    param2 = Column(String, unique=False, index=True)
-    param3 = Column(String, unique=False, index=True)
-    param4 = Column(String, unique=False, index=True)
-    param5 = Column(String, unique=False, index=True)
+    param1 = Column(String, unique=False, index=False)
+    param2 = Column(String, unique=False, index=False)
+    param3 = Column(String, unique=False, index=False)
+    param4 = Column(String, unique=False, index=False)
+    param5 = Column(String, unique=False, index=False)
 
 
 class BotReview(Base):
@@ -70,12 +80,15 @@ class BotReview(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True, nullable=False)
     tg_user_id = Column(Integer, ForeignKey("tg_users.tg_user_id"))
     bot_score = Column(Integer, unique=False, index=True, nullable=True)
-    bot_review = Column(String, unique=False, index=True, nullable=True)
+    bot_review = Column(String, unique=False, index=False, nullable=True)
     bot_review_type = Column(String, unique=False, index=True, nullable=True)
 
 
 class QuestionScore(Base):
     __tablename__ = "question_score"
+    __table_args__ = (
+        Index("ix_question_score_tg_user_id_session_id_question_id", "tg_user_id", "session_id", "question_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True, nullable=False)
     tg_user_id = Column(Integer, ForeignKey("tg_users.tg_user_id"))
@@ -90,12 +103,13 @@ class ProblemQuestionReview(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True, nullable=False)
     question_id = Column(Integer, ForeignKey("question.id"))
     tg_user_id = Column(Integer, ForeignKey("tg_users.tg_user_id"))
-    review = Column(String, unique=False, index=True)
+    review = Column(String, unique=False, index=False)
     review_type = Column(String, unique=False, index=True)
 
 
 class AdditionalInfo(Base):
     __tablename__ = "additional_info"
+    __table_args__ = (Index("ix_additional_info_tg_user_id_session_id", "tg_user_id", "session_id"),)
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True, nullable=False)
     question_id = Column(Integer, ForeignKey("question.id"))
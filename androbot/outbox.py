@@ -0,0 +1,273 @@
+import asyncio
+import heapq
+import itertools
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from aiogram.utils.exceptions import RetryAfter
+from loguru import logger
+
+from .config import settings
+
+SendCall = Callable[[], Awaitable[Any]]
+
+# Как часто (в секундах) забывать лимиты чатов, которые ничего не отправляют
+_IDLE_CHATS_CLEANUP_INTERVAL = 60.0
+
+# Если за столько секунд RetryAfter пришел в несколько чатов, уперлись в общий лимит бота, а не в лимит чата
+_GLOBAL_FLOOD_WINDOW = 1.0
+
+
+class TokenBucket:
+    """
+    Ограничение частоты: rate токенов в секунду, но не больше capacity накопленных токенов.
+    Одно сообщение расходует один токен
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: int, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """
+        Через сколько секунд будет доступен токен
+        """
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        """
+        Не выдаем токены ближайшие seconds секунд (Telegram ответил RetryAfter)
+        """
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _OutgoingMessage:
+    __slots__ = ("call", "seq", "future", "retries")
+
+    def __init__(self, call: SendCall, seq: int, future: asyncio.Future) -> None:
+        self.call = call
+        self.seq = seq
+        self.future = future
+        self.retries = 0
+
+
+class _Chat:
+    __slots__ = ("bucket", "queue", "in_flight")
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.bucket = bucket
+        self.queue: Deque[_OutgoingMessage] = deque()
+        self.in_flight = False
+
+
+class Outbox:
+    """
+    Очередь исходящих сообщений с ограничением частоты отправки под лимиты Telegram:
+    не больше rate сообщений в секунду всего и chat_rate сообщений в секунду в один чат.
+    Сообщения одного чата отправляются строго по очереди, среди чатов, которым уже можно отправлять,
+    первыми идут сообщения, поставленные в очередь раньше.
+    На RetryAfter сообщение откладывается на указанное Telegram время и отправляется снова (до max_retries раз).
+    Telegram не сообщает, какой лимит превышен, поэтому если RetryAfter пришел в несколько чатов подряд,
+    на это время останавливается отправка во все чаты.
+    Если очередь не запущена (тесты, консольные скрипты) - сообщения отправляются сразу
+    """
+
+    def __init__(
+        self,
+        rate: float = settings.outbox_rate,
+        burst: int = settings.outbox_burst,
+        chat_rate: float = settings.outbox_chat_rate,
+        chat_burst: int = settings.outbox_chat_burst,
+        max_retries: int = settings.outbox_max_retries,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._seq = itertools.count()
+        self._chats: Dict[int, _Chat] = {}
+        # Чаты, которым можно будет отправить сообщение в момент времени: (время, chat_id)
+        self._waiting: List[Tuple[float, int]] = []
+        # Чаты, которым уже можно отправлять: (номер первого сообщения в очереди чата, chat_id)
+        self._ready: List[Tuple[int, int]] = []
+        self._bucket: Optional[TokenBucket] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Task] = set()
+        # Когда последний раз пришел RetryAfter в чат: chat_id -> время
+        self._flooded_at: Dict[int, float] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    def qsize(self) -> int:
+        return sum(len(chat.queue) for chat in self._chats.values())
+
+    async def start(self) -> None:
+        """
+        Запускаем фоновую задачу, которая отправляет сообщения
+        """
+        if self.is_running:
+            return
+        loop = asyncio.get_running_loop()
+        self._bucket = TokenBucket(self.rate, self.burst, loop.time())
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Отправляем все сообщения из очереди и останавливаем фоновую задачу
+        """
+        if self._task is None:
+            return
+        while self.qsize() or self._sending:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._chats.clear()
+        self._waiting.clear()
+        self._ready.clear()
+        self._flooded_at.clear()
+
+    async def send(self, chat_id: int, call: SendCall) -> Any:
+        """
+        Ставим отправку call в очередь чата chat_id и ждем, пока сообщение будет отправлено.
+        Возвращаем результат call, ошибку отправки пробрасываем вызывающему
+        """
+        if self._task is None or self._wakeup is None:
+            return await call()
+
+        loop = asyncio.get_running_loop()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst, loop.time()))
+
+        message = _OutgoingMessage(call, next(self._seq), loop.create_future())
+        chat.queue.append(message)
+        if len(chat.queue) == 1 and not chat.in_flight:
+            self._schedule(chat_id, chat, loop.time())
+        return await message.future
+
+    def _schedule(self, chat_id: int, chat: _Chat, now: float) -> None:
+        assert self._wakeup is not None
+        heapq.heappush(self._waiting, (now + chat.bucket.delay(now), chat_id))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        assert self._bucket is not None and self._wakeup is not None
+        loop = asyncio.get_running_loop()
+        cleanup_at = loop.time() + _IDLE_CHATS_CLEANUP_INTERVAL
+        while True:
+            now = loop.time()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, chat_id = heapq.heappop(self._waiting)
+                first = self._chats[chat_id].queue[0]
+                heapq.heappush(self._ready, (first.seq, chat_id))
+
+            if now >= cleanup_at:
+                self._forget_idle_chats(now)
+                cleanup_at = now + _IDLE_CHATS_CLEANUP_INTERVAL
+
+            if not self._ready:
+                self._wakeup.clear()
+                timeout = self._waiting[0][0] - now if self._waiting else _IDLE_CHATS_CLEANUP_INTERVAL
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self._bucket.delay(now)
+            if delay > 0:
+                # Пока ждем токен, могут освободиться чаты с более ранними сообщениями
+                await asyncio.sleep(delay)
+                continue
+
+            _, chat_id = heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            message = chat.queue.popleft()
+            if message.future.done():
+                # Тот, кто ждал отправки, уже отменен
+                self._reschedule(chat_id, chat, now)
+                continue
+
+            self._bucket.take(now)
+            chat.bucket.take(now)
+            chat.in_flight = True
+            task = asyncio.create_task(self._deliver(chat_id, chat, message))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, chat_id: int, chat: _Chat, message: _OutgoingMessage) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            result = await message.call()
+        except RetryAfter as e:
+            self._pause_on_flood(chat_id, loop.time(), e.timeout)
+            if message.retries < self.max_retries:
+                message.retries += 1
+                logger.warning("Flood control for chat {}, retry in {} seconds", chat_id, e.timeout)
+                chat.bucket.pause(loop.time(), e.timeout)
+                chat.queue.appendleft(message)
+            elif not message.future.done():
+                message.future.set_exception(e)
+        except Exception as e:
+            if not message.future.done():
+                message.future.set_exception(e)
+        else:
+            if not message.future.done():
+                message.future.set_result(result)
+        finally:
+            chat.in_flight = False
+            self._reschedule(chat_id, chat, loop.time())
+
+    def _pause_on_flood(self, chat_id: int, now: float, seconds: float) -> None:
+        self._flooded_at = {
+            flooded_chat_id: flooded_at
+            for flooded_chat_id, flooded_at in self._flooded_at.items()
+            if now - flooded_at < _GLOBAL_FLOOD_WINDOW
+        }
+        self._flooded_at[chat_id] = now
+        if len(self._flooded_at) > 1 and self._bucket is not None:
+            logger.warning("Flood control for the bot, pause all chats for {} seconds", seconds)
+            self._bucket.pause(now, seconds)
+
+    def _reschedule(self, chat_id: int, chat: _Chat, now: float) -> None:
+        if chat.queue and not chat.in_flight:
+            self._schedule(chat_id, chat, now)
+
+    def _forget_idle_chats(self, now: float) -> None:
+        idle = [
+            chat_id
+            for chat_id, chat in self._chats.items()
+            if not chat.queue and not chat.in_flight and chat.bucket.is_full(now)
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+
+outbox = Outbox()
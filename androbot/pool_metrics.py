@@ -0,0 +1,176 @@
+import asyncio
+import time
+from typing import Dict, NamedTuple, Optional
+
+from loguru import logger
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+from sqlalchemy.util import queue as sqla_queue
+
+
+class PoolStats(NamedTuple):
+    """
+    Состояние пула соединений с базой: размер пула, сколько соединений сейчас выдано,
+    сколько открыто сверх размера пула, сколько раз соединение брали из пула,
+    суммарное и максимальное время ожидания свободного соединения в очереди пула (в секундах)
+    и сколько раз соединение не дождались
+    """
+
+    size: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    wait_time: float
+    max_wait_time: float
+    timeouts: int
+
+
+class _WaitStats:
+    __slots__ = ("checkouts", "wait_time", "max_wait_time", "timeouts")
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+
+    def add_wait(self, wait_time: float) -> None:
+        self.wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+
+class _MeasuredQueueMixin:
+    """
+    Очередь свободных соединений пула, которая считает время ожидания соединения в ней.
+    Открытие нового соединения и pre-ping в это время не входят: они выполняются уже после выхода из очереди
+    """
+
+    wait_stats: _WaitStats
+
+    def get(self, block=True, timeout=None):
+        started_at = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            self.wait_stats.add_wait(time.perf_counter() - started_at)
+
+
+class _MeasuredQueue(_MeasuredQueueMixin, sqla_queue.Queue):
+    pass
+
+
+class _MeasuredAsyncQueue(_MeasuredQueueMixin, sqla_queue.AsyncAdaptedQueue):
+    pass
+
+
+class MeasuredQueuePool(QueuePool):
+    """
+    QueuePool, который считает, сколько соединения ждут в очереди пула, пока другие их не вернут.
+    Счетчики переживают пересоздание пула (engine.dispose())
+    """
+
+    _queue_class = _MeasuredQueue
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._set_wait_stats(_WaitStats())
+
+    def _set_wait_stats(self, wait_stats: _WaitStats) -> None:
+        self.wait_stats = self._pool.wait_stats = wait_stats
+
+    def connect(self):
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.wait_stats.timeouts += 1
+            raise
+        self.wait_stats.checkouts += 1
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._set_wait_stats(self.wait_stats)
+        return pool
+
+
+class MeasuredAsyncQueuePool(MeasuredQueuePool, AsyncAdaptedQueuePool):
+    """
+    То же, что MeasuredQueuePool, для create_async_engine
+    """
+
+    _queue_class = _MeasuredAsyncQueue
+
+
+def get_pool_stats(pool: Pool) -> PoolStats:
+    wait_stats = getattr(pool, "wait_stats", None) or _WaitStats()
+    if isinstance(pool, QueuePool):
+        size, checked_out, overflow = pool.size(), pool.checkedout(), max(0, pool.overflow())
+    else:
+        size = checked_out = overflow = 0
+    return PoolStats(
+        size=size,
+        checked_out=checked_out,
+        overflow=overflow,
+        checkouts=wait_stats.checkouts,
+        wait_time=wait_stats.wait_time,
+        max_wait_time=wait_stats.max_wait_time,
+        timeouts=wait_stats.timeouts,
+    )
+
+
+class PoolStatsReporter:
+    """
+    Раз в interval секунд пишет в лог состояние пулов соединений engines,
+    чтобы размер пула можно было подобрать по реальной нагрузке
+    """
+
+    def __init__(self, engines: Dict[str, Engine], interval: float) -> None:
+        self.engines = engines
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._reported: Dict[str, PoolStats] = {}
+
+    def stats(self) -> Dict[str, PoolStats]:
+        return {name: get_pool_stats(engine.pool) for name, engine in self.engines.items()}
+
+    async def start(self) -> None:
+        if self._task is not None or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
+
+    def report(self) -> None:
+        for name, stats in self.stats().items():
+            previous = self._reported.get(name)
+            self._reported[name] = stats
+            checkouts = stats.checkouts - (previous.checkouts if previous else 0)
+            wait_time = stats.wait_time - (previous.wait_time if previous else 0.0)
+            timeouts = stats.timeouts - (previous.timeouts if previous else 0)
+            log = logger.warning if timeouts else logger.info
+            log(
+                "DB pool {}: size={} checked_out={} overflow={} checkouts={} avg_wait={:.4f}s max_wait={:.4f}s "
+                "timeouts={}",
+                name,
+                stats.size,
+                stats.checked_out,
+                stats.overflow,
+                checkouts,
+                wait_time / checkouts if checkouts else 0.0,
+                stats.max_wait_time,
+                timeouts,
+            )
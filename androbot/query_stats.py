@@ -0,0 +1,210 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Counter, Dict, Iterator, List, Optional, Tuple
+
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from .metrics import DB_QUERY_DURATION
+
+# Ключ в Connection.info: когда начал выполняться текущий запрос соединения
+_STARTED_AT_KEY = "query_started_at"
+
+# Ключ в data middleware, под которым хранится статистика update
+_STATS_KEY = "query_stats"
+
+# Сколько символов параметров запроса писать в лог
+_MAX_PARAMETERS_LENGTH = 1000
+
+
+class QueryTotals:
+    """
+    Сколько запросов к базе выполнено и сколько секунд они заняли
+    """
+
+    __slots__ = ("count", "duration")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+
+
+class QueryStats(QueryTotals):
+    """
+    Запросы к базе за время обработки update (или другого блока collect_queries):
+    всего, по методам Actions и сколько раз выполнялся каждый текст запроса.
+    COMMIT и ROLLBACK считаются отдельно и без времени: у engine нет события после их выполнения
+    """
+
+    __slots__ = ("name", "handler", "methods", "statements", "commits", "rollbacks")
+
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+        self.handler: Optional[str] = None
+        self.methods: Dict[str, QueryTotals] = {}
+        self.statements: Counter[str] = Counter()
+        self.commits = 0
+        self.rollbacks = 0
+
+    def add_query(self, statement: str, duration: float, method: Optional[str]) -> None:
+        self.add(duration)
+        self.statements[statement] += 1
+        if method is not None:
+            self.methods.setdefault(method, QueryTotals()).add(duration)
+
+    def repeated_statements(self, threshold: int) -> List[Tuple[str, int]]:
+        """
+        Запросы, выполненные threshold и больше раз: похоже на N+1 - запрос в цикле вместо одного запроса на все строки
+        """
+        if threshold <= 0:
+            return []
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+# Имена engine для метрик: "sync", "async", "replica"
+_engine_names: Dict[Engine, str] = {}
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_current_method: ContextVar[Optional[str]] = ContextVar("query_stats_method", default=None)
+
+
+@contextmanager
+def collect_queries(name: str) -> Iterator[QueryStats]:
+    """
+    Собираем статистику запросов, выполненных внутри блока (в том же контексте asyncio)
+    """
+    stats = QueryStats(name)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@contextmanager
+def actions_method(name: str) -> Iterator[None]:
+    """
+    Запросы внутри блока относим к методу Actions name
+    """
+    token = _current_method.set(name)
+    try:
+        yield
+    finally:
+        _current_method.reset(token)
+
+
+def _format_parameters(parameters: Any) -> str:
+    text = repr(parameters)
+    if len(text) > _MAX_PARAMETERS_LENGTH:
+        return text[:_MAX_PARAMETERS_LENGTH] + "..."
+    return text
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info[_STARTED_AT_KEY] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started_at = conn.info.pop(_STARTED_AT_KEY, None)
+    if started_at is None:
+        return
+    duration = time.perf_counter() - started_at
+    DB_QUERY_DURATION.observe(duration, engine=_engine_names.get(conn.engine, "-"))
+    method = _current_method.get()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add_query(statement, duration, method)
+    if 0 < settings.db_slow_query_threshold <= duration:
+        logger.warning(
+            "Slow query {:.3f}s in {}: {} {}",
+            duration,
+            method or (stats.name if stats is not None else "-"),
+            statement,
+            _format_parameters(parameters),
+        )
+
+
+def _commit(conn) -> None:
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.commits += 1
+
+
+def _rollback(conn) -> None:
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.rollbacks += 1
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """
+    Подключаем к engine сбор статистики запросов, метрику времени запросов и лог медленных запросов.
+    Для AsyncEngine передается async_engine.sync_engine
+    """
+    _engine_names[engine] = name
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "commit", _commit)
+        event.listen(engine, "rollback", _rollback)
+
+
+def report_query_stats(stats: QueryStats) -> None:
+    """
+    Пишем в лог, сколько запросов выполнено за update и в каких методах Actions, и предупреждаем о похожих на N+1
+    """
+    logger.debug(
+        "{} ({}): {} queries in {:.3f}s, {} commits, {} rollbacks{}",
+        stats.name,
+        stats.handler or "no handler",
+        stats.count,
+        stats.duration,
+        stats.commits,
+        stats.rollbacks,
+        "".join(f", {method} {totals.count}/{totals.duration:.3f}s" for method, totals in stats.methods.items()),
+    )
+    for statement, count in stats.repeated_statements(settings.db_n_plus_one_threshold):
+        logger.warning(
+            "Possible N+1 in {} ({}): query executed {} times: {}", stats.name, stats.handler, count, statement
+        )
+
+
+class QueryStatsMiddleware(BaseMiddleware):
+    """
+    Считает запросы к базе за каждый update и пишет итог в лог после обработки.
+    Подключается после UnitOfWorkMiddleware, чтобы в статистику попал commit (или rollback) транзакции update
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict) -> None:
+        stats = QueryStats(f"Update {update.update_id}")
+        data[_STATS_KEY] = stats, _current_stats.set(stats)
+
+    async def on_process_message(self, message: types.Message, data: dict) -> None:
+        self._set_handler()
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict) -> None:
+        self._set_handler()
+
+    def _set_handler(self) -> None:
+        stats = _current_stats.get()
+        handler = current_handler.get(None)
+        if stats is not None and handler is not None:
+            stats.handler = handler.__name__
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict) -> None:
+        if _STATS_KEY not in data:
+            return
+        stats, token = data.pop(_STATS_KEY)
+        _current_stats.reset(token)
+        report_query_stats(stats)
@@ -0,0 +1,96 @@
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from . import crud
+from .config import settings
+from .schemas import QuestionRecord
+
+
+class _Snapshot(NamedTuple):
+    version: int
+    loaded_at: float
+    questions: Dict[int, QuestionRecord]
+    ids_by_specialty: Dict[str, Tuple[int, ...]]
+
+
+class QuestionBank:
+    """
+    Банк вопросов в памяти процесса.
+    Вопросы меняются только при загрузке из csv, поэтому загружаем их один раз (при старте бота
+    или при первом обращении) и отдаем из памяти: id вопросов по специальностям и неизменяемые записи вопросов.
+    После изменения вопросов в базе нужно вызвать invalidate() или reload(). Кроме того, банк перезагружается,
+    если устарел (settings.question_bank_ttl) или если запросили вопрос, которого нет в памяти.
+    """
+
+    def __init__(self, ttl: float = settings.question_bank_ttl) -> None:
+        self.ttl = ttl
+        self._snapshot: Optional[_Snapshot] = None
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """
+        Версия банка вопросов, увеличивается при каждой загрузке из базы данных
+        """
+        return self._version
+
+    def reload(self, db: Session) -> int:
+        """
+        Загружаем все вопросы из базы данных и возвращаем новую версию банка
+        """
+        questions: Dict[int, QuestionRecord] = {}
+        ids_by_specialty: Dict[str, list] = {}
+        for db_question in crud.get_questions(db):
+            question = QuestionRecord.from_orm(db_question)
+            questions[question.id] = question
+            if question.is_retired:
+                continue
+            ids_by_specialty.setdefault(question.question_type, []).append(question.id)
+
+        self._version += 1
+        # Подменяем снимок целиком, чтобы читатели не увидели наполовину загруженный банк
+        self._snapshot = _Snapshot(
+            version=self._version,
+            loaded_at=time.monotonic(),
+            questions=questions,
+            ids_by_specialty={specialty: tuple(ids) for specialty, ids in ids_by_specialty.items()},
+        )
+        logger.info("Question bank v{} loaded: {} questions", self._version, len(questions))
+        return self._version
+
+    def invalidate(self) -> None:
+        """
+        Сбрасываем банк, при следующем обращении он будет загружен из базы данных заново
+        """
+        self._snapshot = None
+
+    def get_ids(self, db: Session, specialty: str) -> Tuple[int, ...]:
+        """
+        Получаем id всех вопросов для специальности specialty
+        """
+        return self._get_snapshot(db).ids_by_specialty.get(specialty, ())
+
+    def get(self, db: Session, quest_id: int) -> Optional[QuestionRecord]:
+        """
+        Получаем вопрос по quest_id
+        """
+        question = self._get_snapshot(db).questions.get(quest_id)
+        if question is None and crud.get_question(db, quest_id) is not None:
+            # Вопрос появился в базе после загрузки банка
+            self.reload(db)
+            question = self._get_snapshot(db).questions.get(quest_id)
+        return question
+
+    def _get_snapshot(self, db: Session) -> _Snapshot:
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.ttl:
+            self.reload(db)
+            snapshot = self._snapshot
+        assert snapshot is not None
+        return snapshot
+
+
+question_bank = QuestionBank()
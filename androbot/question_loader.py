@@ -0,0 +1,186 @@
+import csv
+import hashlib
+import itertools
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from .errors import WrongQuestionsFileFormat
+from .schemas import QUESTION_CONTENT_FIELDS, Question
+from .types_ import Specialty
+
+# Колонки csv файла с вопросами: категория, вопрос, эталонный ответ, ссылка на дополнительные материалы
+QUESTIONS_FILE_COLUMNS = 4
+
+# Необязательная пятая колонка - id вопроса в базе: с ним правка текста вопроса при синхронизации сохраняет id
+QUESTIONS_FILE_ID_COLUMN = QUESTIONS_FILE_COLUMNS + 1
+
+
+class LoadReport(NamedTuple):
+    """
+    Результат загрузки вопросов: сколько вопросов загружено и за сколько секунд
+    """
+
+    questions: int
+    seconds: float
+
+    @property
+    def questions_per_second(self) -> float:
+        return self.questions / self.seconds if self.seconds > 0 else float(self.questions)
+
+    def __str__(self) -> str:
+        return f"{self.questions} questions in {self.seconds:.2f}s ({self.questions_per_second:.0f} questions/s)"
+
+
+def get_specialty_name(specialty: Union[Specialty, str]) -> str:
+    """
+    Название специальности, под которым вопросы хранятся в базе (question_type)
+    """
+    return specialty.value if isinstance(specialty, Specialty) else specialty
+
+
+def read_questions(specialty: Union[Specialty, str], file: str) -> Iterator[Question]:
+    """
+    Построчно читаем вопросы из csv файла `file` (первая строка - заголовок) и проверяем каждую строку.
+    Если в строке заполнена колонка id, вопрос получает этот id.
+    Пустые строки пропускаем, на строке с ошибкой бросаем WrongQuestionsFileFormat с номером строки
+    """
+    question_type = get_specialty_name(specialty)
+    with open(file, encoding="utf-8", newline="") as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=";")
+        if next(csv_reader, None) is None:
+            raise WrongQuestionsFileFormat(f"{file}: file is empty")
+
+        for row in csv_reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) not in (QUESTIONS_FILE_COLUMNS, QUESTIONS_FILE_ID_COLUMN):
+                raise WrongQuestionsFileFormat(
+                    f"{file}:{csv_reader.line_num}: expected {QUESTIONS_FILE_COLUMNS} "
+                    f"or {QUESTIONS_FILE_ID_COLUMN} columns, got {len(row)}"
+                )
+
+            question_category, text_question, text_answer, additional_info = row[:QUESTIONS_FILE_COLUMNS]
+            if not text_question.strip() or not text_answer.strip():
+                raise WrongQuestionsFileFormat(f"{file}:{csv_reader.line_num}: question and answer must not be empty")
+
+            question_id = row[QUESTIONS_FILE_COLUMNS].strip() if len(row) == QUESTIONS_FILE_ID_COLUMN else ""
+            if question_id and not question_id.isdigit():
+                raise WrongQuestionsFileFormat(f"{file}:{csv_reader.line_num}: wrong question id '{question_id}'")
+
+            yield Question(
+                id=int(question_id) if question_id else None,
+                question_type=question_type,
+                question_category=question_category,
+                text_question=text_question,
+                text_answer=text_answer,
+                additional_info=additional_info,
+            )
+
+
+def batched(questions: Iterable[Question], batch_size: int) -> Iterator[List[Question]]:
+    """
+    Разбиваем поток вопросов на пачки по batch_size штук
+    """
+    iterator = iter(questions)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def question_key(question: Question) -> str:
+    """
+    Стабильный ключ вопроса внутри специальности - текст вопроса без учета регистра и лишних пробелов.
+    По нему вопрос из csv без id сопоставляется с вопросом в базе
+    """
+    return " ".join((question.text_question or "").split()).casefold()
+
+
+def question_hash(question: Question) -> str:
+    """
+    Хэш содержимого вопроса: если он не изменился, вопрос в базе не трогаем
+    """
+    content = "\x1f".join(getattr(question, field) or "" for field in QUESTION_CONTENT_FIELDS)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class SyncReport(NamedTuple):
+    """
+    Разница между вопросами в csv файле и в базе данных
+    """
+
+    inserted: List[Question]
+    updated: List[Question]
+    retired: List[Question]
+    unchanged: int
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.inserted or self.updated or self.retired)
+
+    def diff(self) -> List[str]:
+        """
+        Построчный отчет об изменениях: + новый вопрос, ~ измененный, - выведенный из оборота
+        """
+        lines = [f"+ {question.text_question}" for question in self.inserted]
+        lines += [f"~ [{question.id}] {question.text_question}" for question in self.updated]
+        lines += [f"- [{question.id}] {question.text_question}" for question in self.retired]
+        return lines
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.inserted)} new, {len(self.updated)} changed, "
+            f"{len(self.retired)} retired, {self.unchanged} unchanged questions"
+        )
+
+
+def diff_questions(current: Iterable[Question], questions: Iterable[Question]) -> SyncReport:
+    """
+    Сравниваем вопросы из базы данных current с вопросами из csv файла questions по id (если он указан в файле)
+    или по ключу, и по хэшу содержимого.
+    Измененные вопросы получают id вопроса из базы, поэтому id и история ответов сохраняются
+    """
+    current_by_id: Dict[Optional[int], Question] = {}
+    current_by_key: Dict[str, Question] = {}
+    for question in current:
+        current_by_id[question.id] = question
+        key = question_key(question)
+        matched = current_by_key.get(key)
+        # Если в базе есть дубликаты, сопоставляем с действующим вопросом, а остальные выводим из оборота
+        if matched is None or (matched.is_retired and not question.is_retired):
+            current_by_key[key] = question
+
+    inserted: List[Question] = []
+    updated: List[Question] = []
+    unchanged = 0
+    seen_keys = set()
+    matched_ids = set()
+    for question in questions:
+        key = question_key(question)
+        if key in seen_keys:
+            raise WrongQuestionsFileFormat(f"Question is duplicated in file: {question.text_question}")
+        seen_keys.add(key)
+
+        if question.id is not None:
+            current_question = current_by_id.get(question.id)
+            if current_question is None:
+                raise WrongQuestionsFileFormat(f"Unknown question id {question.id}: {question.text_question}")
+        else:
+            current_question = current_by_key.get(key)
+        if current_question is not None and current_question.id in matched_ids:
+            raise WrongQuestionsFileFormat(f"Question is duplicated in file: {question.text_question}")
+
+        if current_question is None:
+            inserted.append(question)
+            continue
+        matched_ids.add(current_question.id)
+        if current_question.is_retired or question_hash(current_question) != question_hash(question):
+            question.id = current_question.id
+            updated.append(question)
+        else:
+            unchanged += 1
+
+    retired = [
+        question for question in current_by_id.values() if question.id not in matched_ids and not question.is_retired
+    ]
+    return SyncReport(inserted, updated, retired, unchanged)
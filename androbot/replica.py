@@ -0,0 +1,37 @@
+import time
+from typing import Dict
+
+from .config import settings
+
+# При каком числе запомненных пользователей убирать из памяти тех, чьи записи реплика уже догнала
+_CLEANUP_THRESHOLD = 10000
+
+
+class RecentWrites:
+    """
+    Когда пользователи последний раз записывали что-то в основную базу.
+    Реплика отстает от основной базы, поэтому max_lag секунд после записи
+    данные пользователя читаем с основной базы, иначе он может не увидеть свой же ответ.
+    Update одного чата обрабатывает один воркер, поэтому памяти процесса для этого достаточно
+    """
+
+    def __init__(self, max_lag: float) -> None:
+        self.max_lag = max_lag
+        self._written_at: Dict[int, float] = {}
+
+    def mark(self, tg_user_id: int) -> None:
+        now = time.monotonic()
+        if len(self._written_at) >= _CLEANUP_THRESHOLD:
+            self._written_at = {
+                user_id: written_at
+                for user_id, written_at in self._written_at.items()
+                if now - written_at < self.max_lag
+            }
+        self._written_at[tg_user_id] = now
+
+    def is_recent(self, tg_user_id: int) -> bool:
+        written_at = self._written_at.get(tg_user_id)
+        return written_at is not None and time.monotonic() - written_at < self.max_lag
+
+
+recent_writes = RecentWrites(settings.db_replica_max_lag)
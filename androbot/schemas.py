@@ -29,6 +29,10 @@ class Answer(BaseModel):
         orm_mode = True
 
 
+# Поля вопроса, которые берутся из csv файла
+QUESTION_CONTENT_FIELDS = ("question_category", "text_question", "text_answer", "additional_info")
+
+
 class Question(BaseModel):
     id: Optional[int] = None
     question_type: str
@@ -36,9 +40,22 @@ class Question(BaseModel):
     text_question: Optional[str]
     text_answer: str
     additional_info: Optional[str]
+    is_retired: bool = False
+
+    class Config:
+        orm_mode = True
+
+
+class QuestionRecord(Question):
+    """
+    Неизменяемая запись вопроса из банка вопросов (question_bank)
+    """
+
+    id: int
 
     class Config:
         orm_mode = True
+        allow_mutation = False
 
 
 class CurrentSession(BaseModel):
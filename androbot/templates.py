@@ -1,5 +1,123 @@
+import string
+import time
+from pathlib import Path
+from typing import Dict, FrozenSet, NamedTuple, Optional
+
+from loguru import logger
+
 from .config import settings
-from .errors import TemplateNotFound
+from .errors import TemplateNotFound, WrongTemplateFormat
+from .tracing import span
+
+# Параметры, которые views.py подставляет в шаблоны. Шаблон должен использовать ровно их
+TEMPLATE_PLACEHOLDERS: Dict[str, FrozenSet[str]] = {
+    "01_hello": frozenset({"username"}),
+    "09_are_you_ready_for_test": frozenset({"answer_way"}),
+    "20_question": frozenset(
+        {"current_question_number", "questions_count", "question_category", "question", "call_to_action"}
+    ),
+    "30_do_not_understand": frozenset({"additional_info", "call_to_action"}),
+    "40_no_correct_answer": frozenset(),
+    "41_correct_answer": frozenset({"correct_answer", "call_to_action"}),
+    "42_do_you_want_additional_materials": frozenset(),
+    "45_do_you_want_to_get_correct_answer": frozenset(),
+    "46_additional_materials": frozenset({"additional_info"}),
+    "51_user_score": frozenset({"user_score", "user_score_description"}),
+}
+
+
+class Template(NamedTuple):
+    """
+    Шаблон сообщения бота: текст без пробелов по краям и имена параметров в нем
+    """
+
+    name: str
+    text: str
+    placeholders: FrozenSet[str]
+    mtime: float
+
+    def render(self, **kwargs) -> str:
+        return self.text.format(**kwargs)
+
+
+def parse_template(template_file: Path) -> Template:
+    """
+    Читаем шаблон из файла и проверяем, что в нем есть все нужные параметры и нет лишних
+    """
+    name = template_file.stem
+    mtime = template_file.stat().st_mtime
+    text = template_file.read_text(encoding="utf-8").strip()
+    try:
+        placeholders = frozenset(field for _, field, _, _ in string.Formatter().parse(text) if field is not None)
+    except ValueError as e:
+        raise WrongTemplateFormat(f"Template {name} can't be parsed: {e}")
+
+    required = TEMPLATE_PLACEHOLDERS.get(name)
+    if required is not None and placeholders != required:
+        raise WrongTemplateFormat(
+            f"Template {name} has placeholders {sorted(placeholders)}, but {sorted(required)} are expected"
+        )
+    return Template(name, text, placeholders, mtime)
+
+
+class TemplateRegistry:
+    """
+    Шаблоны сообщений из папки folder, загруженные в память.
+    Раз в reload_interval секунд проверяем время изменения файлов и перечитываем измененные шаблоны,
+    поэтому шаблоны можно править без перезапуска бота (reload_interval=0 отключает проверку)
+    """
+
+    def __init__(self, folder: Path, reload_interval: float = settings.templates_reload_interval) -> None:
+        self.folder = folder
+        self.reload_interval = reload_interval
+        self._templates: Dict[str, Template] = {}
+        self._checked_at: Optional[float] = None
+
+    def load(self) -> None:
+        """
+        Загружаем все шаблоны из папки. Если шаблона с ожидаемыми параметрами нет - бросаем TemplateNotFound
+        """
+        templates = {template_file.stem: parse_template(template_file) for template_file in self.folder.glob("*.md")}
+        missing = TEMPLATE_PLACEHOLDERS.keys() - templates.keys()
+        if missing:
+            raise TemplateNotFound(f"Templates {sorted(missing)} not found in {self.folder}!")
+
+        self._templates = templates
+        self._checked_at = time.monotonic()
+        logger.info("Loaded {} templates from {}", len(templates), self.folder)
+
+    def reload_changed(self) -> None:
+        """
+        Перечитываем шаблоны, файлы которых изменились, и добавляем новые
+        """
+        for template_file in self.folder.glob("*.md"):
+            template = self._templates.get(template_file.stem)
+            if template is None or template.mtime != template_file.stat().st_mtime:
+                try:
+                    self._templates[template_file.stem] = parse_template(template_file)
+                except WrongTemplateFormat as e:
+                    # Оставляем предыдущую версию шаблона, чтобы бот продолжал отвечать
+                    logger.error("Template {} was not reloaded: {}", template_file.stem, e)
+                    continue
+                logger.info("Template {} reloaded", template_file.stem)
+        self._checked_at = time.monotonic()
+
+    def get(self, template_name: str) -> Template:
+        """
+        Получаем шаблон по имени (расширение .md можно не указывать)
+        """
+        if self._checked_at is None:
+            self.load()
+        elif self.reload_interval > 0 and time.monotonic() - self._checked_at > self.reload_interval:
+            self.reload_changed()
+
+        template = self._templates.get(template_name[:-3] if template_name.endswith(".md") else template_name)
+        if template is None:
+            raise TemplateNotFound(f"Template {template_name} not found!")
+        return template
+
+
+template_registry = TemplateRegistry(settings.static_folder)
 
 
 def render_message(template_text: str, **kwargs):
@@ -10,18 +128,17 @@ def render_message(template_text: str, **kwargs):
     return parsed_text
 
 
-def get_template(template_name: str) -> str:
+def render_template(template_name: str, **kwargs) -> str:
     """
-    Функция получет имя шаблона и возвращает содержимое этого файла.
-    Если передать имя файла без расширения md - то оно добавиться
+    Функция подставляет параметры в шаблон template_name
     """
-    template_file = settings.static_folder / template_name
-    if not template_file.exists() and template_file.suffix != ".md":
-        template_file = template_file.with_suffix(".md")
-        if not template_file.exists():
-            raise TemplateNotFound(f"Template {template_name} not found!")
+    with span("render_template", template=template_name):
+        return template_registry.get(template_name).render(**kwargs)
 
-    with open(template_file, encoding="utf-8") as f:
-        answer_text = f.read()
 
-    return answer_text
+def get_template(template_name: str) -> str:
+    """
+    Функция получет имя шаблона и возвращает его текст.
+    Если передать имя файла без расширения md - то оно добавиться
+    """
+    return template_registry.get(template_name).text
@@ -1,14 +1,62 @@
+import asyncio
 import datetime
+import json
+import os
+import shutil
+import socket
+import time
 
 import pytest
+from aiogram import types as aiotypes
+from aiogram.dispatcher.middlewares import MiddlewareManager
+from aiogram.dispatcher.webhook import configure_app
+from aiogram.utils.exceptions import RetryAfter
+from aiohttp import ClientSession, web
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
 from dateutil import tz
+from sqlalchemy import create_engine, event, exc, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
-from androbot.actions import Actions, get_main_menu, start_new_test
-from androbot.errors import NoNewQuestionsException, UserExistsException, UserNotExistsException, WrongBotScoreFormat
+from androbot import models
+from androbot.actions import Actions, AsyncActions, SessionScore, get_main_menu, start_new_test
+from androbot.config import settings
+from androbot.database import SQLALCHEMY_DATABASE_URL, async_engine, engine
+from androbot.errors import (
+    NoNewQuestionsException,
+    UserExistsException,
+    UserLockTimeout,
+    UserNotExistsException,
+    WrongBotScoreFormat,
+    WrongQuestionsFileFormat,
+    WrongTemplateFormat,
+)
+from androbot.event_sink import EventSink
+from androbot.fake_telegram import FakeTelegramServer
+from androbot.main import bot, dp, send_text
+from androbot.metrics import Counter, Gauge, Histogram, MetricsRegistry, MetricsServer
+from androbot.migrate import upgrade_database
+from androbot.outbox import Outbox
+from androbot.pool_metrics import MeasuredQueuePool, get_pool_stats
+from androbot.query_stats import collect_queries
+from androbot.question_bank import question_bank
 from androbot.schemas import Answer, EventsLog, Question, TelegramUser
+from androbot.templates import TemplateRegistry, render_template
+from androbot.tracing import TracingMiddleware, span
 from androbot.types_ import AnswerTypes, Events, Specialty
 from androbot.types_.user_score import UserScore
+from androbot.unit_of_work import UnitOfWorkMiddleware, unit_of_work
+from androbot.update_scheduler import UpdateScheduler
+from androbot.user_lock import get_user_lock_key, user_lock
 from androbot.utils import Utils
+from androbot.views import get_finish_view, get_main_menu_view
+from androbot.webhook import reply_in_webhook
+from androbot.workers import get_update_chat_id, get_worker_index
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    upgrade_database()
 
 
 @pytest.fixture()
@@ -29,6 +77,11 @@ def test_start_new_test():
     ]
 
 
+def test_migrations_match_models():
+    with engine.connect() as connection:
+        assert compare_metadata(MigrationContext.configure(connection), models.Base.metadata) == []
+
+
 def test_add_user(act):
     user = TelegramUser(
         tg_user_id=Utils.get_random_number(5),
@@ -66,6 +119,18 @@ def test_add_already_exist_user(act):
     act.remove_user(user)
 
 
+def test_edit_specialty_creates_user(act):
+    tg_user_id = int(Utils.get_random_number(9))
+    assert act.edit_specialty(tg_user_id, Specialty.ANDROID) is True
+    assert act.edit_specialty(tg_user_id, Specialty.ANDROID) is False
+    user = TelegramUser(tg_user_id=tg_user_id, name="", username=Utils.get_random_text(10))
+    with pytest.raises(UserExistsException):
+        act.add_user(user)
+    assert act.db.get(models.TelegramUser, tg_user_id).specialty == Specialty.ANDROID.value
+    act.db.query(models.TelegramUser).filter_by(tg_user_id=tg_user_id).delete()
+    act.db.commit()
+
+
 def test_remove_not_exist_user(act):
     user = TelegramUser(
         tg_user_id=Utils.get_random_number(5),
@@ -142,6 +207,35 @@ def test_get_next_test(act):
     act.remove_questions("test")
 
 
+def test_async_get_next_test(act):
+    specialty = Utils.get_random_text(10)
+    user = TelegramUser(
+        tg_user_id=Utils.get_random_number(5),
+        name=Utils.get_random_text(10),
+        username=Utils.get_random_text(10),
+        specialty=specialty,
+    )
+    question = Question(
+        question_type=specialty,
+        question_category=Utils.get_random_text(10),
+        text_question=Utils.get_random_text(10),
+        text_answer=Utils.get_random_text(10),
+    )
+    act.add_user(user)
+    act.add_question(question)
+
+    async def get_next_test():
+        async with AsyncActions() as async_act:
+            next_test = await async_act.get_next_test(user.tg_user_id)
+        # Соединения пула привязаны к event loop, который закроет asyncio.run
+        await async_engine.dispose()
+        return next_test
+
+    next_question, current_question_number, questions_count = asyncio.run(get_next_test())
+    assert next_question.id == question.id
+    assert (current_question_number, questions_count) == (1, 1)
+
+
 def test_get_current_question(act):
     user = TelegramUser(
         tg_user_id=Utils.get_random_number(5),
@@ -164,6 +258,213 @@ def test_get_current_question(act):
     act.remove_questions("test")
 
 
+def test_question_deck(act):
+    specialty = Utils.get_random_text(10)
+    user = TelegramUser(
+        tg_user_id=Utils.get_random_number(5),
+        name=Utils.get_random_text(10),
+        username=Utils.get_random_text(10),
+        specialty=specialty,
+    )
+    act.add_user(user)
+    for _ in range(3):
+        act.add_question(
+            Question(
+                question_type=specialty,
+                question_category=Utils.get_random_text(10),
+                text_question=Utils.get_random_text(10),
+                text_answer=Utils.get_random_text(10),
+            )
+        )
+    question, current_question_number, questions_count = act.get_next_test(user.tg_user_id)
+    session = act.get_current_session(user.tg_user_id)
+    assert sorted(session.question_deck) == list(question_bank.get_ids(act.db, specialty))
+    assert (question.id, current_question_number, questions_count) == (session.question_deck[0], 1, 3)
+    # Без ответа выдаем тот же вопрос (продолжение теста)
+    assert act.get_next_test(user.tg_user_id)[0].id == question.id
+    act.add_answer(
+        Answer(
+            quest_id=question.id,
+            tg_user_id=user.tg_user_id,
+            answer_type=start_new_test()[1],
+            text_answer=Utils.get_random_text(50),
+        )
+    )
+    question, current_question_number, _ = act.get_next_test(user.tg_user_id)
+    assert (question.id, current_question_number) == (session.question_deck[1], 2)
+    act.reset_session(user)
+    assert act.get_next_test(user.tg_user_id)[1] == 1
+    assert act.get_current_session(user.tg_user_id).id != session.id
+
+
+def test_next_question_session_id(act):
+    specialty = Utils.get_random_text(10)
+    user = TelegramUser(
+        tg_user_id=Utils.get_random_number(5),
+        name=Utils.get_random_text(10),
+        username=Utils.get_random_text(10),
+        specialty=specialty,
+    )
+    act.add_user(user)
+    for _ in range(2):
+        act.add_question(
+            Question(
+                question_type=specialty,
+                question_category=Utils.get_random_text(10),
+                text_question=Utils.get_random_text(10),
+                text_answer=Utils.get_random_text(10),
+            )
+        )
+    question, _, _, session_id = act.get_next_question(user.tg_user_id)
+    assert session_id == act.get_current_session(user.tg_user_id).id
+    assert act.get_next_question(user.tg_user_id).session_id == session_id
+    # С известным id сессии ответ и оценка пишутся в нее без поиска текущей сессии
+    answer = Answer(
+        quest_id=question.id, tg_user_id=user.tg_user_id, answer_type=start_new_test()[1], text_answer="answer"
+    )
+    assert act.add_answer(answer, session_id).session_id == session_id
+    act.add_question_score(question.id, user.tg_user_id, UserScore.RIGHT.value, session_id)
+    assert act.get_question_score(question.id, user.tg_user_id, session_id).score == UserScore.RIGHT.value
+    assert act.get_question(question.id) == question
+    act.reset_session(user)
+    assert act.get_next_question(user.tg_user_id).session_id != session_id
+
+
+def test_next_question_skips_deleted_questions(act):
+    specialty = Utils.get_random_text(10)
+    user = TelegramUser(
+        tg_user_id=int(Utils.get_random_number(9)),
+        name=Utils.get_random_text(10),
+        username=Utils.get_random_text(10),
+        specialty=specialty,
+    )
+    act.add_user(user)
+    for _ in range(3):
+        act.add_question(
+            Question(
+                question_type=specialty,
+                question_category=Utils.get_random_text(10),
+                text_question=Utils.get_random_text(10),
+                text_answer=Utils.get_random_text(10),
+            )
+        )
+    question, _, _, session_id = act.get_next_question(user.tg_user_id)
+    deck = act.db.get(models.CurrentSession, session_id).question_deck
+    answer = Answer(
+        quest_id=question.id, tg_user_id=user.tg_user_id, answer_type=start_new_test()[1], text_answer="answer"
+    )
+    act.add_answer(answer, session_id)
+
+    # Вопрос удалили из базы (load_questions -d) после того, как колода была роздана
+    act.db.query(models.Question).filter_by(id=deck[1]).delete()
+    act.db.commit()
+    question_bank.invalidate()
+
+    next_question = act.get_next_question(user.tg_user_id)
+    assert next_question.question.id == deck[2]
+    assert next_question.current_question_number == 3
+
+
+def test_user_lock(act):
+    tg_user_id = int(Utils.get_random_number(9))
+    with engine.connect() as other_worker:
+        other_worker.execute(select(func.pg_advisory_lock(get_user_lock_key(tg_user_id))))
+        with pytest.raises(UserLockTimeout):
+            with user_lock(act.db, tg_user_id, timeout=0.1):
+                pass
+        with user_lock(act.db, tg_user_id + 1):
+            pass
+        other_worker.execute(select(func.pg_advisory_unlock(get_user_lock_key(tg_user_id))))
+    with user_lock(act.db, tg_user_id, timeout=0.1):
+        pass
+
+
+def test_question_bank(act):
+    specialty = Utils.get_random_text(10)
+    question = Question(
+        question_type=specialty,
+        question_category=Utils.get_random_text(10),
+        text_question=Utils.get_random_text(10),
+        text_answer=Utils.get_random_text(10),
+    )
+    act.add_question(question)
+    version = question_bank.reload(act.db)
+    assert question_bank.get_ids(act.db, specialty) == (question.id,)
+    record = question_bank.get(act.db, question.id)
+    assert record.text_question == question.text_question
+    with pytest.raises(TypeError):
+        record.text_question = Utils.get_random_text(10)
+    act.remove_questions(specialty)
+    assert question_bank.get_ids(act.db, specialty) == ()
+    assert question_bank.version > version
+
+
+def test_load_questions(act, tmp_path):
+    specialty = Utils.get_random_text(10)
+    file = tmp_path / "questions.csv"
+    rows = [f"{Utils.get_random_text(5)};{Utils.get_random_text(10)};{Utils.get_random_text(10)};" for _ in range(5)]
+    file.write_text("\n".join(["Category;Question;Answer;Info", *rows, ""]), encoding="utf-8")
+    report = act.load_questions(specialty, str(file), batch_size=2)
+    assert report.questions == 5
+    assert len(question_bank.get_ids(act.db, specialty)) == 5
+
+    file.write_text("\n".join(["Category;Question;Answer;Info", *rows, "General;;Answer;"]), encoding="utf-8")
+    with pytest.raises(WrongQuestionsFileFormat):
+        act.load_questions(specialty, str(file), batch_size=2)
+    assert len(question_bank.get_ids(act.db, specialty)) == 5
+    # Старые вопросы удаляются в той же транзакции: при ошибке в файле они остаются
+    with pytest.raises(WrongQuestionsFileFormat):
+        act.load_questions(specialty, str(file), batch_size=2, drop_questions=True)
+    question_bank.invalidate()
+    assert len(question_bank.get_ids(act.db, specialty)) == 5
+    file.write_text("\n".join(["Category;Question;Answer;Info", *rows[:3]]), encoding="utf-8")
+    act.load_questions(specialty, str(file), drop_questions=True)
+    assert len(question_bank.get_ids(act.db, specialty)) == 3
+    act.remove_questions(specialty)
+
+
+def test_sync_questions(act, tmp_path):
+    specialty = Utils.get_random_text(10)
+    file = tmp_path / "questions.csv"
+    rows = [[Utils.get_random_text(5), Utils.get_random_text(10), Utils.get_random_text(10), ""] for _ in range(3)]
+
+    def write_questions():
+        file.write_text(
+            "\n".join(["Category;Question;Answer;Info", *(";".join(row) for row in rows)]), encoding="utf-8"
+        )
+
+    write_questions()
+    assert len(act.sync_questions(specialty, str(file)).inserted) == 3
+    ids = question_bank.get_ids(act.db, specialty)
+
+    rows[1][2] = Utils.get_random_text(10)
+    rows[2] = [Utils.get_random_text(5), Utils.get_random_text(10), Utils.get_random_text(10), ""]
+    write_questions()
+    report = act.sync_questions(specialty, str(file), dry_run=True)
+    assert [len(report.inserted), len(report.updated), len(report.retired), report.unchanged] == [1, 1, 1, 1]
+    assert question_bank.get_ids(act.db, specialty) == ids
+
+    act.sync_questions(specialty, str(file))
+    new_ids = question_bank.get_ids(act.db, specialty)
+    assert new_ids[:2] == ids[:2] and ids[2] not in new_ids and len(new_ids) == 3
+    assert question_bank.get(act.db, ids[1]).text_answer == rows[1][2]
+    assert question_bank.get(act.db, ids[2]).is_retired
+
+    # С колонкой id правка текста вопроса сохраняет его id
+    rows[0] = [rows[0][0], Utils.get_random_text(10), rows[0][2], "", str(ids[0])]
+    write_questions()
+    report = act.sync_questions(specialty, str(file))
+    assert [len(report.inserted), len(report.updated), len(report.retired), report.unchanged] == [0, 1, 0, 2]
+    assert question_bank.get_ids(act.db, specialty) == new_ids
+    assert question_bank.get(act.db, ids[0]).text_question == rows[0][1]
+
+    rows[0][4] = str(ids[2] + 1000000)
+    write_questions()
+    with pytest.raises(WrongQuestionsFileFormat):
+        act.sync_questions(specialty, str(file), dry_run=True)
+    act.remove_questions(specialty)
+
+
 def test_add_event(act):
     user = TelegramUser(
         tg_user_id=Utils.get_random_number(5),
@@ -186,6 +487,402 @@ def test_add_event(act):
     act.remove_user(user)
 
 
+def test_pool_stats():
+    pool_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, poolclass=MeasuredQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    # Открытие соединения не считается ожиданием в очереди пула
+    event.listen(pool_engine, "connect", lambda *args: time.sleep(0.2))
+    with pool_engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            pool_engine.connect()
+        stats = get_pool_stats(pool_engine.pool)
+    assert (stats.size, stats.checked_out, stats.overflow, stats.timeouts) == (1, 1, 0, 1)
+    assert 0.05 <= stats.wait_time < 0.2
+    pool_engine.dispose()
+    stats = get_pool_stats(pool_engine.pool)
+    # Счетчики не сбрасываются при пересоздании пула
+    assert stats.checkouts >= 1 and stats.timeouts == 1 and stats.checked_out == 0
+    assert stats.max_wait_time <= stats.wait_time
+
+
+def test_metrics_endpoint():
+    registry = MetricsRegistry()
+    requests = Counter("test_requests_total", "Requests", ["method"], registry=registry)
+    latency = Histogram("test_latency_seconds", "Latency", ["method"], buckets=(0.1, 1.0), registry=registry)
+    queue_size = Gauge("test_queue_size", "Queue size", registry=registry)
+    registry.add_collector(lambda: queue_size.set(3))
+    requests.inc(method='send"Message')
+    latency.observe(0.1, method="get")
+    latency.observe(0.5, method="get")
+
+    async def get_metrics():
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = MetricsServer("127.0.0.1", port, registry)
+        await server.start()
+        try:
+            async with ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    return await response.text()
+        finally:
+            await server.stop()
+
+    lines = asyncio.run(get_metrics()).splitlines()
+    assert "# TYPE test_latency_seconds histogram" in lines
+    assert 'test_requests_total{method="send\\"Message"} 1.0' in lines
+    assert 'test_latency_seconds_bucket{method="get",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{method="get",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{method="get",le="+Inf"} 2' in lines
+    assert 'test_latency_seconds_count{method="get"} 2' in lines
+    assert "test_queue_size 3.0" in lines
+
+
+def test_query_stats(act):
+    tg_user_id = int(Utils.get_random_number(5))
+
+    async def get_current_sessions():
+        with collect_queries("test") as stats:
+            async with AsyncActions() as async_act:
+                for _ in range(3):
+                    await async_act.get_current_session(tg_user_id)
+            async with async_engine.begin() as connection:
+                await connection.execute(select(1))
+        await async_engine.dispose()
+        return stats
+
+    stats = asyncio.run(get_current_sessions())
+    assert stats.count == 4
+    # Закрытие сессии AsyncActions откатывает ее транзакцию, engine.begin() фиксирует свою
+    assert (stats.commits, stats.rollbacks) == (1, 1)
+    assert stats.methods["Actions.get_current_session"].count == 3
+    # Один и тот же запрос три раза подряд - кандидат в N+1
+    assert [count for _, count in stats.repeated_statements(3)] == [3]
+    assert stats.repeated_statements(4) == []
+
+
+def test_event_sink_saves_events_in_batches():
+    batches = []
+
+    async def writer(rows):
+        batches.append(rows)
+
+    async def log_events():
+        sink = EventSink(writer, batch_size=3, flush_interval=60, max_queue_size=10)
+        await sink.start()
+        for i in range(7):
+            await sink.put({"param1": str(i)})
+        await sink.stop()
+
+    asyncio.run(log_events())
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [row["param1"] for batch in batches for row in batch] == [str(i) for i in range(7)]
+
+
+def test_event_sink_put_nowait_drops_when_full():
+    batches = []
+
+    async def writer(rows):
+        batches.append(rows)
+
+    async def log_events():
+        sink = EventSink(writer, batch_size=10, flush_interval=60, max_queue_size=2)
+        sink.put_nowait({"param1": "not started"})
+        await sink.start()
+        for i in range(3):
+            sink.put_nowait({"param1": str(i)})
+        await sink.stop()
+        return sink.dropped
+
+    assert asyncio.run(log_events()) == 2
+    assert [row["param1"] for batch in batches for row in batch] == ["0", "1"]
+
+
+def test_outbox_rate_limits_and_retries():
+    sent = []
+    flood = {"chat1-1"}
+
+    def message(name):
+        async def call():
+            if name in flood:
+                flood.discard(name)
+                raise RetryAfter(0)
+            sent.append(name)
+            return name
+
+        return call
+
+    async def send_messages():
+        outbox = Outbox(rate=1000, burst=1, chat_rate=20, chat_burst=1, max_retries=1)
+        await outbox.start()
+        results = await asyncio.gather(
+            outbox.send(1, message("chat1-1")),
+            outbox.send(1, message("chat1-2")),
+            outbox.send(2, message("chat2")),
+        )
+        await outbox.stop()
+        return results
+
+    assert asyncio.run(send_messages()) == ["chat1-1", "chat1-2", "chat2"]
+    # Пока первый чат ждет после RetryAfter, второй чат не ждет его, а сообщения первого чата не меняют порядок
+    assert sent == ["chat2", "chat1-1", "chat1-2"]
+
+
+def test_outbox_pauses_all_chats_on_global_flood():
+    flood = {1, 2}
+
+    def message(chat_id):
+        async def call():
+            if chat_id in flood:
+                flood.discard(chat_id)
+                raise RetryAfter(1)
+            return chat_id
+
+        return call
+
+    async def send_messages():
+        outbox = Outbox(rate=1000, burst=10, chat_rate=1000, chat_burst=10, max_retries=1)
+        await outbox.start()
+        flooded = [asyncio.create_task(outbox.send(chat_id, message(chat_id))) for chat_id in (1, 2)]
+        await asyncio.sleep(0.1)
+        # RetryAfter пришел в два чата: третий чат тоже ждет, пока не закончится пауза
+        started_at = time.perf_counter()
+        await outbox.send(3, message(3))
+        waited = time.perf_counter() - started_at
+        await asyncio.gather(*flooded)
+        await outbox.stop()
+        return waited
+
+    assert asyncio.run(send_messages()) >= 0.5
+
+
+def test_update_scheduler_orders_updates_in_chat():
+    events = []
+    stats = []
+
+    async def process(scheduler, update_id, chat_id):
+        update = aiotypes.Update(update_id=update_id, message={"message_id": update_id, "chat": {"id": chat_id}})
+        data = {}
+        await scheduler.on_pre_process_update(update, data)
+        events.append(("start", update_id))
+        stats.append(scheduler.stats())
+        await asyncio.sleep(0.01)
+        events.append(("end", update_id))
+        await scheduler.on_post_process_update(update, [], data)
+
+    async def process_updates():
+        scheduler = UpdateScheduler(max_concurrency=2)
+        await asyncio.gather(
+            *(process(scheduler, update_id, chat_id) for update_id, chat_id in enumerate([1, 1, 2, 3]))
+        )
+        return scheduler.stats()
+
+    final_stats = asyncio.run(process_updates())
+    # Второй update чата 1 начинается только после первого, чаты 1 и 2 обрабатываются параллельно
+    assert events.index(("end", 0)) < events.index(("start", 1))
+    assert events[:2] == [("start", 0), ("start", 2)]
+    assert max(s.running for s in stats) == 2
+    assert stats[1].waiting == 1 and stats[1].max_chat_queue == 2
+    assert final_stats.processed == 4 and final_stats.chats == 0
+
+
+def test_unit_of_work_commits_once_per_update(act):
+    users = [
+        TelegramUser(
+            tg_user_id=int(Utils.get_random_number(9)),
+            name=Utils.get_random_text(10),
+            username=Utils.get_random_text(10),
+            specialty="test",
+        )
+        for _ in range(2)
+    ]
+
+    async def process(user, failed):
+        middleware = UnitOfWorkMiddleware()
+        update = aiotypes.Update(update_id=1)
+        data = {}
+        await middleware.on_pre_process_update(update, data)
+        async with unit_of_work() as first, unit_of_work() as second:
+            assert first is second
+            await first.add_user(user)
+        if failed:
+            await middleware.on_pre_process_error(update, Exception(), data)
+        await middleware.on_post_process_update(update, [], data)
+
+    async def process_updates():
+        try:
+            await process(users[0], failed=False)
+            await process(users[1], failed=True)
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(process_updates())
+    # Упавший update откатывается целиком
+    saved = act.db.execute(
+        select(models.TelegramUser.tg_user_id).where(models.TelegramUser.tg_user_id.in_([u.tg_user_id for u in users]))
+    )
+    assert saved.scalars().all() == [users[0].tg_user_id]
+    act.db.query(models.TelegramUser).filter_by(tg_user_id=users[0].tg_user_id).delete()
+    act.db.commit()
+
+
+def test_unit_of_work_commit_error_replies_and_releases_chat(monkeypatch):
+    sent = []
+
+    async def request(method, data=None, **kwargs):
+        sent.append(data["text"])
+        return {"message_id": len(sent), "date": 0, "chat": {"id": data["chat_id"], "type": "private"}}
+
+    async def fail_commit(self):
+        raise exc.OperationalError("COMMIT", {}, Exception("connection lost"))
+
+    monkeypatch.setattr(bot, "request", request)
+    monkeypatch.setattr(AsyncConnection, "commit", fail_commit)
+    manager = MiddlewareManager(dp)
+    manager.setup(UnitOfWorkMiddleware())
+    scheduler = manager.setup(UpdateScheduler(max_concurrency=1))
+
+    async def process_update():
+        update = aiotypes.Update(update_id=1, message={"message_id": 1, "date": 0, "chat": {"id": 1}})
+        data = {}
+        await manager.trigger("pre_process_update", (update, data))
+        async with unit_of_work() as act:
+            await act.get_current_session(1)
+        await send_text(1, "reply")
+        await manager.trigger("post_process_update", (update, [], data))
+
+    async def process_updates():
+        try:
+            await process_update()
+            # Следующий update того же чата не ждет вечно очереди, которую не отпустил упавший commit
+            await asyncio.wait_for(process_update(), 1)
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(process_updates())
+    assert scheduler.stats().running == 0 and scheduler.stats().chats == 0
+    # Ответ обработчика отброшен вместе с транзакцией, вместо него пользователь получает сообщение об ошибке
+    assert len(sent) == 2 and all(text.startswith("На сервере произошла ошибка") for text in sent)
+
+
+def test_unit_of_work_sends_messages_after_commit(monkeypatch):
+    sent = []
+
+    async def request(method, data=None, **kwargs):
+        sent.append(data["text"])
+        return {"message_id": len(sent), "date": 0, "chat": {"id": data["chat_id"], "type": "private"}}
+
+    monkeypatch.setattr(bot, "request", request)
+
+    async def process(text, failed):
+        middleware = UnitOfWorkMiddleware()
+        update = aiotypes.Update(update_id=1)
+        data = {}
+        await middleware.on_pre_process_update(update, data)
+        await send_text(1, text)
+        # До commit сообщение не отправляется
+        assert sent == []
+        if failed:
+            await middleware.on_pre_process_error(update, Exception(), data)
+            await send_text(1, "error")
+            assert sent == ["error"]
+            sent.clear()
+        await middleware.on_post_process_update(update, [], data)
+
+    async def process_updates():
+        await process("committed", failed=False)
+        assert sent == ["committed"]
+        sent.clear()
+        # Ответ упавшего update не отправляется, сообщение обработчика ошибок уходит сразу
+        await process("rolled back", failed=True)
+        assert sent == []
+
+    asyncio.run(process_updates())
+
+
+def test_tracing_middleware():
+    exported = []
+
+    async def process_update():
+        middleware = TracingMiddleware(exported.append)
+        update = aiotypes.Update(
+            update_id=1, message={"message_id": 1, "date": 0, "chat": {"id": 42, "type": "private"}, "text": "/start"}
+        )
+        data = {}
+        await middleware.on_pre_process_update(update, data)
+        with span("send_message", chat_id=42):
+            render_template("01_hello", username="test")
+        with pytest.raises(ValueError):
+            with span("fsm get_state"):
+                raise ValueError()
+        await middleware.on_post_process_update(update, [], data)
+
+    asyncio.run(process_update())
+    spans = {row["name"]: row for row in exported}
+    assert list(spans) == ["update", "send_message", "render_template", "fsm get_state"]
+    assert len({row["traceId"] for row in exported}) == 1
+    assert "parentSpanId" not in spans["update"]
+    assert spans["send_message"]["parentSpanId"] == spans["update"]["spanId"]
+    assert spans["render_template"]["parentSpanId"] == spans["send_message"]["spanId"]
+    assert spans["fsm get_state"]["status"] == {"code": 2, "message": "ValueError"}
+    assert {"key": "chat_id", "value": {"intValue": "42"}} in spans["update"]["attributes"]
+    # Вне update span не записываются
+    with span("log_event") as outside:
+        assert outside is None
+
+
+def test_route_updates_by_chat():
+    message = {"update_id": 1, "message": {"chat": {"id": 42}, "from": {"id": 7}}}
+    callback = {"update_id": 2, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": 42}}}}
+    inline = {"update_id": 3, "inline_query": {"from": {"id": 7}}}
+    assert [get_update_chat_id(update) for update in (message, callback, inline)] == [42, 42, 7]
+    assert get_worker_index(message, 4) == get_worker_index(callback, 4) == 2
+
+
+def test_webhook_replies_in_response():
+    tg_user_id = int(Utils.get_random_number(9))
+    username = Utils.get_random_text(10)
+    update = {
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": tg_user_id, "type": "private"},
+            "from": {"id": tg_user_id, "is_bot": False, "first_name": "Webhook", "username": username},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+    async def post_update():
+        reply_in_webhook(dp)
+        app = web.Application()
+        configure_app(dp, app, "/webhook")
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        webhook_url = f"http://127.0.0.1:{runner.addresses[0][1]}/webhook"
+
+        async with FakeTelegramServer() as telegram:
+            bot.server = telegram.api_server
+            try:
+                async with ClientSession() as session:
+                    async with session.post(webhook_url, json=update) as response:
+                        return await response.json(), telegram.sent_messages()
+            finally:
+                await (await bot.get_session()).close()
+                await runner.cleanup()
+                await async_engine.dispose()
+
+    webhook_response, sent_messages = asyncio.run(post_update())
+    assert webhook_response["method"] == "sendMessage"
+    assert webhook_response["text"] == get_main_menu_view().text
+    assert [int(message["chat_id"]) for message in sent_messages] == [tg_user_id]
+    assert sent_messages[0]["text"].startswith("👋 Webhook")
+
+
 def test_no_add_answer_with_empty_text(act):
     user = TelegramUser(
         tg_user_id=Utils.get_random_number(5),
@@ -298,6 +995,31 @@ def test_start_test_after_reset_session(act):
     act.remove_questions("test")
 
 
+def test_template_registry(tmp_path):
+    folder = tmp_path / "templates"
+    shutil.copytree(settings.static_folder, folder)
+    registry = TemplateRegistry(folder, reload_interval=0)
+    assert registry.get("01_hello").render(username="user").startswith("👋 user\n")
+
+    hello = folder / "01_hello.md"
+    hello.write_text("  Привет, {username}!\n", encoding="utf-8")
+    os.utime(hello, (0, hello.stat().st_mtime + 1))
+    registry.reload_changed()
+    assert registry.get("01_hello.md").render(username="user") == "Привет, user!"
+
+    hello.write_text("Привет, {name}!", encoding="utf-8")
+    with pytest.raises(WrongTemplateFormat):
+        registry.load()
+
+
+def test_static_views():
+    view = get_main_menu_view()
+    assert view is get_main_menu_view()
+    assert json.loads(view.markup)["keyboard"] == [[{"text": f"✅ {Specialty.ANDROID.value}"}]]
+    assert json.loads(get_finish_view().markup)["one_time_keyboard"]
+    assert not hasattr(view, "__dict__")
+
+
 def test_add_bot_score(act):
     user = TelegramUser(
         tg_user_id=Utils.get_random_number(5),
@@ -381,6 +1103,66 @@ def test_add_question_score(act):
     act.remove_questions("test")
 
 
+def test_session_score(act):
+    specialty = Utils.get_random_text(10)
+    user = TelegramUser(
+        tg_user_id=Utils.get_random_number(5),
+        name=Utils.get_random_text(10),
+        username=Utils.get_random_text(10),
+        specialty=specialty,
+    )
+    act.add_user(user)
+    question = act.add_question(
+        Question(
+            question_type=specialty,
+            question_category=Utils.get_random_text(10),
+            text_question=Utils.get_random_text(10),
+            text_answer=Utils.get_random_text(10),
+        )
+    )
+    session_id = act.get_next_question(user.tg_user_id).session_id
+    # Пока оценок нет, оценка пользователя 0 (а не деление на ноль)
+    assert act.get_session_score(user.tg_user_id) == SessionScore(0, 0, 0)
+    assert act.get_session_score(user.tg_user_id).percent == 0
+    act.add_question_score(question.id, user.tg_user_id, UserScore.RIGHT.value)
+    act.add_question_score(question.id, user.tg_user_id, UserScore.PARTLY.value)
+    act.add_train_material(question.id, user.tg_user_id)
+    assert act.get_session_score(user.tg_user_id) == SessionScore(2, 3, 1)
+    assert act.get_session_score(user.tg_user_id, session_id).percent == 75
+
+
+def test_read_replica_routing(act):
+    user = TelegramUser(
+        tg_user_id=Utils.get_random_number(5),
+        name=Utils.get_random_text(10),
+        username=Utils.get_random_text(10),
+        specialty="test",
+    )
+    act.add_user(user)
+
+    async def read_and_write():
+        # Вместо реплики - отдельная сессия той же базы
+        replica = AsyncSession(bind=async_engine)
+        async with AsyncActions(replica_db=replica) as async_act:
+            read_dbs = [async_act.read_db(user.tg_user_id)]
+            reviews = await async_act.get_bot_review(user)
+            await async_act.add_bot_score(user, 5)
+            read_dbs.append(async_act.read_db(user.tg_user_id))
+            primary = async_act.db
+        async with AsyncActions(replica_db=AsyncSession(bind=async_engine)) as async_act:
+            # Запись была только что: реплика могла ее еще не получить
+            read_dbs.append(async_act.read_db(user.tg_user_id))
+            new_reviews = await async_act.get_bot_review(user)
+            recent_db = async_act.db
+        await async_engine.dispose()
+        return read_dbs, [replica, primary, recent_db], reviews, new_reviews
+
+    read_dbs, expected_dbs, reviews, new_reviews = asyncio.run(read_and_write())
+    assert all(read_db is expected_db for read_db, expected_db in zip(read_dbs, expected_dbs))
+    assert reviews == []
+    assert [review.bot_score for review in new_reviews] == [5]
+
+
 def test_add_train_material(act):
     user = TelegramUser(
         tg_user_id=Utils.get_random_number(5),
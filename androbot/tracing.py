@@ -0,0 +1,251 @@
+import asyncio
+import json
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiohttp import ClientSession
+
+from .update_scheduler import get_chat_id
+
+SpanRow = Dict[str, Any]
+AttributeValue = Union[str, int, float, bool]
+
+# Имя сервиса в экспортированных трассах
+SERVICE_NAME = "androbot"
+
+# Ключ в data middleware, под которым хранится трасса update
+_TRACE_KEY = "trace"
+
+# Коды статуса span в OTLP
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+
+def _otlp_value(value: AttributeValue) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """
+    Участок обработки update: когда начался и закончился, внутри какого участка выполнялся и чем закончился
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, AttributeValue]):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def finish(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def to_otlp(self) -> SpanRow:
+        """
+        Span в формате OTLP JSON
+        """
+        row: SpanRow = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": _STATUS_ERROR, "message": self.error} if self.error else {"code": _STATUS_OK},
+        }
+        if self.parent_id is not None:
+            row["parentSpanId"] = self.parent_id
+        return row
+
+
+class Trace:
+    """
+    Все span одного update
+    """
+
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self) -> None:
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: List[Span] = []
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def start_span(name: str, **attributes: AttributeValue) -> Optional[Span]:
+    """
+    Начинаем span внутри текущего. Вне трассы (трассировка выключена, консольные скрипты) - None
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    parent = _current_span.get()
+    new_span = Span(trace.trace_id, parent.span_id if parent is not None else None, name, attributes)
+    trace.spans.append(new_span)
+    return new_span
+
+
+@contextmanager
+def span(name: str, **attributes: AttributeValue) -> Iterator[Optional[Span]]:
+    """
+    Span на время выполнения блока: запросы и вложенные span внутри блока будут его потомками
+    """
+    new_span = start_span(name, **attributes)
+    if new_span is None:
+        yield None
+        return
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = type(e).__name__
+        raise
+    finally:
+        new_span.finish()
+        _current_span.reset(token)
+
+
+class TraceExporter:
+    """
+    Выгружает span в файл (по span в формате OTLP JSON на строку) и/или в OTLP/HTTP коллектор (POST /v1/traces)
+    """
+
+    def __init__(self, file: Optional[Path] = None, otlp_endpoint: Optional[str] = None) -> None:
+        self.file = file
+        self.otlp_endpoint = otlp_endpoint
+        self._session: Optional[ClientSession] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.file is not None or bool(self.otlp_endpoint)
+
+    async def export(self, spans: List[SpanRow]) -> None:
+        if self.file is not None:
+            lines = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in spans)
+            await asyncio.get_running_loop().run_in_executor(None, self._append, lines)
+        if self.otlp_endpoint:
+            if self._session is None:
+                self._session = ClientSession()
+            payload = {
+                "resourceSpans": [
+                    {
+                        "resource": {"attributes": [{"key": "service.name", "value": _otlp_value(SERVICE_NAME)}]},
+                        "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+                    }
+                ]
+            }
+            async with self._session.post(self.otlp_endpoint, json=payload) as response:
+                response.raise_for_status()
+
+    def _append(self, lines: str) -> None:
+        assert self.file is not None
+        with open(self.file, "a", encoding="utf-8") as file:
+            file.write(lines)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class _UpdateTrace:
+    __slots__ = ("trace", "root", "handler")
+
+    def __init__(self, trace: Trace, root: Span) -> None:
+        self.trace = trace
+        self.root = root
+        self.handler: Optional[Span] = None
+
+
+_current_update_trace: ContextVar[Optional[_UpdateTrace]] = ContextVar("update_trace", default=None)
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Трасса на каждый update: корневой span update, внутри него span обработчика,
+    а в нем - обращения к FSM, вызовы Actions, рендер шаблонов, log_event и отправка сообщений.
+    Законченная трасса уходит в export по одному span. export не должен ждать: update в этот момент
+    еще держит очередь своего чата, поэтому медленная выгрузка трасс не должна тормозить ответы пользователям.
+    Должен быть подключен после UnitOfWorkMiddleware (чтобы в трассу попал commit) и раньше update_scheduler
+    (чтобы в трассу попало ожидание очереди чата)
+    """
+
+    def __init__(self, export: Callable[[SpanRow], None], enabled: bool = True) -> None:
+        super().__init__()
+        self.export = export
+        self.enabled = enabled
+
+    async def on_pre_process_update(self, update: types.Update, data: dict) -> None:
+        if not self.enabled:
+            return
+        trace = Trace()
+        root = Span(trace.trace_id, None, "update", {"update_id": update.update_id})
+        chat_id = get_chat_id(update)
+        if chat_id is not None:
+            root.attributes["chat_id"] = chat_id
+        trace.spans.append(root)
+        update_trace = _UpdateTrace(trace, root)
+        data[_TRACE_KEY] = (
+            update_trace,
+            _current_update_trace.set(update_trace),
+            _current_trace.set(trace),
+            _current_span.set(root),
+        )
+
+    async def on_process_message(self, message: types.Message, data: dict) -> None:
+        self._start_handler()
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict) -> None:
+        self._start_handler()
+
+    def _start_handler(self) -> None:
+        update_trace = _current_update_trace.get()
+        handler = current_handler.get(None)
+        if update_trace is None or handler is None:
+            return
+        update_trace.root.attributes["handler"] = handler.__name__
+        update_trace.handler = start_span(f"handler {handler.__name__}")
+        # Span обработчика остается текущим до конца update
+        _current_span.set(update_trace.handler)
+
+    async def on_pre_process_error(self, update: types.Update, exception: BaseException, data: dict) -> None:
+        update_trace = _current_update_trace.get()
+        if update_trace is None:
+            return
+        update_trace.root.error = type(exception).__name__
+        if update_trace.handler is not None:
+            update_trace.handler.error = update_trace.root.error
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict) -> None:
+        if _TRACE_KEY not in data:
+            return
+        update_trace, update_trace_token, trace_token, span_token = data.pop(_TRACE_KEY)
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _current_update_trace.reset(update_trace_token)
+        for trace_span in update_trace.trace.spans:
+            trace_span.finish()
+        for trace_span in update_trace.trace.spans:
+            self.export(trace_span.to_otlp())
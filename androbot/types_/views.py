@@ -1,40 +1,52 @@
-from typing import Optional
+import json
+from typing import Optional, Union
 
 import aiogram.types as aiotypes
-from pydantic.dataclasses import dataclass
 
 from . import DialogueStates
 
+Markup = Union[str, aiotypes.ReplyKeyboardMarkup, aiotypes.ReplyKeyboardRemove]
 
-class PydanticConfig:
-    arbitrary_types_allowed = True
+
+def serialize_markup(markup: Union[aiotypes.ReplyKeyboardMarkup, aiotypes.ReplyKeyboardRemove]) -> str:
+    """
+    Сериализуем клавиатуру в json. Строку aiogram передает в Telegram как есть,
+    поэтому клавиатуру, собранную один раз, не нужно сериализовать при каждом ответе
+    """
+    return json.dumps(markup.to_python(), ensure_ascii=False)
+
+
+REMOVE_KEYBOARD = serialize_markup(aiotypes.ReplyKeyboardRemove())
 
 
-@dataclass(config=PydanticConfig)
 class View:
     """
     Класс предназначен для подготовки ответа бота.
     Содержит текст ответа (в разметке Markdown), а также клавитуру,
     которую отправит бот в ответ в параметре reply_markup
-    и состояние бота, которое нужно установить в результате
+    и состояние бота, которое нужно установить в результате.
+    Для вопроса теста - id вопроса и id сессии, которые обработчик сохраняет в данных FSM.
+    Статические View из views.py общие для всех ответов, поэтому View не изменяем после создания
     """
 
-    text: str
-    markup: Optional[aiotypes.ReplyKeyboardMarkup] = None
-    question_id: Optional[int] = None
-    state: Optional[DialogueStates] = None
+    __slots__ = ("text", "markup", "question_id", "state", "session_id")
 
     def __init__(
         self,
         text: str,
-        markup: Optional[aiotypes.ReplyKeyboardMarkup] = None,
+        markup: Optional[Markup] = None,
         question_id: Optional[int] = None,
         state: Optional[DialogueStates] = None,
+        session_id: Optional[int] = None,
     ):
         self.text = text
-        self.markup = markup
+        self.markup = markup if markup else REMOVE_KEYBOARD
         self.question_id = question_id
         self.state = state
+        self.session_id = session_id
 
-        if not self.markup:
-            self.markup = aiotypes.ReplyKeyboardRemove()
+    def __repr__(self) -> str:
+        return (
+            f"View(text={self.text!r}, markup={self.markup!r}, question_id={self.question_id}, state={self.state}, "
+            f"session_id={self.session_id})"
+        )
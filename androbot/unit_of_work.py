@@ -0,0 +1,150 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from .actions import AsyncActions
+from .database import IN_UNIT_OF_WORK, async_engine
+from .event_sink import EventRow, event_sink
+from .replica import recent_writes
+from .tracing import span
+
+# Ключ в data middleware, под которым хранится unit of work update
+_UNIT_KEY = "unit_of_work"
+
+SendCall = Callable[[], Awaitable[Any]]
+
+
+class UnitOfWork:
+    """
+    Одна транзакция и одни AsyncActions на весь update.
+    Соединение берется из пула при первом обращении к базе, commit в функциях crud
+    внешнюю транзакцию не завершают: она фиксируется один раз в конце обработки update,
+    а если обработчик упал - откатывается.
+    События update уходят в event_sink после commit, иначе они могут сослаться на еще не сохраненного пользователя.
+    Сообщения пользователю тоже отправляются только после успешного commit (send_messages): если commit не прошел,
+    пользователь не получит ответ о том, чего в базе нет
+    """
+
+    def __init__(self) -> None:
+        self.failed = False
+        self.events: List[EventRow] = []
+        self.sends: List[SendCall] = []
+        self._connection: Optional[AsyncConnection] = None
+        self._actions: Optional[AsyncActions] = None
+
+    async def get_actions(self) -> AsyncActions:
+        if self._actions is None:
+            self._connection = await async_engine.connect()
+            await self._connection.begin()
+            db = AsyncSession(
+                bind=self._connection, autoflush=False, expire_on_commit=False, info={IN_UNIT_OF_WORK: True}
+            )
+            self._actions = AsyncActions(db)
+        return self._actions
+
+    async def finish(self) -> None:
+        try:
+            with span("rollback" if self.failed else "commit"):
+                await self._finish_transaction()
+        except BaseException:
+            self.failed = True
+            raise
+        finally:
+            for row in self.events:
+                await event_sink.put(row)
+            self.events = []
+
+    async def send_messages(self) -> None:
+        """
+        Отправляем сообщения update, если транзакция зафиксирована, иначе отбрасываем их
+        """
+        sends, self.sends = self.sends, []
+        if self.failed:
+            return
+        for send in sends:
+            await send()
+
+    async def _finish_transaction(self) -> None:
+        if self._connection is None or self._actions is None:
+            return
+        try:
+            await self._actions.close()
+            if self.failed:
+                await self._connection.rollback()
+            else:
+                await self._connection.commit()
+                # Окно чтения с основной базы отсчитываем от commit: до него реплика записей не увидит
+                for tg_user_id in self._actions.written_users:
+                    recent_writes.mark(tg_user_id)
+        finally:
+            await self._connection.close()
+            self._connection = None
+            self._actions = None
+
+
+_current_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar("unit_of_work", default=None)
+
+
+def get_unit_of_work() -> Optional[UnitOfWork]:
+    return _current_unit_of_work.get()
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncActions]:
+    """
+    AsyncActions текущего update. Вне обработки update (тесты, консольные скрипты) - отдельные AsyncActions
+    """
+    unit = _current_unit_of_work.get()
+    if unit is None:
+        async with AsyncActions() as act:
+            yield act
+    else:
+        yield await unit.get_actions()
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """
+    Открывает unit of work на каждый update и завершает его после обработки.
+    Должен быть подключен раньше update_scheduler, чтобы транзакция фиксировалась
+    до того, как начнет обрабатываться следующий update того же чата
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict) -> None:
+        unit = UnitOfWork()
+        data[_UNIT_KEY] = unit, _current_unit_of_work.set(unit)
+
+    async def on_pre_process_error(self, update: types.Update, exception: BaseException, data: dict) -> None:
+        unit = _current_unit_of_work.get()
+        if unit is not None:
+            unit.failed = True
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict) -> None:
+        if _UNIT_KEY not in data:
+            return
+        unit, token = data.pop(_UNIT_KEY)
+        _current_unit_of_work.reset(token)
+        # Ошибки не пробрасываем: иначе aiogram не вызовет on_post_process_update следующих middleware
+        # и update_scheduler не отпустит очередь чата
+        try:
+            await unit.finish()
+        except Exception as e:
+            logger.error("Can't commit update {}: {}", update.update_id, repr(e))
+            # Обработчик уже ответил бы пользователю, но его ответы отброшены вместе с транзакцией:
+            # сообщаем об ошибке так же, как об ошибке в обработчике
+            await self._handle_error(update, e)
+            return
+        try:
+            await unit.send_messages()
+        except Exception as e:
+            logger.error("Can't send messages of update {}: {}", update.update_id, repr(e))
+
+    async def _handle_error(self, update: types.Update, exception: Exception) -> None:
+        try:
+            await self.manager.dispatcher.errors_handlers.notify(update, exception)
+        except Exception as e:
+            logger.error("Can't handle commit error of update {}: {}", update.update_id, repr(e))
@@ -0,0 +1,129 @@
+import asyncio
+from typing import Dict, NamedTuple, Optional
+
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from .config import settings
+
+# Ключ в data middleware, под которым хранится чат обрабатываемого update
+_CHAT_KEY = "update_scheduler_chat"
+
+
+def get_chat_id(update: types.Update) -> Optional[int]:
+    """
+    Id чата update, для update без чата (inline запросы и т.п.) - id пользователя
+    """
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+    if message is None and update.callback_query is not None:
+        message = update.callback_query.message
+    if message is not None:
+        return message.chat.id
+
+    for event in (update.callback_query, update.inline_query, update.chosen_inline_result, update.shipping_query):
+        if event is not None:
+            return event.from_user.id
+    return None
+
+
+class SchedulerStats(NamedTuple):
+    """
+    Состояние планировщика: сколько update обрабатывается, сколько ждут очереди,
+    у скольких чатов есть update в работе и сколько update в самой длинной очереди чата
+    """
+
+    running: int
+    waiting: int
+    chats: int
+    max_chat_queue: int
+    processed: int
+
+
+class _ChatQueue:
+    __slots__ = ("lock", "size")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.size = 0
+
+
+class UpdateScheduler(BaseMiddleware):
+    """
+    Update разных чатов обрабатываются параллельно, но не больше max_concurrency одновременно,
+    а update одного чата - строго по очереди в порядке поступления.
+    Так два быстрых нажатия одного пользователя не выдадут ему два вопроса сразу
+    """
+
+    def __init__(self, max_concurrency: int = settings.updates_concurrency) -> None:
+        super().__init__()
+        self.max_concurrency = max_concurrency
+        self._chats: Dict[int, _ChatQueue] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._running = 0
+        self._waiting = 0
+        self._processed = 0
+
+    def stats(self) -> SchedulerStats:
+        sizes = [chat.size for chat in self._chats.values()]
+        return SchedulerStats(
+            running=self._running,
+            waiting=self._waiting,
+            chats=len(sizes),
+            max_chat_queue=max(sizes, default=0),
+            processed=self._processed,
+        )
+
+    async def on_pre_process_update(self, update: types.Update, data: dict) -> None:
+        if self._semaphore is None:
+            # Семафор создаем в event loop, в котором обрабатываются update
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        chat_id = get_chat_id(update)
+        chat = None
+        if chat_id is not None:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _ChatQueue()
+            chat.size += 1
+
+        self._waiting += 1
+        try:
+            # Пока update ждет своей очереди в чате, слот параллельной обработки он не занимает
+            if chat is not None:
+                await chat.lock.acquire()
+            try:
+                await self._semaphore.acquire()
+            except BaseException:
+                if chat is not None:
+                    chat.lock.release()
+                raise
+        except BaseException:
+            if chat_id is not None and chat is not None:
+                self._leave(chat_id, chat)
+            raise
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        data[_CHAT_KEY] = chat_id
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict) -> None:
+        if _CHAT_KEY not in data:
+            return
+        chat_id = data.pop(_CHAT_KEY)
+        assert self._semaphore is not None
+        self._semaphore.release()
+        self._running -= 1
+        self._processed += 1
+        if chat_id is not None:
+            chat = self._chats[chat_id]
+            chat.lock.release()
+            self._leave(chat_id, chat)
+
+    def _leave(self, chat_id: int, chat: _ChatQueue) -> None:
+        chat.size -= 1
+        if chat.size == 0:
+            del self._chats[chat_id]
+
+
+update_scheduler = UpdateScheduler()
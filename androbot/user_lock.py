@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from loguru import logger
+from sqlalchemy import BigInteger, cast, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import IN_UNIT_OF_WORK
+from .errors import UserLockTimeout
+
+# Старший бит ключа advisory lock отличает блокировки пользователей от других блокировок в базе
+USER_LOCK_NAMESPACE = 1 << 62
+
+# Код ошибки Postgres, когда блокировку не удалось получить за lock_timeout
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def get_user_lock_key(tg_user_id: int) -> int:
+    return USER_LOCK_NAMESPACE | int(tg_user_id)
+
+
+def _acquire(conn: Connection, tg_user_id: int, try_lock: Any, lock: Any, timeout: float) -> None:
+    if conn.execute(select(try_lock)).scalar():
+        return
+
+    logger.debug("Waiting for lock of tg_user_id={}", tg_user_id)
+    lock_timeout = conn.execute(select(func.current_setting("lock_timeout"))).scalar()
+    conn.execute(select(func.set_config("lock_timeout", f"{int(timeout * 1000)}ms", True)))
+    try:
+        conn.execute(select(lock))
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE:
+            raise
+        raise UserLockTimeout(f"Can't lock tg_user_id={tg_user_id} in {timeout} seconds") from e
+    conn.execute(select(func.set_config("lock_timeout", lock_timeout, True)))
+
+
+@contextmanager
+def user_lock(db: Session, tg_user_id: int, timeout: float = settings.user_lock_timeout) -> Iterator[None]:
+    """
+    Блокировка пользователя tg_user_id на время изменения его текущей сессии, общая для всех процессов бота
+    (advisory lock в Postgres).
+    Внутри unit of work update блокировка берется на уровне транзакции и снимается при ее commit,
+    иначе - на отдельном соединении из пула, потому что db отдает соединение в пул после каждого commit.
+    Если пользователь не заблокирован, это один запрос pg_try_advisory_lock без ожидания,
+    иначе ждем не дольше timeout секунд и бросаем UserLockTimeout
+    """
+    # asyncpg не приводит типы сам, без cast он выбирает вариант функции с ключом int4
+    key = cast(get_user_lock_key(tg_user_id), BigInteger)
+    if db.info.get(IN_UNIT_OF_WORK):
+        _acquire(
+            db.connection(), tg_user_id, func.pg_try_advisory_xact_lock(key), func.pg_advisory_xact_lock(key), timeout
+        )
+        yield
+        return
+
+    with db.get_bind().connect() as conn:
+        _acquire(conn, tg_user_id, func.pg_try_advisory_lock(key), func.pg_advisory_lock(key), timeout)
+        try:
+            yield
+        finally:
+            conn.execute(select(func.pg_advisory_unlock(key)))
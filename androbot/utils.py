@@ -2,10 +2,11 @@ import random
 import string
 from datetime import datetime
 
-from .actions import Actions
 from .errors import TooManyParamsForLoggingActions
-from .schemas import EventsLog
+from .event_sink import EventRow, event_sink
+from .tracing import span
 from .types_ import Events
+from .unit_of_work import get_unit_of_work
 
 
 class Utils:
@@ -20,15 +21,26 @@ class Utils:
         return "".join(random.choice(letters) for i in range(num))
 
 
-def log_event(tg_user_id: int, event: Events, *args):
+async def log_event(tg_user_id: int, event: Events, *args):
+    """
+    Добавляем событие в буфер event_sink, в базу данных оно попадет вместе с пачкой других событий.
+    Во время обработки update событие попадет в буфер после commit транзакции update
+    """
 
-    if len(args) > 5:
-        raise TooManyParamsForLoggingActions("Can't log more than 5 parameters")
+    with span("log_event", event=event.name):
+        if len(args) > 5:
+            raise TooManyParamsForLoggingActions("Can't log more than 5 parameters")
 
-    new_event = EventsLog(tg_user_id=tg_user_id, event_type=event, datetime=datetime.utcnow())
+        new_event: EventRow = {"tg_user_id": tg_user_id, "event_type": event.value, "datetime": datetime.utcnow()}
 
-    for i, param in enumerate(args, 1):
-        setattr(new_event, f"param{i}", param)
+        # В multi-row INSERT у всех строк должен быть одинаковый набор колонок, поэтому заполняем все 5 параметров.
+        # asyncpg не приводит типы сам, поэтому параметры сохраняем строками
+        params = list(args) + [None] * (5 - len(args))
+        for i, param in enumerate(params, 1):
+            new_event[f"param{i}"] = str(param) if param is not None else None
 
-    with Actions() as act:
-        act.add_event(new_event)
+        unit = get_unit_of_work()
+        if unit is not None:
+            unit.events.append(new_event)
+        else:
+            await event_sink.put(new_event)
@@ -1,64 +1,110 @@
+from typing import Dict, Optional, Sequence, Tuple
+
 import aiogram.types as aiotypes
 
-from .actions import Actions, get_main_menu, start_new_test
+from .actions import AsyncActions, SessionScore, get_main_menu, start_new_test
 from .errors import NoNewQuestionsException
-from .templates import get_template, render_message
+from .schemas import QuestionRecord
+from .templates import Template, get_template, render_template, template_registry
 from .types_ import AnswerTypes, DialogueStates, View
+from .types_.views import REMOVE_KEYBOARD, serialize_markup
+from .unit_of_work import unit_of_work
+
+
+def build_keyboard(*rows: Sequence[str]) -> str:
+    """
+    Собирает клавиатуру из рядов кнопок и сразу сериализует ее
+    """
+    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
+    for row in rows:
+        reply_kb.row(*[aiotypes.KeyboardButton(text) for text in row])
+    return serialize_markup(reply_kb)
+
+
+MAIN_MENU_KEYBOARD = build_keyboard(*[[f"✅ {speciality}"] for speciality in get_main_menu()])
+RESET_TEST_KEYBOARD = build_keyboard(["🏠 Главное меню", "🔄 Начать с начала", "✅ Продолжить"])
+ANSWER_TYPE_KEYBOARD = build_keyboard(list(reversed(start_new_test())))
+READY_FOR_TEST_KEYBOARD = build_keyboard(["🚫 Отмена", "✅ Готов!"])
+QUESTION_KEYBOARD = build_keyboard(["🤷‍♂️ Не понял вопрос", "🙅🏻‍♀️ Не знаю ответ"])
+SELF_SCORE_KEYBOARD = build_keyboard(["⚖️ Частично верный"], ["❌ Неверный", "✅ Верный"])
+MATERIALS_OR_NEXT_KEYBOARD = build_keyboard(["📚 Отправь материалы", "➡️ Следующий вопрос"])
+NEXT_QUESTION_KEYBOARD = build_keyboard(["➡️ Следующий вопрос"])
+CORRECT_ANSWER_OR_NEXT_KEYBOARD = build_keyboard(["💡 Эталонный ответ", "➡️ Следующий вопрос"])
+USER_SCORE_KEYBOARD = build_keyboard(["👍 Оценить бота", "🏠 Главное меню"])
+BOT_SCORE_KEYBOARD = build_keyboard([str(x) for x in range(1, 6)], [str(x) for x in range(6, 11)])
+FINISH_KEYBOARD = build_keyboard(["🏠 Главное меню"])
+
+# Статические экраны: шаблон без параметров и клавиатура к нему
+STATIC_VIEWS: Dict[str, str] = {
+    "02_start": MAIN_MENU_KEYBOARD,
+    "03_do_you_want_to_reset_test": RESET_TEST_KEYBOARD,
+    "04_resetting_test": REMOVE_KEYBOARD,
+    "05_select_answer_type": ANSWER_TYPE_KEYBOARD,
+    "31_why_do_not_understand": REMOVE_KEYBOARD,
+    "42_do_you_want_additional_materials": MATERIALS_OR_NEXT_KEYBOARD,
+    "45_do_you_want_to_get_correct_answer": CORRECT_ANSWER_OR_NEXT_KEYBOARD,
+    "55_bot_score": BOT_SCORE_KEYBOARD,
+    "56_bot_review": REMOVE_KEYBOARD,
+    "60_finish": FINISH_KEYBOARD,
+}
+
+_static_views: Dict[str, Tuple[Template, View]] = {}
+
+
+def get_static_view(template_name: str) -> View:
+    """
+    Возвращает готовый View статического экрана.
+    View собирается заново, только если шаблон перечитали с диска
+    """
+    template = template_registry.get(template_name)
+    static_view = _static_views.get(template_name)
+    if static_view is None or static_view[0] is not template:
+        static_view = template, View(template.text, STATIC_VIEWS[template_name])
+        _static_views[template_name] = static_view
+    return static_view[1]
+
+
+def build_static_views() -> None:
+    """
+    Собирает все статические View заранее (при старте бота)
+    """
+    for template_name in STATIC_VIEWS:
+        get_static_view(template_name)
 
 
 def get_hello_message(username: str) -> View:
     """
     Возвращает текст приветствия бота - новому пользователю
     """
-    return View(render_message(get_template("01_hello"), username=username))
+    return View(render_template("01_hello", username=username))
 
 
 def get_main_menu_view() -> View:
     """
     Возвращает View старатовой страницы бота
     """
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    for speciality in get_main_menu():
-        btn_1 = aiotypes.KeyboardButton(f"✅ {speciality}")
-        reply_kb.add(btn_1)
-
-    return View(get_template("02_start"), reply_kb)
+    return get_static_view("02_start")
 
 
 def get_do_you_want_to_reset_test_view() -> View:
     """
     Возвращает View в котором спрашивает, нужно ли продолжить начатный тест, или начать сначала
     """
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    row_buttons = [
-        aiotypes.KeyboardButton("🏠 Главное меню"),
-        aiotypes.KeyboardButton("🔄 Начать с начала"),
-        aiotypes.KeyboardButton("✅ Продолжить"),
-    ]
-    reply_kb.row(*row_buttons)
-
-    return View(get_template("03_do_you_want_to_reset_test"), reply_kb)
+    return get_static_view("03_do_you_want_to_reset_test")
 
 
 def get_resetting_test_view() -> View:
     """
     Возвращает View в котором уведомляет о сбросе тестирования
     """
-    return View(get_template("04_resetting_test"))
+    return get_static_view("04_resetting_test")
 
 
 def get_select_answer_type_view() -> View:
     """
     Возвращает View в котором предлагает ответить, каким способом пользователь предпочитает отвечать
     """
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    row_buttons = []
-    for answer_type in reversed(start_new_test()):
-        btn = aiotypes.KeyboardButton(answer_type)
-        row_buttons.append(btn)
-    reply_kb.row(*row_buttons)
-
-    return View(get_template("05_select_answer_type"), reply_kb)
+    return get_static_view("05_select_answer_type")
 
 
 def get_are_you_ready_for_test_view(answer_type: str) -> View:
@@ -69,21 +115,18 @@ def get_are_you_ready_for_test_view(answer_type: str) -> View:
         answer_way = "отправкой текста"
     elif answer_type == AnswerTypes.VOICE.value:
         answer_way = "отправкой голосового сообщения"
-    answer_text = render_message(get_template("09_are_you_ready_for_test"), answer_way=answer_way)
-
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    reply_kb.row(aiotypes.KeyboardButton("🚫 Отмена"), aiotypes.KeyboardButton("✅ Готов!"))
+    answer_text = render_template("09_are_you_ready_for_test", answer_way=answer_way)
 
-    return View(answer_text, reply_kb)
+    return View(answer_text, READY_FOR_TEST_KEYBOARD)
 
 
-def get_next_question(tg_user_id: int, answer_type: str) -> View:
+async def get_next_question(tg_user_id: int, answer_type: str) -> View:
     """
     Возвращает View со следующим вопросом для пользователя
     """
     try:
-        with Actions() as act:
-            question, current_question_number, questions_count = act.get_next_test(tg_user_id)
+        async with unit_of_work() as act:
+            question, current_question_number, questions_count, session_id = await act.get_next_question(tg_user_id)
 
     except NoNewQuestionsException:
         return View("В базе не осталось новых вопросов")
@@ -93,139 +136,100 @@ def get_next_question(tg_user_id: int, answer_type: str) -> View:
     else:
         call_to_action = "текстом"
 
-    answer_text = render_message(
-        get_template("20_question"),
-        question=question.text_question.strip(),
-        question_category=question.question_category.strip(),
+    answer_text = render_template(
+        "20_question",
+        question=(question.text_question or "").strip(),
+        question_category=(question.question_category or "").strip(),
         call_to_action=call_to_action,
         current_question_number=current_question_number,
         questions_count=questions_count,
     )
 
-    row_buttons = [
-        aiotypes.KeyboardButton("🤷‍♂️ Не понял вопрос"),
-        aiotypes.KeyboardButton("🙅🏻‍♀️ Не знаю ответ"),
-    ]
+    return View(answer_text, QUESTION_KEYBOARD, question.id, session_id=session_id)
 
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    reply_kb.row(*row_buttons)
 
-    return View(answer_text, reply_kb, question.id)
+async def _get_question(act: AsyncActions, tg_user_id: int, question_id: Optional[int]) -> QuestionRecord:
+    """
+    Вопрос question_id из банка вопросов, а если id вопроса не сохранен в данных FSM - текущий вопрос из базы
+    """
+    question = (
+        await act.get_current_question(tg_user_id) if question_id is None else await act.get_question(question_id)
+    )
+    assert question is not None
+    return question
 
 
 def get_why_do_not_understand() -> View:
     """
     Возвращает View с просбой написать что не понятного
     """
-    return View(get_template("31_why_do_not_understand"))
+    return get_static_view("31_why_do_not_understand")
 
 
-def get_correct_answer(tg_user_id: int) -> View:
+async def get_correct_answer(
+    tg_user_id: int, question_id: Optional[int] = None, session_id: Optional[int] = None
+) -> View:
     """
-    Возвращает View с правильным ответом
+    Возвращает View с правильным ответом на вопрос question_id (если не известен - на текущий вопрос из базы)
     """
-    with Actions() as act:
-        current_question = act.get_current_question(tg_user_id)
-        correct_answer = current_question.text_answer.strip().replace("_", "\\_")
-        question_score = act.get_question_score(current_question.id, tg_user_id)
+    async with unit_of_work() as act:
+        current_question = await _get_question(act, tg_user_id, question_id)
+        correct_answer = (current_question.text_answer or "").strip().replace("_", "\\_")
+        question_score = await act.get_question_score(current_question.id, tg_user_id, session_id)
 
     if not correct_answer:
-        answer_text = render_message(get_template("40_no_correct_answer"))
+        answer_text = render_template("40_no_correct_answer")
     else:
         if question_score:
             call_to_action = "Выберите, что делать дальше"
         else:
             call_to_action = "Оцените свой ответ"
-        answer_text = render_message(
-            get_template("41_correct_answer"), correct_answer=correct_answer, call_to_action=call_to_action
-        )
+        answer_text = render_template("41_correct_answer", correct_answer=correct_answer, call_to_action=call_to_action)
 
     if not correct_answer or question_score:
-        reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-        reply_kb.row(aiotypes.KeyboardButton("📚 Отправь материалы"), aiotypes.KeyboardButton("➡️ Следующий вопрос"))
-        state = DialogueStates.NO_ANSWER
+        return View(answer_text, MATERIALS_OR_NEXT_KEYBOARD, state=DialogueStates.NO_ANSWER)
     else:
-        reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-        reply_kb.add(aiotypes.KeyboardButton("⚖️ Частично верный"))
-        reply_kb.row(
-            aiotypes.KeyboardButton("❌ Неверный"),
-            aiotypes.KeyboardButton("✅ Верный"),
-        )
-        state = DialogueStates.GOT_ANSWER
-
-    return View(answer_text, reply_kb, state=state)
+        return View(answer_text, SELF_SCORE_KEYBOARD, state=DialogueStates.GOT_ANSWER)
 
 
 def get_do_you_want_additional_materials_view() -> View:
     """
     Возвращает View с предолжением дополнительных материалов
     """
-
-    answer_text = render_message(get_template("42_do_you_want_additional_materials"))
-
-    row_buttons = [
-        aiotypes.KeyboardButton("📚 Отправь материалы"),
-        aiotypes.KeyboardButton("➡️ Следующий вопрос"),
-    ]
-
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    reply_kb.row(*row_buttons)
-
-    return View(answer_text, reply_kb)
+    return get_static_view("42_do_you_want_additional_materials")
 
 
-def get_additional_materials_view(tg_user_id: int) -> View:
+async def get_additional_materials_view(tg_user_id: int, question_id: Optional[int] = None) -> View:
     """
-    Возвращает View с дополнительными материалами
+    Возвращает View с дополнительными материалами к вопросу question_id (если не известен - к текущему вопросу)
     """
-    with Actions() as act:
-        additional_info = act.get_current_question(tg_user_id).additional_info.strip().replace("_", "\\_")
+    async with unit_of_work() as act:
+        current_question = await _get_question(act, tg_user_id, question_id)
+
+    additional_info = (current_question.additional_info or "").strip().replace("_", "\\_")
 
     if not additional_info:
         additional_info = "К сожалению мы не подготовили материалы к этому вопросу"
     else:
         additional_info = f"Материалы для повторения...\n{additional_info}\n"
 
-    answer_text = render_message(get_template("46_additional_materials"), additional_info=additional_info)
+    answer_text = render_template("46_additional_materials", additional_info=additional_info)
 
-    row_buttons = [
-        aiotypes.KeyboardButton("➡️ Следующий вопрос"),
-    ]
-
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    reply_kb.row(*row_buttons)
-
-    return View(answer_text, reply_kb)
+    return View(answer_text, NEXT_QUESTION_KEYBOARD)
 
 
 def get_do_you_want_to_get_correct_answer() -> View:
     """
     Возвращает View с предолжением узнать эталонный ответ, или идти дальше
     """
-
-    answer_text = render_message(get_template("45_do_you_want_to_get_correct_answer"))
-
-    row_buttons = [
-        aiotypes.KeyboardButton("💡 Эталонный ответ"),
-        aiotypes.KeyboardButton("➡️ Следующий вопрос"),
-    ]
-
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    reply_kb.row(*row_buttons)
-
-    return View(answer_text, reply_kb)
+    return get_static_view("45_do_you_want_to_get_correct_answer")
 
 
-def get_user_score_view(user_id: int):
+def get_user_score_view(session_score: SessionScore):
     """
-    Возвращает view оценки пользователя
+    Возвращает view оценки пользователя по итогам сессии
     """
-
-    with Actions() as act:
-        user_scores = act.get_all_questions_scores(user_id)
-
-    # Делим на 2 потому что верный ответ это 2, частично верный 1
-    user_score = int(sum(x.score for x in user_scores) / len(user_scores) / 2 * 100)
+    user_score = session_score.percent
 
     if user_score > 84:
         user_score_description = get_template("52_result_excelent")
@@ -234,50 +238,27 @@ def get_user_score_view(user_id: int):
     else:
         user_score_description = get_template("54_result_bad")
 
-    answer_text = render_message(
-        get_template("51_user_score"), user_score=user_score, user_score_description=user_score_description
-    )
+    answer_text = render_template("51_user_score", user_score=user_score, user_score_description=user_score_description)
 
-    row_buttons = [
-        aiotypes.KeyboardButton("👍 Оценить бота"),
-        aiotypes.KeyboardButton("🏠 Главное меню"),
-    ]
-
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    reply_kb.row(*row_buttons)
-
-    return View(answer_text, reply_kb)
+    return View(answer_text, USER_SCORE_KEYBOARD)
 
 
 def get_bot_score_view():
     """
     Возвращает view оценки бота
     """
-
-    answer_text = get_template("55_bot_score")
-
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-
-    reply_kb.row(*[aiotypes.KeyboardButton(x) for x in range(1, 6)])
-    reply_kb.row(*[aiotypes.KeyboardButton(x) for x in range(6, 11)])
-
-    return View(answer_text, reply_kb)
+    return get_static_view("55_bot_score")
 
 
 def get_bot_review_view():
     """
     Возвращает view для отзыва о боте
     """
-    return View(get_template("56_bot_review"))
+    return get_static_view("56_bot_review")
 
 
 def get_finish_view():
     """
     Возвращает view последнего раздела
     """
-    answer_text = get_template("60_finish")
-
-    reply_kb = aiotypes.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
-    reply_kb.add(aiotypes.KeyboardButton("🏠 Главное меню"))
-
-    return View(answer_text, reply_kb)
+    return get_static_view("60_finish")
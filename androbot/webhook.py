@@ -0,0 +1,86 @@
+from contextvars import ContextVar
+from functools import partial
+from typing import Optional
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.dispatcher.webhook import SendMessage
+
+from .outbox import outbox
+
+# Ключ в data middleware, под которым хранится ответ на webhook
+_REPLY_KEY = "webhook_reply"
+
+
+async def send_via_api(bot: Bot, message: SendMessage) -> None:
+    """
+    Отправляем сообщение запросом к Bot API через очередь исходящих сообщений
+    """
+    await outbox.send(message.chat_id, partial(message.execute_response, bot))
+
+
+class WebhookReply:
+    """
+    Ответ на webhook запрос с update.
+    Последнее сообщение, отправленное при обработке update, не отправляется через Bot API,
+    а возвращается Telegram в HTTP ответе на webhook: так на каждый update экономится один запрос к Bot API.
+    Предыдущие сообщения отправляются через Bot API сразу, поэтому порядок сообщений сохраняется
+    """
+
+    __slots__ = ("message", "failed")
+
+    def __init__(self) -> None:
+        self.message: Optional[SendMessage] = None
+        self.failed = False
+
+    async def send(self, bot: Bot, message: SendMessage) -> None:
+        previous_message, self.message = self.message, message
+        if previous_message is not None:
+            await send_via_api(bot, previous_message)
+
+    def pop(self) -> Optional[SendMessage]:
+        message, self.message = self.message, None
+        return message
+
+
+# Ответ на webhook для update, который обрабатывается в текущей задаче (None - ответ в webhook не отправляется)
+webhook_reply: ContextVar[Optional[WebhookReply]] = ContextVar("webhook_reply", default=None)
+
+
+class WebhookReplyMiddleware(BaseMiddleware):
+    """
+    Последнее сообщение, отправленное при обработке update, возвращаем в ответе на webhook.
+    Подключается после UnitOfWorkMiddleware: тот отправляет ответы обработчика после commit в своем
+    on_post_process_update, и к этому моменту ответ на webhook должен быть еще не собран.
+    Если update упал, сообщение отправляется через Bot API: ответ на упавший webhook Telegram не обработает.
+    aiogram сам отправит его через Bot API, если обработчик не успеет ответить за время ожидания webhook
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict) -> None:
+        reply = WebhookReply()
+        data[_REPLY_KEY] = reply, webhook_reply.set(reply)
+
+    async def on_pre_process_error(self, update: types.Update, exception: BaseException, data: dict) -> None:
+        reply = webhook_reply.get()
+        if reply is not None:
+            reply.failed = True
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict) -> None:
+        if _REPLY_KEY not in data:
+            return
+        reply, token = data.pop(_REPLY_KEY)
+        webhook_reply.reset(token)
+        message = reply.pop()
+        if message is None:
+            return
+        if reply.failed:
+            await send_via_api(self.manager.bot, message)
+        else:
+            results.append([message])
+
+
+def reply_in_webhook(dispatcher: Dispatcher) -> None:
+    """
+    Включаем в dispatcher ответ на webhook последним сообщением обработчика
+    """
+    dispatcher.middleware.setup(WebhookReplyMiddleware())
@@ -0,0 +1,213 @@
+import asyncio
+import multiprocessing
+import signal
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Any, Dict, List, Optional, Set
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+from loguru import logger
+
+from .config import settings
+from .main import dp, on_shutdown, on_startup
+from .metrics import metrics_server
+from .migrate import upgrade_database
+from .outbox import outbox
+
+UpdateData = Dict[str, Any]
+
+# Виды update, в которых есть чат: сообщения и посты в каналах
+_CHAT_UPDATES = ("message", "edited_message", "channel_post", "edited_channel_post")
+
+# Сколько секунд ждать, пока воркер обработает оставшиеся update при остановке
+_WORKER_STOP_TIMEOUT = 30.0
+
+
+def get_update_chat_id(update: UpdateData) -> int:
+    """
+    Id чата, к которому относится update. Для update без чата (inline запросы и т.п.) - id пользователя
+    """
+    for update_type in _CHAT_UPDATES:
+        if update.get(update_type):
+            return update[update_type]["chat"]["id"]
+
+    callback_query = update.get("callback_query")
+    if callback_query and callback_query.get("message"):
+        return callback_query["message"]["chat"]["id"]
+
+    for value in update.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"]["id"]
+    return 0
+
+
+def get_worker_index(update: UpdateData, workers: int) -> int:
+    """
+    Номер воркера для update: все update одного чата обрабатывает один и тот же воркер
+    """
+    return get_update_chat_id(update) % workers
+
+
+def run_worker(index: int, workers: int, updates: Queue) -> None:
+    """
+    Точка входа процесса воркера
+    """
+    # Останавливает воркеры супервизор, Ctrl+C в терминале их не касается
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_updates(index, workers, updates, dp))
+
+
+async def serve_updates(index: int, workers: int, updates: Queue, dispatcher: Dispatcher) -> None:
+    """
+    Обрабатываем update из очереди воркера, пока не придет None.
+    Update разных чатов обрабатываются параллельно, одного чата - по очереди (см. update_scheduler)
+    """
+    Bot.set_current(dispatcher.bot)
+    Dispatcher.set_current(dispatcher)
+
+    # Общий лимит Telegram на отправку сообщений делим между воркерами
+    outbox.rate = settings.outbox_rate / workers
+    outbox.burst = max(1, settings.outbox_burst // workers)
+    # Каждый воркер отдает свои метрики на своем порту: METRICS_PORT + номер воркера
+    if settings.metrics_port:
+        metrics_server.port = settings.metrics_port + index
+
+    await on_startup(dispatcher)
+    logger.info("Worker {} started", index)
+    loop = asyncio.get_running_loop()
+    processing: Set[asyncio.Task] = set()
+    try:
+        while True:
+            update_data = await loop.run_in_executor(None, updates.get)
+            if update_data is None:
+                break
+            task = asyncio.create_task(process_update(index, dispatcher, update_data))
+            processing.add(task)
+            task.add_done_callback(processing.discard)
+        await asyncio.gather(*processing)
+    finally:
+        await on_shutdown(dispatcher)
+        await (await dispatcher.bot.get_session()).close()
+        logger.info("Worker {} stopped", index)
+
+
+async def process_update(index: int, dispatcher: Dispatcher, update_data: UpdateData) -> None:
+    try:
+        await dispatcher.updates_handler.notify(types.Update(**update_data))
+    except Exception as e:
+        logger.exception("Worker {} failed to process update {}: {}", index, update_data.get("update_id"), e)
+
+
+class Supervisor:
+    """
+    Запускает workers процессов бота и распределяет между ними update по id чата.
+    Update одного чата всегда попадают в один воркер и обрабатываются по порядку.
+    Воркеры хранят состояние диалогов в общем Redis (REDIS_HOST), а соединения с базой создают
+    по тем же настройкам из config.Settings. Упавший воркер перезапускается с той же очередью
+    """
+
+    def __init__(self, workers: int = settings.workers) -> None:
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: List[Queue] = []
+        self._processes: List[Optional[BaseProcess]] = []
+
+    def start(self) -> None:
+        if not settings.fsm_redis_host:
+            logger.warning("REDIS_HOST is not set, every worker will keep dialogue states in its own memory")
+        # Миграции применяет только supervisor и до запуска воркеров: сами воркеры схему не обновляют
+        upgrade_database()
+        self._queues = [self._context.Queue() for _ in range(self.workers)]
+        self._processes = [None] * self.workers
+        for index in range(self.workers):
+            self._start_worker(index)
+
+    def _start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker, args=(index, self.workers, self._queues[index]), name=f"androbot-worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+
+    def check_workers(self) -> None:
+        """
+        Перезапускаем воркеры, процесс которых завершился
+        """
+        for index, process in enumerate(self._processes):
+            if process is not None and not process.is_alive():
+                logger.error("Worker {} exited with code {}, restarting", index, process.exitcode)
+                self._start_worker(index)
+
+    def route(self, update: UpdateData) -> None:
+        self._queues[get_worker_index(update, self.workers)].put(update)
+
+    def stop(self) -> None:
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(_WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+
+    async def poll(self, bot: Bot, timeout: int = 20) -> None:
+        """
+        Получаем update через long polling и раздаем их воркерам
+        """
+        await bot.delete_webhook(drop_pending_updates=True)
+        offset = None
+        try:
+            while True:
+                self.check_workers()
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=timeout)
+                except Exception as e:
+                    logger.error("Can't get updates: {}", repr(e))
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    self.route(update.to_python())
+                    offset = update.update_id + 1
+        finally:
+            await (await bot.get_session()).close()
+
+    async def serve_webhook(self, bot: Bot) -> None:
+        """
+        Принимаем update от Telegram по webhook и раздаем их воркерам
+        """
+
+        async def handle_update(request: web.Request) -> web.Response:
+            self.check_workers()
+            self.route(await request.json())
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(settings.webhook_path, handle_update)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, settings.webapp_host, settings.webapp_port).start()
+            await bot.set_webhook(
+                f"{settings.webhook_host}{settings.webhook_path}", max_connections=settings.webhook_max_connections
+            )
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            await (await bot.get_session()).close()
+
+
+def run_supervisor(bot: Bot, workers: int = settings.workers) -> None:
+    """
+    Запускает бота в workers процессах: через webhook, если задан WEBHOOK_HOST, иначе через long polling
+    """
+    supervisor = Supervisor(workers)
+    supervisor.start()
+    logger.info("Started {} workers", workers)
+    try:
+        asyncio.run(supervisor.serve_webhook(bot) if settings.webhook_host else supervisor.poll(bot))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()